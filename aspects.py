@@ -0,0 +1,163 @@
+# aspects.py
+"""
+Расчет аспектов между точками карты.
+
+Матрица угловых расстояний всех пар точек считается одной операцией NumPy
+(с учетом перехода 360°/0°) и сравнивается сразу со всеми аспектами и
+орбами. Та же операция работает для пакета карт (массив долгот формы
+(карты, точки)) и для перекрестных аспектов двух наборов точек - транзитов
+к натальной карте или синастрии.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from chart_result import PLANET_NAMES
+from config import Config
+
+# Аспекты в порядке ASPECTS_DESC: ключ и точный угол
+ASPECT_KEYS = ('Conj', 'Sext', 'Squa', 'Trine', 'Oppo')
+ASPECT_ANGLES = np.array([0.0, 60.0, 90.0, 120.0, 180.0])
+ASPECT_SYMBOLS = {'Conj': '☌', 'Sext': '⚹', 'Squa': '□', 'Trine': '△', 'Oppo': '☍'}
+
+# Ключи всех точек ChartResult.longitudes (ASC и MC - как в TRANSLATE)
+POINT_KEYS = PLANET_NAMES + ('Asc', 'Mc')
+
+# Пары, аспект между которыми задан построением и ничего не говорит
+FIXED_PAIRS = {('Lilith', 'Selena'), ('Asc', 'Mc')}
+
+
+class Aspect(NamedTuple):
+    """Аспект между двумя точками"""
+    first: str          # ключ первой точки
+    second: str         # ключ второй точки
+    aspect: str         # ключ аспекта (Conj, Sext, ...)
+    angle: float        # фактическое угловое расстояние
+    orb: float          # отклонение от точного аспекта
+
+
+class AspectMatches(NamedTuple):
+    """Найденные аспекты пакета в колоночном виде"""
+    chart: np.ndarray   # номер карты в пакете
+    first: np.ndarray   # индекс первой точки
+    second: np.ndarray  # индекс второй точки
+    aspect: np.ndarray  # индекс аспекта в ASPECT_KEYS
+    angle: np.ndarray   # угловое расстояние
+    orb: np.ndarray     # отклонение от точного аспекта
+
+
+def separation(a, b):
+    """Угловое расстояние 0..180 с учетом перехода через 0°"""
+    return np.abs((np.asarray(a) - np.asarray(b) + 180.0) % 360.0 - 180.0)
+
+
+def orb_table(points=POINT_KEYS, orbs=None, factors=None, overrides=None):
+    """Орбы (точки, аспекты) из настроек"""
+    orbs = Config.ASPECT_ORBS if orbs is None else orbs
+    factors = Config.ASPECT_POINT_FACTORS if factors is None else factors
+    overrides = Config.ASPECT_ORB_OVERRIDES if overrides is None else overrides
+
+    table = np.empty((len(points), len(ASPECT_KEYS)))
+    for i, point in enumerate(points):
+        personal = overrides.get(point, {})
+        for j, aspect in enumerate(ASPECT_KEYS):
+            table[i, j] = personal.get(aspect, orbs[aspect] * factors.get(point, 1.0))
+    return table
+
+
+class AspectEngine:
+    """Поиск аспектов по матрице расстояний с заранее собранными орбами пар"""
+
+    def __init__(self, points=POINT_KEYS, other_points=None, orbs=None,
+                 factors=None, overrides=None):
+        self.points = tuple(points)
+        self.other_points = tuple(other_points) if other_points is not None else self.points
+        self.cross = other_points is not None
+
+        first = orb_table(self.points, orbs, factors, overrides)
+        second = orb_table(self.other_points, orbs, factors, overrides)
+        # Орб пары для каждого аспекта: (точки, точки, аспекты)
+        self.pair_orbs = np.maximum(first[:, None, :], second[None, :, :])
+
+        # Какие пары проверять: для одной карты - только над диагональю и
+        # без пар, аспект которых задан построением (между картами - все пары)
+        mask = np.ones((len(self.points), len(self.other_points)), dtype=bool)
+        if not self.cross:
+            mask = np.triu(mask, k=1)
+            for i, a in enumerate(self.points):
+                for j, b in enumerate(self.other_points):
+                    if (a, b) in FIXED_PAIRS or (b, a) in FIXED_PAIRS:
+                        mask[i, j] = False
+        self.pair_mask = mask
+
+    def separations(self, longitudes, other=None):
+        """Матрица угловых расстояний (..., точки, точки)"""
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        other = longitudes if other is None else np.asarray(other, dtype=np.float64)
+        return separation(longitudes[..., :, None], other[..., None, :])
+
+    def match(self, longitudes, other=None):
+        """Все аспекты пакета карт в колоночном виде
+
+        longitudes: (точки,) или (карты, точки); other - вторая сторона
+        для перекрестных аспектов (та же форма или одна карта на всех).
+        """
+        if self.cross and other is None:
+            raise ValueError("Для перекрестных аспектов нужна вторая карта")
+        dist = self.separations(longitudes, other)
+        if dist.ndim == 2:
+            dist = dist[None]
+
+        deviation = np.abs(dist[..., None] - ASPECT_ANGLES)
+        hits = (deviation <= self.pair_orbs) & self.pair_mask[..., None]
+        chart, first, second, aspect = np.nonzero(hits)
+        return AspectMatches(
+            chart, first, second, aspect,
+            dist[chart, first, second],
+            deviation[chart, first, second, aspect],
+        )
+
+    def _to_lists(self, matches, n_charts):
+        """Колоночный результат -> списки Aspect по картам, по возрастанию орба"""
+        order = np.lexsort((matches.orb, matches.chart))
+        result = [[] for _ in range(n_charts)]
+        for k in order:
+            result[matches.chart[k]].append(Aspect(
+                self.points[matches.first[k]],
+                self.other_points[matches.second[k]],
+                ASPECT_KEYS[matches.aspect[k]],
+                float(matches.angle[k]),
+                float(matches.orb[k]),
+            ))
+        return result
+
+    def find(self, longitudes, other=None):
+        """Аспекты одной карты (или между двумя картами), самые точные первыми"""
+        return self._to_lists(self.match(longitudes, other), 1)[0]
+
+    def find_many(self, longitudes, other=None):
+        """Аспекты для каждой карты пакета"""
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        n_charts = len(longitudes) if longitudes.ndim == 2 else len(other)
+        return self._to_lists(self.match(longitudes, other), n_charts)
+
+
+_engine = None
+
+
+def get_aspect_engine():
+    """Общий движок аспектов для точек ChartResult"""
+    global _engine
+    if _engine is None:
+        _engine = AspectEngine()
+    return _engine
+
+
+def chart_aspects(chart):
+    """Аспекты карты ChartResult, самые точные первыми (без точек-заглушек)"""
+    aspects = get_aspect_engine().find(chart.longitudes)
+    if not chart.stubs:
+        return aspects
+    stubs = {key for i, key in enumerate(POINT_KEYS) if chart.is_stub(i)}
+    return [a for a in aspects if a.first not in stubs and a.second not in stubs]
@@ -1,11 +1,11 @@
 import os
 import re
+import asyncio
 import logging
-import time
-import math
+import io
+import sys
 import telegram.error
-from datetime import datetime
-from functools import lru_cache
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
 # Библиотеки Telegram
@@ -20,17 +20,37 @@ from telegram.ext import (
 )
 from telegram.constants import ParseMode
 
-# Астрология и География
-from geopy.geocoders import Nominatim
-from timezonefinder import TimezoneFinder
-
 # Наши модули
 
 from astro_com_reference import compare_with_astro_com, format_comparison_report
-from correct_astrology_calc import calculate_correct_positions, get_planet_emoji
+from correct_astrology_calc import get_planet_emoji
+from calc_service import CalculationService
+from chart_cache import ChartCache
+from geocoding import AsyncGeocoder
+from geocode_cache import GeocodeCache
+from gazetteer import Gazetteer
+import timezone_lookup
+from timezone_lookup import get_timezone
+from time_conversion import local_to_ut, ut_to_local, format_offset
+from subscriptions import SubscriptionStore
+from digest import DailySky, today_utc
+from synastry import compare, format_synastry_report
+from outbound import OutboundSender
+from webhook import ALLOWED_UPDATES, ChatOrderedUpdateProcessor, serve_webhook
+from persistence import create_persistence
+from sharding import run_router
+from returns import solar_return, lunar_return, lunar_returns, format_return_report, natal_datetime
+from lunar_calendar import get_calendar, write_ical, phase_from_longitudes, PHASE_NAMES, PHASE_EMOJIS
+from events import datetime_to_jd, jd_to_datetime
+from config import Config
 
 # Импорт данных из нашего внешнего файла
-from data import TRANSLATE, PLANET_DESC, SIGNS_FULL, HOUSES_FULL, SIGN_PREPOSITIONS
+from chart_result import SIGNS, Point, PLANET_NAMES
+from chart_svg import TEMPLATE_VERSION, chart_document
+from report_templates import render_compact_report
+from file_id_cache import FileIdCache, content_digest
+from sign_format import SIGNS_RU, SIGNS_RU_IN, SIGNS_SHORT, sign_key_index, format_positions
+from data import TRANSLATE, PLANET_DESC, SIGNS_FULL, HOUSES_FULL, SIGN_PREPOSITIONS, POINT_EMOJIS
 
 
 
@@ -43,19 +63,32 @@ def is_running_in_docker():
 load_dotenv()
 TOKEN = os.getenv("BOT_TOKEN")
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 # Состояния диалога
 NAME, DATE, TIME, CITY = range(4)
+SYN_FIRST, SYN_SECOND = range(4, 6)
+
+# Пул процессов для расчетов Swiss Ephemeris (кэш карт открывается в on_startup)
+calc_service = CalculationService()
+
+# Общий асинхронный геокодер (кэш и офлайн-индекс открываются в on_startup)
+geocoder = AsyncGeocoder()
+
+# Подписчики ежедневной рассылки транзитов (база открывается в on_startup)
+subscriptions = None
+
+# file_id уже отправленных карт: одинаковая карта не загружается повторно
+# (база открывается в on_startup)
+file_ids = None
+
+# Шардов, между которыми делятся лимиты и рассылка (1 - процесс не шард:
+# без маршрутизатора SHARDS ничего не делит)
+active_shards = Config.SHARDS if Config.SHARD_INDEX is not None else 1
+
+# Все исходящие сообщения - через очередь с лимитами Telegram
+# Общий лимит Telegram на бота делится между шардами
+sender = OutboundSender(global_rate=Config.OUTBOUND_GLOBAL_RATE / active_shards)
 
 # --- ВАЛИДАЦИЯ ДАННЫХ ---
 
@@ -78,28 +111,18 @@ def validate_time(time_text):
         return True, ""
     return False, "Неверный формат времени. Используйте ЧЧ:ММ (например, 14:30)"
 
-# --- ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ---
-
-@lru_cache(maxsize=100)
-def get_cached_location(city_name):
-    """Кэширует результаты геокодирования для ускорения"""
-    geolocator = Nominatim(user_agent="natal_bot_2026")
-    try:
-        location = geolocator.geocode(city_name, addressdetails=True, language="ru", timeout=10)
-        return location
-    except Exception as e:
-        logger.error(f"Ошибка геокодирования для {city_name}: {e}")
-        return None
+def parse_birth_record(text):
+    """Разбирает строку "Имя, ГГГГ-ММ-ДД, ЧЧ:ММ, Город" -> (запись, ошибка)"""
+    parts = [part.strip() for part in text.split(',', 3)]
+    if len(parts) < 4 or not all(parts):
+        return None, "Нужно 4 поля через запятую: Имя, ГГГГ-ММ-ДД, ЧЧ:ММ, Город"
+    name, date_text, time_text, city = parts
+    for is_valid, error in (validate_date(date_text), validate_time(time_text)):
+        if not is_valid:
+            return None, error
+    return (name[:50], date_text, time_text, city), ""
 
-def get_timezone(lat, lng):
-    """Автоматически находит часовой пояс по координатам"""
-    try:
-        tf = TimezoneFinder()
-        tz = tf.timezone_at(lng=lng, lat=lat)
-        return tz or "UTC"
-    except Exception as e:
-        logger.error(f"Ошибка определения часового пояса: {e}")
-        return "UTC"
+# --- ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ---
 
 def clean_trans(text):
     """Преобразует системные названия и переводит их"""
@@ -127,16 +150,9 @@ def clean_trans(text):
         return house_mapping.get(house_base, house_base)
     
     # 3. Для знаков зодиака (короткие формы)
-    sign_mapping = {
-        "Ari": "Aries", "Tau": "Taurus", "Gem": "Gemini",
-        "Can": "Cancer", "Leo": "Leo", "Vir": "Virgo",
-        "Lib": "Libra", "Sco": "Scorpio", "Sag": "Sagittarius",
-        "Cap": "Capricorn", "Aqu": "Aquarius", "Pis": "Pisces"
-    }
-    
-    if text_str in sign_mapping:
-        full_sign = sign_mapping[text_str]
-        return TRANSLATE.get(full_sign, text_str)
+    idx = sign_key_index(text_str)
+    if idx is not None:
+        return SIGNS_RU[idx]
     
     return text_str
 
@@ -144,7 +160,7 @@ async def details_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Отправляет подробные описания планет"""
         # Здесь можно сохранять последний расчет пользователя
         # и по команде /details показывать подробности
-        await update.message.reply_text(
+        await reply(update, 
             "📋 <b>Подробные описания планет:</b>\n\n"
             "Используйте формат:\n"
             "<code>/planet Солнце</code> - описание Солнца\n"
@@ -159,13 +175,13 @@ async def details_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 def get_planet_in_sign_text(planet_name, sign_name):
     """Возвращает правильное склонение: Солнце в Овне, Луна в Раке и т.д."""
     
-    # Получаем русское название знака
-    ru_sign = clean_trans(sign_name)
-    
-    # Получаем правильный предлог из data.py
-    preposition = SIGN_PREPOSITIONS.get(ru_sign, f"в {ru_sign}")
+    # Предлог и падеж из таблицы знаков (SIGN_PREPOSITIONS)
+    idx = sign_key_index(sign_name)
+    if idx is not None:
+        return f"{planet_name} {SIGNS_RU_IN[idx]}"
     
-    return f"{planet_name} {preposition}"
+    ru_sign = clean_trans(sign_name)
+    return f"{planet_name} {SIGN_PREPOSITIONS.get(ru_sign, f'в {ru_sign}')}"
 
 def get_sign_description(planet_key, sign_key):
     """Получает описание знака для конкретной планеты"""
@@ -176,16 +192,9 @@ def get_sign_description(planet_key, sign_key):
     ]
     
     # Также пробуем английские названия
-    sign_mapping = {
-        "Ari": "Aries", "Tau": "Taurus", "Gem": "Gemini",
-        "Can": "Cancer", "Leo": "Leo", "Vir": "Virgo",
-        "Lib": "Libra", "Sco": "Scorpio", "Sag": "Sagittarius",
-        "Cap": "Capricorn", "Aqu": "Aquarius", "Pis": "Pisces"
-    }
-    
-    if sign_key in sign_mapping:
-        full_sign = sign_mapping[sign_key]
-        possible_keys.append(f"{planet_key}_{full_sign}")
+    idx = sign_key_index(sign_key)
+    if idx is not None:
+        possible_keys.append(f"{planet_key}_{SIGNS[idx]}")
     
     # Ищем описание
     for key in possible_keys:
@@ -219,126 +228,40 @@ def get_house_description(house_obj):
 
 def format_compact_report(astro_data, ud, lat, lng, address):
     """Формирует компактный отчет в 3 сообщения"""
-    
-    reports = []
-    
-    # --- СООБЩЕНИЕ 1: ЗАГОЛОВОК И КЛЮЧЕВЫЕ ПЛАНЕТЫ ---
-    report1 = []
-    report1.append(f"📜 <b>ПРОФЕССИОНАЛЬНЫЙ НАТАЛЬНЫЙ АНАЛИЗ: {ud['name'].upper()}</b>")
-    report1.append(f"📍 <i>{address[:100]}...</i>")
-    report1.append(f"📅 <b>Дата:</b> {ud['date']} | <b>Время:</b> {ud['time']}")
-    report1.append(f"🌐 <b>Координаты:</b> {lat:.4f}° N, {lng:.4f}° E")
-    report1.append(f"⚡ <b>Система:</b> Swiss Ephemeris + Плацидус")
-    report1.append("═" * 50)
-    
-    # Ключевые точки
-    key_points = [
-        ("Sun", "☀️ Солнце", "Ядро личности"),
-        ("Moon", "🌙 Луна", "Эмоции и подсознание"),
-        ("Ascendant", "🌅 Асцендент", "Личность и внешний образ"),
-        ("MC", "👑 Зенит (MC)", "Карьера и статус"),
-        ("Lilith", "🌑 Лилит", "Теневая сторона"),
-        ("Selena", "⚪ Селена", "Светлый путь")
-    ]
-    
-    report1.append("\n<b>КЛЮЧЕВЫЕ ТОЧКИ:</b>")
-    for point_key, emoji_name, description in key_points:
-        if point_key in ['Ascendant', 'MC']:
-            data = astro_data.get(point_key.lower(), {})
-        else:
-            data = astro_data.get('planets', {}).get(point_key, {})
-        
-        if data:
-            sign = data.get('sign', '?')
-            degree = int(data.get('longitude', 0) % 30)
-            report1.append(f"{emoji_name}: <b>{sign} {degree}°</b> - {description}")
-    
-    reports.append('\n'.join(report1))
-    
-    # --- СООБЩЕНИЕ 2: ВСЕ ПЛАНЕТЫ КОМПАКТНО ---
-    report2 = []
-    report2.append("✨ <b>ВСЕ ПЛАНЕТЫ И ТОЧКИ:</b>")
-    report2.append("═" * 50)
-    
-    # Группировка планет по строкам (по 3 в строке)
-    planets_groups = [
-        [("Sun", "☀️"), ("Moon", "🌙"), ("Mercury", "☿")],
-        [("Venus", "♀"), ("Mars", "♂"), ("Jupiter", "♃")],
-        [("Saturn", "♄"), ("Uranus", "♅"), ("Neptune", "♆")],
-        [("Pluto", "♇"), ("Chiron", "⚕️"), ("Node", "☊")],
-        [("Lilith", "🌑"), ("Selena", "⚪"), ("", "")]  # Последняя группа
-    ]
-    
-    for group in planets_groups:
-        line_parts = []
-        for planet_key, emoji in group:
-            if planet_key:  # Пропускаем пустые
-                data = astro_data.get('planets', {}).get(planet_key, {})
-                if data:
-                    sign_short = get_sign_short_name(data.get('sign', '?'))
-                    degree = int(data.get('longitude', 0) % 30)
-                    line_parts.append(f"{emoji} {sign_short} {degree}°")
-        
-        if line_parts:
-            report2.append("  |  ".join(line_parts))
-    
-    reports.append('\n'.join(report2))
-    
-    # --- СООБЩЕНИЕ 3: ПРОВЕРКА И ССЫЛКА ---
-    report3 = []
-    report3.append("🔍 <b>ПРОВЕРКА ТОЧНОСТИ:</b>")
-    
-    # Парсим дату для ссылки
-    y, m, d = map(int, ud['date'].split('-'))
-    hh, mm = map(int, ud['time'].split(':'))
-    
-    # Создаем компактную ссылку (основные параметры)
-    astro_link = f"https://www.astro.com/cgi/chart.cgi?lang=e&btyp=w2gw&sday={d}&smon={m}&syr={y}&shour={hh}&smin={mm}&nhor=1"
-    
-    report3.append(f"📊 <b>Сравните с astro.com:</b>")
-    report3.append(f"• Дата: {d:02d}.{m:02d}.{y} {hh:02d}:{mm:02d}")
-    report3.append(f"• Координаты: {lat:.4f}°N, {lng:.4f}°E")
-    report3.append(f"• Система домов: Placidus")
-    
-    report3.append(f"\n🔗 <a href='{astro_link}'>Нажмите для создания карты на astro.com</a>")
-    
-    report3.append("\n" + "═" * 50)
-    report3.append("✅ <b>РАСЧЕТ ЗАВЕРШЕН!</b>")
-    report3.append("<i>Для подробного описания каждой планеты используйте команду /details</i>")
-    
-    reports.append('\n'.join(report3))
-    
-    return reports
+    return render_compact_report(astro_data, ud['name'], ud['date'], ud['time'],
+                                 lat, lng, address, birth_moon_phase(astro_data))
+
+
+def birth_moon_phase(chart):
+    """Фаза Луны при рождении: по лунному календарю (с курсом Луны) или по долготам карты"""
+    calendar = get_calendar()
+    jd = datetime_to_jd(natal_datetime(chart))
+    found = calendar.phase_at(jd) if calendar is not None else None
+    if found is not None:
+        phase = found[0]
+        void = " - <i>Луна без курса</i>" if calendar.void_at(jd) else ""
+    else:
+        phase = phase_from_longitudes(chart.longitude(Point.SUN), chart.longitude(Point.MOON))
+        void = ""
+    return f"{PHASE_EMOJIS[phase]} <b>Фаза Луны:</b> {PHASE_NAMES[phase]}{void}"
 
 
 def get_sign_short_name(sign_full):
     """Возвращает короткое название знака (русское)"""
-    sign_mapping = {
-        "Aries": "Овен", "Taurus": "Телец", "Gemini": "Близн",
-        "Cancer": "Рак", "Leo": "Лев", "Virgo": "Дева",
-        "Libra": "Весы", "Scorpio": "Скорп", "Sagittarius": "Стрел",
-        "Capricorn": "Козер", "Aquarius": "Водол", "Pisces": "Рыбы"
-    }
-    return sign_mapping.get(sign_full, sign_full[:4])
-
-def escape_xml(text):
-    """Экранирует специальные XML символы"""
-    if text is None:
-        return ""
-    text_str = str(text)
-    text_str = text_str.replace("&", "&amp;")
-    text_str = text_str.replace("<", "&lt;")
-    text_str = text_str.replace(">", "&gt;")
-    text_str = text_str.replace('"', "&quot;")
-    text_str = text_str.replace("'", "&apos;")
-    return text_str
+    idx = sign_key_index(sign_full)
+    return SIGNS_SHORT[idx] if idx is not None else sign_full[:4]
+
+async def reply(update: Update, text: str, **kwargs):
+    """Ответ в чат через очередь отправки: доставка не ждется, future - для тех, кому нужен результат"""
+    return sender.send_message(update.effective_chat.id, text, **kwargs)
+
 
 async def send_long_message(update: Update, text: str, parse_mode=ParseMode.HTML):
     """Отправляет длинные сообщения, объединяя абзацы"""
     max_length = 4000  # Оставляем запас
     
     if len(text) <= max_length:
-        await update.message.reply_text(text, parse_mode=parse_mode)
+        await reply(update, text, parse_mode=parse_mode)
         return
     
     # Разбиваем по двойным переносам строк (абзацы)
@@ -355,7 +278,7 @@ async def send_long_message(update: Update, text: str, parse_mode=ParseMode.HTML
         if para_length > max_length:
             # Если есть что отправить перед этим
             if current_message:
-                await update.message.reply_text('\n\n'.join(current_message), parse_mode=parse_mode)
+                await reply(update, '\n\n'.join(current_message), parse_mode=parse_mode)
                 current_message = []
                 current_length = 0
             
@@ -367,7 +290,7 @@ async def send_long_message(update: Update, text: str, parse_mode=ParseMode.HTML
             for line in lines:
                 line_with_newline = line + '\n'
                 if chunk_length + len(line_with_newline) > max_length and chunk:
-                    await update.message.reply_text('\n'.join(chunk), parse_mode=parse_mode)
+                    await reply(update, '\n'.join(chunk), parse_mode=parse_mode)
                     chunk = [line]
                     chunk_length = len(line_with_newline)
                 else:
@@ -375,7 +298,7 @@ async def send_long_message(update: Update, text: str, parse_mode=ParseMode.HTML
                     chunk_length += len(line_with_newline)
             
             if chunk:
-                await update.message.reply_text('\n'.join(chunk), parse_mode=parse_mode)
+                await reply(update, '\n'.join(chunk), parse_mode=parse_mode)
         
         # Если абзац помещается в текущее сообщение
         elif current_length + para_length <= max_length:
@@ -385,112 +308,14 @@ async def send_long_message(update: Update, text: str, parse_mode=ParseMode.HTML
         # Если не помещается - отправляем текущее и начинаем новое
         else:
             if current_message:
-                await update.message.reply_text('\n\n'.join(current_message), parse_mode=parse_mode)
+                await reply(update, '\n\n'.join(current_message), parse_mode=parse_mode)
             
             current_message = [para]
             current_length = para_length
     
     # Отправляем последнее сообщение
     if current_message:
-        await update.message.reply_text('\n\n'.join(current_message), parse_mode=parse_mode)
-
-def get_all_astrological_points(subject):
-    """Получает все астрологические точки включая Селену и Лилит"""
-    all_points = []
-    
-    # Основные планеты
-    planets = [
-        ("Sun", subject.sun, "☀️"),
-        ("Moon", subject.moon, "🌙"),
-        ("Mercury", subject.mercury, "☿"),
-        ("Venus", subject.venus, "♀"),
-        ("Mars", subject.mars, "♂"),
-        ("Jupiter", subject.jupiter, "♃"),
-        ("Saturn", subject.saturn, "♄"),
-        ("Uranus", subject.uranus, "♅"),
-        ("Neptune", subject.neptune, "♆"),
-        ("Pluto", subject.pluto, "♇"),
-    ]
-    
-    for planet_key, planet_obj, emoji in planets:
-        if planet_obj:
-            # Получаем позицию
-            position = 0
-            if hasattr(planet_obj, 'position'):
-                position = planet_obj.position
-            elif hasattr(planet_obj, 'longitude'):
-                position = planet_obj.longitude
-            elif hasattr(planet_obj, 'absolute_position'):
-                position = planet_obj.absolute_position
-            
-            all_points.append({
-                'key': planet_key,
-                'obj': planet_obj,
-                'position': float(position) % 360,
-                'emoji': emoji
-            })
-    
-    # Лилит
-    for attr_name in ['lilith', 'black_moon', 'mean_lilith']:
-        if hasattr(subject, attr_name):
-            point = getattr(subject, attr_name)
-            if point:
-                position = getattr(point, 'position', getattr(point, 'longitude', 0))
-                all_points.append({
-                    'key': 'Lilith',
-                    'obj': point,
-                    'position': float(position) % 360,
-                    'emoji': '🌑'
-                })
-                break
-    
-    # Хирон
-    if hasattr(subject, 'chiron') and subject.chiron:
-        chiron = subject.chiron
-        position = getattr(chiron, 'position', getattr(chiron, 'longitude', 0))
-        all_points.append({
-            'key': 'Chiron',
-            'obj': chiron,
-            'position': float(position) % 360,
-            'emoji': '⚕️'
-        })
-    
-    # Узлы
-    if hasattr(subject, 'mean_node') and subject.mean_node:
-        node = subject.mean_node
-        position = getattr(node, 'position', getattr(node, 'longitude', 0))
-        all_points.append({
-            'key': 'Node',
-            'obj': node,
-            'position': float(position) % 360,
-            'emoji': '☊'
-        })
-    
-    # Селена (противоположность Лилит)
-    lilith_points = [p for p in all_points if p['key'] == 'Lilith']
-    if lilith_points:
-        lilith_pos = lilith_points[0]['position']
-        selena_pos = (lilith_pos + 180) % 360
-        
-        class SelenaPoint:
-            def __init__(self, position):
-                self.position = position
-                self.sign = self._calc_sign(position)
-                self.house = type('obj', (), {'name': 'Unknown'})()
-            
-            def _calc_sign(self, pos):
-                signs = ['Aries', 'Taurus', 'Gemini', 'Cancer', 'Leo', 'Virgo',
-                        'Libra', 'Scorpio', 'Sagittarius', 'Capricorn', 'Aquarius', 'Pisces']
-                return signs[int(pos // 30) % 12]
-        
-        all_points.append({
-            'key': 'Selena',
-            'obj': SelenaPoint(selena_pos),
-            'position': selena_pos,
-            'emoji': '⚪'
-        })
-    
-    return all_points
+        await reply(update, '\n\n'.join(current_message), parse_mode=parse_mode)
 
 # --- ОСНОВНЫЕ ФУНКЦИИ БОТА ---
 
@@ -517,7 +342,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 <b>Как тебя зовут?</b>"""
     
-    await update.message.reply_text(welcome_text, parse_mode=ParseMode.HTML)
+    await reply(update, welcome_text, parse_mode=ParseMode.HTML)
     return NAME
 
 
@@ -526,20 +351,20 @@ async def get_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     name = update.message.text.strip()
     
     if len(name) < 2:
-        await update.message.reply_text(
+        await reply(update, 
             "Имя должно содержать минимум 2 символа. Пожалуйста, введите имя:"
         )
         return NAME
     
     if len(name) > 50:
-        await update.message.reply_text(
+        await reply(update, 
             "Имя слишком длинное. Пожалуйста, введите имя до 50 символов:"
         )
         return NAME
     
     context.user_data['name'] = name
     
-    await update.message.reply_text(
+    await reply(update, 
         f"Отлично, {name}! ✨\n\n"
         "Теперь укажи <b>дату рождения</b> в формате <b>ГГГГ-ММ-ДД</b>\n"
         "<i>Пример: 1990-12-31</i>\n\n"
@@ -560,7 +385,7 @@ async def get_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     is_valid, error_msg = validate_date(date_text)
     
     if not is_valid:
-        await update.message.reply_text(
+        await reply(update, 
             f"❌ {error_msg}\n\n"
             "Попробуй еще раз в формате <b>ГГГГ-ММ-ДД</b>:\n"
             "<i>Пример: 1990-12-31</i>",
@@ -570,7 +395,7 @@ async def get_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     context.user_data['date'] = date_text
     
-    await update.message.reply_text(
+    await reply(update, 
         "Прекрасно! 🗓️\n\n"
         "Теперь введи <b>точное время рождения</b> в формате <b>ЧЧ:ММ</b>\n"
         "<i>Пример: 14:30</i>\n\n"
@@ -590,7 +415,7 @@ async def get_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     is_valid, error_msg = validate_time(time_text)
     
     if not is_valid:
-        await update.message.reply_text(
+        await reply(update, 
             f"❌ {error_msg}\n\n"
             "Попробуй еще раз в формате <b>ЧЧ:ММ</b>:\n"
             "<i>Пример: 14:30 или 09:15</i>",
@@ -600,7 +425,7 @@ async def get_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     context.user_data['time'] = time_text
     
-    await update.message.reply_text(
+    await reply(update, 
         "Замечательно! ⏰\n\n"
         "Теперь напиши <b>город рождения</b>\n"
         "<i>Можно на русском или английском языке</i>\n\n"
@@ -618,7 +443,7 @@ async def get_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отмена диалога"""
-    await update.message.reply_text(
+    await reply(update, 
         "🚫 Профессиональный анализ прерван.\n\n"
         "Твои данные не сохранены. Когда будешь готов, напиши /start",
         parse_mode=ParseMode.HTML
@@ -635,6 +460,13 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /start - Начать создание профессиональной натальной карты
 /help - Эта справка
 /cancel - Отменить текущий диалог
+/subscribe - Ежедневные транзиты к вашей карте
+/unsubscribe - Отписаться от рассылки
+/synastry - Синастрия (совместимость двух карт)
+/solar_return [год] [город] - Соляр (по умолчанию - текущий год, место рождения)
+/lunar_return [ГГГГ-ММ | ГГГГ] [город] - Лунар месяца или все лунары года
+/moon - Луна сейчас: фаза, знак, Луна без курса
+/lunar_calendar [год] - Лунный календарь года (.ics)
 
 <b>Формат данных:</b>
 • <b>Имя:</b> Любое имя или псевдоним (2-50 символов)
@@ -654,115 +486,53 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Качественная визуализация
 • Профессиональные интерпретации
 """
-    await update.message.reply_text(help_text, parse_mode=ParseMode.HTML)
+    await reply(update, help_text, parse_mode=ParseMode.HTML)
+
+
+def send_cached_document(chat_id, document, filename, **kwargs):
+    """Отправка документа через кэш file_id: уже загруженный уходит по id без байтов"""
+    digest = content_digest(document, filename)
+    
+    def upload():
+        future = sender.send_document(chat_id, document, filename=filename, **kwargs)
+        future.add_done_callback(remember)
+        return future
+    
+    def remember(future):
+        if not future.cancelled() and future.exception() is None:
+            file_ids.put(digest, future.result().document.file_id, len(document))
+    
+    def check(future):
+        # Telegram не принял file_id (файл удален) - загружаем заново
+        if not future.cancelled() and isinstance(future.exception(), telegram.error.BadRequest):
+            logger.warning(f"file_id {digest} отклонен: {future.exception()}")
+            file_ids.forget(digest)
+            upload()
+    
+    file_id = file_ids.get(digest)
+    if file_id is None:
+        return upload()
+    future = sender.send_document(chat_id, file_id, **kwargs)
+    future.add_done_callback(check)
+    return future
 
 
-async def create_beautiful_svg(name, date_str, time_str, city_name, subject, update: Update):
-    """Упрощенная версия для быстрого тестирования"""
+async def create_beautiful_svg(name, date_str, time_str, city_name, chart, update: Update):
+    """Отправляет SVG натальной карты (рисуется в памяти, без файлов)"""
     try:
-        logger.info(f"Создание упрощенного SVG для {name}")
-        
-        # Создаем уникальное имя файла
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_name = re.sub(r'[^\w]', '_', name)[:20]
-        svg_filename = f"natal_chart_{safe_name}_{timestamp}.svg"
-        
-        # Получаем все точки
-        all_points = get_all_astrological_points(subject)
-        
-        # Создаем простой SVG
-        svg_content = f'''<?xml version="1.0" encoding="UTF-8"?>
-<svg width="800" height="1000" xmlns="http://www.w3.org/2000/svg">
-    <rect width="100%" height="100%" fill="#0a0a2a"/>
-    
-    <text x="400" y="50" text-anchor="middle" fill="white" font-size="32" font-family="Arial">
-        Натальная карта: {escape_xml(name)}
-    </text>
-    
-    <text x="400" y="90" text-anchor="middle" fill="#64b5f6" font-size="18" font-family="Arial">
-        {escape_xml(date_str)} • {escape_xml(time_str)}
-    </text>
-    
-    <text x="400" y="120" text-anchor="middle" fill="#bbbbbb" font-size="16" font-family="Arial">
-        {escape_xml(city_name)}
-    </text>
-    
-    <!-- Круг -->
-    <circle cx="400" cy="400" r="250" fill="none" stroke="#3d5afe" stroke-width="3"/>
-    
-    <!-- Планеты -->
-    <g font-family="Arial">'''
-        
-        # Добавляем планеты
-        for point in all_points:
-            planet_key = point['key']
-            position = point['position'] % 360
-            angle = math.radians(position - 90)
-            radius = 200
-            
-            # Цвета
-            colors = {
-                "Sun": "#FF9800", "Moon": "#E1BEE7", "Lilith": "#4A235A", 
-                "Selena": "#FFFFFF", "Chiron": "#8BC34A"
-            }
-            color = colors.get(planet_key, "#607D8B")
-            
-            # Эмодзи
-            emojis = {
-                "Sun": "☀️", "Moon": "🌙", "Lilith": "🌑", 
-                "Selena": "⚪", "Chiron": "⚕️"
-            }
-            emoji = emojis.get(planet_key, "⭐")
-            
-            x = 400 + radius * math.cos(angle)
-            y = 400 + radius * math.sin(angle)
-            
-            svg_content += f'''
-        <circle cx="{x:.1f}" cy="{y:.1f}" r="10" fill="{color}"/>
-        <text x="{x:.1f}" y="{y:.1f}" text-anchor="middle" dy=".3em" font-size="8" fill="black">
-            {emoji}
-        </text>'''
-        
-        svg_content += f'''
-    </g>
-    
-    <!-- Легенда -->
-    <rect x="50" y="700" width="700" height="250" rx="10" fill="#1a1a2e"/>
-    <text x="75" y="730" fill="white" font-size="20" font-family="Arial">Включены:</text>
-    
-    <text x="75" y="770" fill="#FF9800" font-size="16" font-family="Arial">✅ 10 основных планет</text>
-    <text x="75" y="800" fill="#4A235A" font-size="16" font-family="Arial">🌑 Лилит (Черная Луна)</text>
-    <text x="75" y="830" fill="#FFFFFF" font-size="16" font-family="Arial">⚪ Селена (Белая Луна)</text>
-    <text x="75" y="860" fill="#8BC34A" font-size="16" font-family="Arial">⚕️ Хирон</text>
-    
-    <text x="400" y="980" text-anchor="middle" fill="#666666" font-size="12">
-        Натальный Гид 2026 • Полный астрологический анализ
-    </text>
-</svg>'''
-        
-        # Сохраняем и отправляем
-        with open(svg_filename, 'w', encoding='utf-8') as f:
-            f.write(svg_content)
-        
-        with open(svg_filename, 'rb') as svg_file:
-            await update.message.reply_document(
-                document=svg_file,
-                filename=f"Натальная_карта_{safe_name}.svg",
-                caption=f"✨ Натальная карта для {name}\n📅 {date_str} • ⏰ {time_str}\n📍 {city_name}",
-                parse_mode=ParseMode.HTML
-            )
-        
-        # Очистка
-        time.sleep(0.5)
-        try:
-            os.remove(svg_filename)
-        except:
-            pass
-        
+        logger.info(f"Создание SVG для {name}")
+        document, filename = chart_document(chart, name, date_str, time_str, city_name)
+        send_cached_document(
+            update.effective_chat.id,
+            document,
+            filename,
+            caption=f"✨ Натальная карта для {name}\n📅 {date_str} • ⏰ {time_str}\n📍 {city_name}",
+            parse_mode=ParseMode.HTML
+        )
         return True
         
     except Exception as e:
-        logger.error(f"Ошибка создания упрощенного SVG: {e}")
+        logger.error(f"Ошибка создания SVG: {e}")
         return False
 
 
@@ -774,7 +544,7 @@ async def get_city_and_calculate(update: Update, context: ContextTypes.DEFAULT_T
     # Сохраняем город
     ud['city'] = user_city
     
-    await update.message.reply_text(
+    await reply(update, 
         "🔮 <b>Запускаю профессиональные астрологические расчеты...</b>\n\n"
         "• Определяю координаты и часовой пояс\n"
         "• Рассчитываю положение ВСЕХ планет (Swiss Ephemeris)\n"
@@ -786,12 +556,10 @@ async def get_city_and_calculate(update: Update, context: ContextTypes.DEFAULT_T
     
     try:
         # 1. Поиск локации
-        location = get_cached_location(user_city)
-        if not location:
-            location = get_cached_location(f"{user_city}, Россия")
+        location = await geocoder.locate_city(user_city)
         
         if not location:
-            await update.message.reply_text(
+            await reply(update, 
                 "❌ <b>Город не найден!</b>\n\n"
                 "Попробуй:\n"
                 "1. Проверить написание\n"
@@ -807,9 +575,11 @@ async def get_city_and_calculate(update: Update, context: ContextTypes.DEFAULT_T
         # 2. Часовой пояс
         tz_str = get_timezone(lat, lng)
         
-        # 3. Парсинг данных
+        # 3. Парсинг данных и перевод местного времени в UT
         y, m, d = map(int, ud['date'].split('-'))
         hh, mm = map(int, ud['time'].split(':'))
+        conversion = local_to_ut(datetime(y, m, d, hh, mm), tz_str)
+        ut = conversion.ut
         
         # Определяем, тестовый ли это случай astro.com
         is_astro_test_case = (
@@ -823,19 +593,30 @@ async def get_city_and_calculate(update: Update, context: ContextTypes.DEFAULT_T
         context.user_data['is_astro_test_case'] = is_astro_test_case
 
         # 4. Точный астрологический расчет
-        await update.message.reply_text(
+        time_note = ""
+        if conversion.nonexistent:
+            time_note = "\n⚠️ <i>В этот день часы переводили вперед - такого местного времени не было</i>"
+        elif conversion.ambiguous:
+            time_note = "\n⚠️ <i>В этот день часы переводили назад - время встречается дважды, взято первое</i>"
+
+        await reply(update, 
             "📡 <b>Рассчитываю точные планетарные позиции через Swiss Ephemeris...</b>\n"
-            "<i>Использую профессиональную астрологическую систему</i>",
+            f"🕰 <b>Часовой пояс:</b> {tz_str} ({format_offset(conversion.offset)})\n"
+            f"🌐 <b>Всемирное время:</b> {ut:%Y-%m-%d %H:%M:%S} UT"
+            f"{time_note}",
             parse_mode=ParseMode.HTML
         )
         
-        # Рассчитываем через Swiss Ephemeris
-        astro_data = calculate_correct_positions(
-            ud['name'], y, m, d, hh, mm, lat, lng
+        # Рассчитываем через Swiss Ephemeris в пуле процессов
+        astro_data = await calc_service.calculate(
+            ud['name'], ut.year, ut.month, ut.day, ut.hour, ut.minute, lat, lng, ut.second
         )
         
+        # Последняя карта пользователя - для /subscribe
+        ud['chart'] = astro_data
+        
         if is_astro_test_case:
-            await update.message.reply_text(
+            await reply(update, 
                 "🎯 <b>ОБНАРУЖЕН ТЕСТОВЫЙ СЛУЧАЙ ASTRO.COM!</b>\n"
                 "Запускаю профессиональную проверку точности расчетов...",
                 parse_mode=ParseMode.HTML
@@ -854,118 +635,57 @@ async def get_city_and_calculate(update: Update, context: ContextTypes.DEFAULT_T
             # Если точность низкая, предупреждаем
             summary = comparison.get('summary', {})
             if summary.get('match_percent', 0) < 80:
-                await update.message.reply_text(
+                await reply(update, 
                     "⚠️ <b>ВНИМАНИЕ: Обнаружены расхождения с astro.com!</b>\n"
                     "Проверьте установку Swiss Ephemeris.\n"
                     "Точность расчетов: {:.1f}%".format(summary.get('match_percent', 0)),
                     parse_mode=ParseMode.HTML
                 )
             else:
-                await update.message.reply_text(
+                await reply(update, 
                     f"✅ <b>Точность расчетов подтверждена!</b>\n"
                     f"Совпадение с astro.com: {summary.get('match_percent', 0):.1f}%",
                     parse_mode=ParseMode.HTML
                 )
 
         if not astro_data:
-            await update.message.reply_text(
+            await reply(update, 
                 "❌ <b>Ошибка в астрологических расчетах</b>\n"
                 "Попробуйте указать другую дату или время",
                 parse_mode=ParseMode.HTML
             )
             return ConversationHandler.END
         
-        # 5. Создаем совместимый объект
-        class PlanetObject:
-            def __init__(self, planet_data):
-                self.position = planet_data.get('longitude', 0)
-                self.longitude = planet_data.get('longitude', 0)
-                self.sign = planet_data.get('sign', 'Aries')
-                self.house = type('House', (), {'name': 'Unknown'})()
-                
-        class AstroSubject:
-            def __init__(self, astro_data):
-                # Основные планеты
-                planets_dict = astro_data.get('planets', {})
-                
-                self.sun = PlanetObject(planets_dict.get('Sun', {}))
-                self.moon = PlanetObject(planets_dict.get('Moon', {}))
-                self.mercury = PlanetObject(planets_dict.get('Mercury', {}))
-                self.venus = PlanetObject(planets_dict.get('Venus', {}))
-                self.mars = PlanetObject(planets_dict.get('Mars', {}))
-                self.jupiter = PlanetObject(planets_dict.get('Jupiter', {}))
-                self.saturn = PlanetObject(planets_dict.get('Saturn', {}))
-                self.uranus = PlanetObject(planets_dict.get('Uranus', {}))
-                self.neptune = PlanetObject(planets_dict.get('Neptune', {}))
-                self.pluto = PlanetObject(planets_dict.get('Pluto', {}))
-                
-                # Лилит и Селена
-                self.lilith = PlanetObject(planets_dict.get('Lilith', {}))
-                self.selena = PlanetObject(planets_dict.get('Selena', {}))
-                self.chiron = PlanetObject(planets_dict.get('Chiron', {}))
-                self.mean_node = PlanetObject(planets_dict.get('Node', {}))
-                
-                # Асцендент и MC
-                asc_data = astro_data.get('ascendant', {})
-                mc_data = astro_data.get('mc', {})
-                
-                self.first_house = type('House', (), {
-                    'sign': asc_data.get('sign', 'Aries'),
-                    'position': asc_data.get('longitude', 0)
-                })()
-                self.tenth_house = type('House', (), {
-                    'sign': mc_data.get('sign', 'Capricorn'),
-                    'position': mc_data.get('longitude', 270)
-                })()
-        
-        # Создаем объект subject
-        subject = AstroSubject(astro_data)
-        
         # 6. Формирование отчета
         compact_reports = format_compact_report(astro_data, ud, lat, lng, address)
         for report_text in compact_reports:
-            await update.message.reply_text(report_text, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+            await reply(update, report_text, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
         
        
         # 7. Создание SVG (упрощенная версия для проверки)
-        await update.message.reply_text("🎨 <b>Создаю натальную карту для проверки...</b>", parse_mode=ParseMode.HTML)
+        await reply(update, "🎨 <b>Создаю натальную карту для проверки...</b>", parse_mode=ParseMode.HTML)
         
         # Простая проверочная карта
         try:
             # Создаем простую текстовую версию карты для проверки
             check_text = f"📊 <b>ПРОВЕРОЧНАЯ КАРТА ДЛЯ {ud['name']}</b>\n\n"
-            # Определите где-то перед использованием:
-            planets_to_analyze = [
-                ("Sun", subject.sun, "☀️"),
-                ("Moon", subject.moon, "🌙"),
-                ("Mercury", subject.mercury, "☿"),
-                ("Venus", subject.venus, "♀"),
-                ("Mars", subject.mars, "♂"),
-                ("Jupiter", subject.jupiter, "♃"),
-                ("Saturn", subject.saturn, "♄"),
-                ("Uranus", subject.uranus, "♅"),
-                ("Neptune", subject.neptune, "♆"),
-                ("Pluto", subject.pluto, "♇"),
-                ("Lilith", subject.lilith, "🌑"),
-                ("Selena", subject.selena, "⚪"),
-                ("Chiron", subject.chiron, "⚕️"),
-                ("Node", subject.mean_node, "☊"),
-            ]
-            for p_key, p_obj, emoji in planets_to_analyze:
-                if p_obj and hasattr(p_obj, 'sign'):
-                    ru_planet = TRANSLATE.get(p_key, p_key)
-                    sign = getattr(p_obj, 'sign', '?')
-                    degree = int(getattr(p_obj, 'longitude', 0) % 30)
-                    check_text += f"{emoji} {ru_planet}: {sign} {degree}°\n"
+            positions = format_positions(astro_data.longitudes, 'en')
+            houses = astro_data.houses()
+            for idx, p_key in enumerate(PLANET_NAMES):
+                ru_planet = TRANSLATE.get(p_key, p_key)
+                emoji = POINT_EMOJIS.get(p_key, "⭐")
+                house = f", {houses[idx]} дом" if houses[idx] else ""
+                check_text += f"{emoji} {ru_planet}: {positions[idx]}{house}\n"
             
-            await update.message.reply_text(check_text, parse_mode=ParseMode.HTML)
+            await reply(update, check_text, parse_mode=ParseMode.HTML)
+            await create_beautiful_svg(ud['name'], ud['date'], ud['time'], address, astro_data, update)
             
             # Создаем ссылку для сравнения на astro.com
             astro_link = f"https://www.astro.com/cgi/chart.cgi?lang=e&btyp=w2gw&sday={d}&smon={m}&syr={y}&shour={hh}&smin={mm}&hsy=-1&zod=&orbp=&rs=0&ast=&add=18&add=19&add=20&node=&asp=1&asp=2&asp=3&asp=4&asp=5&asp=6&asp=7&asp=8&pbs=&nhor=1&nho2=1&sstr=1&lg=e&cid=uuf&go.x=15&go.y=12"
 
             # Для тестового случая показываем специальное сообщение
             if is_astro_test_case:
-                await update.message.reply_text(
+                await reply(update, 
                     f"🔗 <b>Эталонная карта для сравнения:</b>\n"
                     f"<a href='{astro_link}'>Нажмите для открытия astro.com</a>\n\n"
                     f"<i>Ваши данные точно соответствуют профессиональному эталону!</i>\n"
@@ -978,7 +698,7 @@ async def get_city_and_calculate(update: Update, context: ContextTypes.DEFAULT_T
                 )
             else:
                 # Для обычных случаев
-                await update.message.reply_text(
+                await reply(update, 
                     f"🔗 <b>Для самостоятельной проверки:</b>\n"
                     f"<a href='{astro_link}'>Нажмите для создания карты на astro.com</a>\n\n"
                     f"<i>Проверьте точность наших расчетов:</i>\n"
@@ -994,7 +714,7 @@ async def get_city_and_calculate(update: Update, context: ContextTypes.DEFAULT_T
             logger.error(f"Ошибка создания проверочной карты: {e}")
         
         # Завершение
-        await update.message.reply_text(
+        await reply(update, 
             "✅ <b>РАСЧЕТ ЗАВЕРШЕН!</b>\n\n"
             "<b>Что вы получили:</b>\n"
             "1. 📋 <b>Точные планетарные позиции</b> (Swiss Ephemeris)\n"
@@ -1005,7 +725,7 @@ async def get_city_and_calculate(update: Update, context: ContextTypes.DEFAULT_T
         )
         
         # Предлагаем начать заново
-        await update.message.reply_text(
+        await reply(update, 
             "🔄 <b>Хотите сделать другой расчет?</b>\n"
             "Используйте /start",
             parse_mode=ParseMode.HTML
@@ -1025,7 +745,7 @@ async def get_city_and_calculate(update: Update, context: ContextTypes.DEFAULT_T
 • Попробуйте другое время или дату
 • Используйте /start для нового расчета
 """
-        await update.message.reply_text(error_text, parse_mode=ParseMode.HTML)
+        await reply(update, error_text, parse_mode=ParseMode.HTML)
     
     return ConversationHandler.END
 
@@ -1038,7 +758,7 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if isinstance(context.error, telegram.error.TimedOut):
         if update and update.effective_message:
             try:
-                await update.effective_message.reply_text(
+                await reply(update, 
                     "⏳ Произошел таймаут сети. Попробуйте еще раз через несколько секунд.\n\n"
                     "Если проблема повторяется, проверьте ваше интернет-соединение."
                 )
@@ -1047,14 +767,348 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif isinstance(context.error, telegram.error.NetworkError):
         if update and update.effective_message:
             try:
-                await update.effective_message.reply_text(
+                await reply(update, 
                     "🌐 Проблема с сетью. Проверьте интернет-соединение и попробуйте снова."
                 )
             except:
                 pass
 
-if __name__ == '__main__':
+
+async def calculate_birth(name, date_text, time_text, city):
+    """Карта по данным рождения: геокодирование, пояс, UT, расчет (None - город не найден)"""
+    location = await geocoder.locate_city(city)
+    if not location:
+        return None
+    tz_str = get_timezone(location.latitude, location.longitude)
+    y, m, d = map(int, date_text.split('-'))
+    hh, mm = map(int, time_text.split(':'))
+    ut = local_to_ut(datetime(y, m, d, hh, mm), tz_str).ut
+    return await calc_service.calculate(
+        name, ut.year, ut.month, ut.day, ut.hour, ut.minute,
+        location.latitude, location.longitude, ut.second
+    )
+
+
+SYNASTRY_FORMAT = (
+    "<code>Имя, ГГГГ-ММ-ДД, ЧЧ:ММ, Город</code>\n"
+    "Например: <code>Андрей, 1987-07-25, 12:00, Ижевск</code>"
+)
+
+
+async def synastry_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Начало синастрии: данные первого человека"""
+    context.user_data.pop('synastry_first', None)
+    await reply(update, 
+        "💞 <b>СИНАСТРИЯ - СОВМЕСТИМОСТЬ ДВУХ КАРТ</b>\n\n"
+        "Отправьте данные <b>первого</b> человека одной строкой:\n" + SYNASTRY_FORMAT,
+        parse_mode=ParseMode.HTML
+    )
+    return SYN_FIRST
+
+
+async def synastry_first(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Данные первого человека"""
+    record, error = parse_birth_record(update.message.text)
+    if record is None:
+        await reply(update, f"❌ {error}\n\n{SYNASTRY_FORMAT}", parse_mode=ParseMode.HTML)
+        return SYN_FIRST
+    
+    context.user_data['synastry_first'] = record
+    await reply(update, 
+        f"✅ {record[0]}\n\nТеперь данные <b>второго</b> человека:\n" + SYNASTRY_FORMAT,
+        parse_mode=ParseMode.HTML
+    )
+    return SYN_SECOND
+
+
+async def synastry_second(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Данные второго человека и расчет синастрии"""
+    record, error = parse_birth_record(update.message.text)
+    if record is None:
+        await reply(update, f"❌ {error}\n\n{SYNASTRY_FORMAT}", parse_mode=ParseMode.HTML)
+        return SYN_SECOND
+    
+    first = context.user_data.pop('synastry_first')
+    await reply(update, "🔮 <b>Рассчитываю обе карты...</b>", parse_mode=ParseMode.HTML)
+    
+    try:
+        # Обе карты считаются (или берутся из кэша) одновременно
+        charts = await asyncio.gather(calculate_birth(*first), calculate_birth(*record))
+        missing = [rec[3] for rec, chart in zip((first, record), charts) if chart is None]
+        if missing:
+            await reply(update, 
+                f"❌ <b>Город не найден:</b> {', '.join(missing)}\nПопробуйте снова: /synastry",
+                parse_mode=ParseMode.HTML
+            )
+            return ConversationHandler.END
+        
+        result = compare(*charts)
+        await send_long_message(update, format_synastry_report(*charts, result))
+    except Exception as e:
+        logger.error(f"Ошибка синастрии: {e}", exc_info=True)
+        await reply(update, 
+            "❌ <b>Ошибка расчета синастрии</b>\nПопробуйте позже: /synastry",
+            parse_mode=ParseMode.HTML
+        )
+    return ConversationHandler.END
+
+
+async def return_location(chart, args):
+    """Место карты возвращения: город из аргументов или место рождения (None - не найден)"""
+    if not args:
+        return chart.lat, chart.lon
+    location = await geocoder.locate_city(' '.join(args))
+    if not location:
+        return None
+    return location.latitude, location.longitude
+
+
+async def send_return_chart(update: Update, title, natal, moment, lat, lng):
+    """Карта на момент возвращения в указанном месте"""
+    ut = moment.when
+    chart = await calc_service.calculate(
+        natal.name, ut.year, ut.month, ut.day, ut.hour, ut.minute, lat, lng, ut.second
+    )
+    tz_str = get_timezone(lat, lng)
+    report = format_return_report(title, natal, chart, ut_to_local(ut, tz_str), tz_str)
+    await send_long_message(update, report)
+
+
+def natal_chart_or_none(context):
+    """Последняя рассчитанная натальная карта пользователя"""
+    chart = context.user_data.get('chart')
+    if chart is None or chart.note:
+        return None
+    return chart
+
+
+async def solar_return_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Соляр: /solar_return [год] [город]"""
+    natal = natal_chart_or_none(context)
+    if natal is None:
+        await reply(update, "🔮 Сначала рассчитайте натальную карту: /start")
+        return
+    
+    args = list(context.args or [])
+    year = int(args.pop(0)) if args and re.fullmatch(r'\d{4}', args[0]) else today_utc().year
+    
+    try:
+        place = await return_location(natal, args)
+        if place is None:
+            await reply(update, "❌ <b>Город не найден!</b>", parse_mode=ParseMode.HTML)
+            return
+        
+        loop = asyncio.get_running_loop()
+        moment = await loop.run_in_executor(None, solar_return, natal, year)
+        await send_return_chart(update, f"☀️ <b>СОЛЯР {year}:</b>", natal, moment, *place)
+    except Exception as e:
+        logger.error(f"Ошибка расчета соляра: {e}", exc_info=True)
+        await reply(update, "❌ Ошибка расчета соляра. Попробуйте позже.")
+
+
+async def lunar_return_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Лунар: /lunar_return [ГГГГ-ММ | ГГГГ] [город]"""
+    natal = natal_chart_or_none(context)
+    if natal is None:
+        await reply(update, "🔮 Сначала рассчитайте натальную карту: /start")
+        return
+    
+    args = list(context.args or [])
+    today = today_utc()
+    year, month = today.year, today.month
+    whole_year = False
+    if args and re.fullmatch(r'\d{4}-\d{2}', args[0]):
+        year, month = map(int, args.pop(0).split('-'))
+        if not 1 <= month <= 12:
+            await reply(update, "❌ Неверный месяц. Формат: <code>ГГГГ-ММ</code>",
+                                            parse_mode=ParseMode.HTML)
+            return
+    elif args and re.fullmatch(r'\d{4}', args[0]):
+        year = int(args.pop(0))
+        whole_year = True
+    
+    try:
+        place = await return_location(natal, args)
+        if place is None:
+            await reply(update, "❌ <b>Город не найден!</b>", parse_mode=ParseMode.HTML)
+            return
+        
+        loop = asyncio.get_running_loop()
+        if whole_year:
+            # Все лунары года одним пакетом - только моменты, без карт
+            moments = await loop.run_in_executor(None, lunar_returns, natal, year)
+            tz_str = get_timezone(*place)
+            lines = [f"🌙 <b>ЛУНАРЫ {year}: {natal.name}</b>", f"🕰 {tz_str}", ""]
+            for moment in moments:
+                lines.append(f"• {ut_to_local(moment.when, tz_str):%d.%m.%Y %H:%M:%S}")
+            lines.append("")
+            lines.append("Карта лунара месяца: <code>/lunar_return ГГГГ-ММ</code>")
+            await send_long_message(update, '\n'.join(lines))
+            return
+        
+        moment = await loop.run_in_executor(None, lunar_return, natal, year, month)
+        if moment is None:
+            await reply(update, f"В {month:02d}.{year} лунара нет")
+            return
+        await send_return_chart(update, f"🌙 <b>ЛУНАР {month:02d}.{year}:</b>", natal, moment, *place)
+    except Exception as e:
+        logger.error(f"Ошибка расчета лунара: {e}", exc_info=True)
+        await reply(update, "❌ Ошибка расчета лунара. Попробуйте позже.")
+
+
+async def moon_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Луна сейчас: фаза, знак и курс по лунному календарю"""
+    calendar = get_calendar()
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    jd = datetime_to_jd(now)
+    state = calendar.state_at(jd) if calendar is not None else None
+    if state is None:
+        await reply(update, "🌙 Лунный календарь не загружен")
+        return
+    
+    lines = [
+        f"{PHASE_EMOJIS[state.phase]} <b>{PHASE_NAMES[state.phase]}</b> "
+        f"с {jd_to_datetime(state.phase_since):%d.%m %H:%M} UT",
+        f"🌙 Луна {SIGNS_RU_IN[sign_key_index(state.sign)]} "
+        f"с {jd_to_datetime(state.sign_since):%d.%m %H:%M} UT",
+    ]
+    void = state.void or calendar.next_void(jd)
+    if void is not None:
+        period = f"{jd_to_datetime(void.start):%d.%m %H:%M} - {jd_to_datetime(void.end):%d.%m %H:%M} UT"
+        if state.void:
+            lines.append(f"⛔ <b>Луна без курса</b> до {jd_to_datetime(void.end):%d.%m %H:%M} UT")
+        else:
+            lines.append(f"⏳ Ближайшая Луна без курса: {period}")
+    lines.append("\n📅 Календарь на год: <code>/lunar_calendar ГГГГ</code>")
+    await reply(update, '\n'.join(lines), parse_mode=ParseMode.HTML)
+
+
+async def lunar_calendar_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Лунный календарь года в формате iCalendar: /lunar_calendar [год]"""
+    calendar = get_calendar()
+    if calendar is None:
+        await reply(update, "🌙 Лунный календарь не загружен")
+        return
+    
+    args = context.args or []
+    year = int(args[0]) if args and re.fullmatch(r'\d{4}', args[0]) else today_utc().year
+    start = datetime_to_jd(datetime(year, 1, 1))
+    end = datetime_to_jd(datetime(year + 1, 1, 1))
+    if not (calendar.covers(start) and calendar.covers(end - 1)):
+        await reply(update, 
+            f"❌ Календарь рассчитан на {jd_to_datetime(calendar.start):%Y}-"
+            f"{jd_to_datetime(calendar.end):%Y} годы"
+        )
+        return
+    
+    # События читаются из таблицы потоком прямо в буфер отправки
+    buffer = io.BytesIO()
+    write_ical(calendar, start, end, buffer)
+    sender.send_document(
+        update.effective_chat.id,
+        buffer.getvalue(),
+        filename=f"lunar_calendar_{year}.ics",
+        caption=f"🌙 Лунный календарь {year}: фазы, знаки Луны, Луна без курса"
+    )
+
+
+async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Подписка на ежедневные транзиты по последней рассчитанной карте"""
+    chart = natal_chart_or_none(context)
+    if chart is None:
+        await reply(update, 
+            "🔮 Сначала рассчитайте натальную карту: /start",
+            parse_mode=ParseMode.HTML
+        )
+        return
+    
+    subscriptions.add(update.effective_chat.id, chart)
+    await reply(update, 
+        f"✅ <b>Подписка оформлена!</b>\n"
+        f"Каждый день в {Config.DIGEST_TIME_UTC} UT - транзиты к карте {chart.name}.\n"
+        f"Отписаться: /unsubscribe",
+        parse_mode=ParseMode.HTML
+    )
+
+
+async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отписка от ежедневной рассылки"""
+    if subscriptions.remove(update.effective_chat.id):
+        await reply(update, "👋 Вы отписаны от ежедневных транзитов")
+    else:
+        await reply(update, "Вы не подписаны. Подписаться: /subscribe")
+
+
+async def broadcast_digest(context: ContextTypes.DEFAULT_TYPE):
+    """Ежедневная рассылка: небо дня считается один раз, сообщения уходят пачками"""
+    loop = asyncio.get_running_loop()
+    try:
+        sky = await loop.run_in_executor(None, DailySky, today_utc())
+    except Exception as e:
+        logger.error(f"Ошибка расчета неба дня: {e}", exc_info=True)
+        return
     
+    sent = failed = removed = 0
+    began = loop.time()
+    # Каждый шард рассылает своим чатам
+    for batch in subscriptions.iter_batches(shards=active_shards,
+                                            shard_index=Config.SHARD_INDEX or 0):
+        messages = sky.render_batch(batch.names, batch.longitudes)
+        
+        # Скорость ограничивает общая очередь отправки
+        futures = [sender.send_message(chat_id, text, parse_mode=ParseMode.HTML)
+                   for chat_id, text in zip(batch.chat_ids, messages)]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        
+        for chat_id, result in zip(batch.chat_ids, results):
+            if isinstance(result, telegram.error.Forbidden):
+                # Пользователь заблокировал бота
+                subscriptions.remove(chat_id)
+                removed += 1
+            elif isinstance(result, Exception):
+                failed += 1
+            else:
+                sent += 1
+    
+    logger.info(f"Рассылка транзитов: отправлено {sent}, ошибок {failed}, "
+                f"отписано {removed} за {loop.time() - began:.1f} с")
+
+
+async def on_startup(app):
+    """Запускает фоновые сервисы вместе с приложением"""
+    global subscriptions, file_ids
+    subscriptions = SubscriptionStore()
+    file_ids = FileIdCache(TEMPLATE_VERSION)
+    calc_service.cache = ChartCache()
+    calc_service.start()
+    geocoder.start(cache=GeocodeCache(), gazetteer=Gazetteer.open_if_exists())
+    sender.start(app.bot)
+    get_calendar()
+    if Config.TIMEZONE_IN_MEMORY:
+        timezone_lookup.preload()
+
+
+async def on_shutdown(app):
+    """Останавливает фоновые сервисы"""
+    await sender.close()
+    calc_service.shutdown()
+    geocoder.shutdown()
+    if subscriptions is not None:
+        subscriptions.close()
+    if file_ids is not None:
+        logger.info(f"Кэш file_id: {file_ids.stats()}")
+        file_ids.close()
+
+if __name__ == '__main__':
+    # Настройка логирования (только при запуске, не при импорте)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('bot.log', encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
     
     print("🚀 Запуск ПРОФЕССИОНАЛЬНОГО Натального Гида 2026...")
     print("✨ Теперь с СЕЛЕНОЙ и ЛИЛИТ!")
@@ -1071,13 +1125,35 @@ if __name__ == '__main__':
     print("📞 Для остановки нажмите Ctrl+C")
     print("=" * 60 + "\n")
     
-    app = ApplicationBuilder()\
+    # Маршрутизатор шардов сам обновления не обрабатывает
+    if Config.WEBHOOK_URL and Config.SHARDS > 1 and Config.SHARD_INDEX is None:
+        print(f"🔀 Маршрутизатор: {Config.SHARDS} шардов по chat id")
+        try:
+            ok = asyncio.run(run_router(TOKEN))
+        except KeyboardInterrupt:
+            ok = True
+        # Ненулевой код - чтобы супервизор перезапустил контейнер
+        sys.exit(0 if ok else 1)
+    if Config.SHARDS > 1 and not Config.WEBHOOK_URL:
+        logger.warning(f"SHARDS={Config.SHARDS} без WEBHOOK_URL не действует: один процесс")
+        print(f"⚠️ Шардирование работает только в режиме webhook, SHARDS={Config.SHARDS} не действует")
+    
+    builder = ApplicationBuilder()\
     .token(TOKEN)\
+    .base_url(Config.TELEGRAM_API_URL)\
+    .base_file_url(Config.TELEGRAM_FILE_URL)\
+    .update_queue(asyncio.Queue(Config.UPDATE_QUEUE_SIZE))\
+    .concurrent_updates(ChatOrderedUpdateProcessor(Config.CONCURRENT_UPDATES))\
     .read_timeout(30)\
     .write_timeout(30)\
     .connect_timeout(30)\
     .pool_timeout(30)\
-    .build()
+    .post_init(on_startup)\
+    .post_shutdown(on_shutdown)
+    persistence = create_persistence()
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    app = builder.build()
     app.add_error_handler(error_handler)
 
     app.add_handler(CommandHandler('details', details_command))
@@ -1092,14 +1168,45 @@ if __name__ == '__main__':
             CITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_city_and_calculate)],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
-        allow_reentry=True
+        allow_reentry=True,
+        name='natal',
+        persistent=persistence is not None
     )
     
     app.add_handler(conv_handler)
+    
+    # Диалог синастрии
+    app.add_handler(ConversationHandler(
+        entry_points=[CommandHandler('synastry', synastry_start)],
+        states={
+            SYN_FIRST: [MessageHandler(filters.TEXT & ~filters.COMMAND, synastry_first)],
+            SYN_SECOND: [MessageHandler(filters.TEXT & ~filters.COMMAND, synastry_second)],
+        },
+        fallbacks=[CommandHandler('cancel', cancel)],
+        allow_reentry=True,
+        name='synastry',
+        persistent=persistence is not None
+    ))
     app.add_handler(CommandHandler('help', help_command))
+    app.add_handler(CommandHandler('subscribe', subscribe_command))
+    app.add_handler(CommandHandler('unsubscribe', unsubscribe_command))
+    app.add_handler(CommandHandler('solar_return', solar_return_command))
+    app.add_handler(CommandHandler('lunar_return', lunar_return_command))
+    app.add_handler(CommandHandler('moon', moon_command))
+    app.add_handler(CommandHandler('lunar_calendar', lunar_calendar_command))
+    
+    # Ежедневная рассылка транзитов подписчикам
+    digest_time = datetime.strptime(Config.DIGEST_TIME_UTC, '%H:%M').time()
+    app.job_queue.run_daily(broadcast_digest, time=digest_time.replace(tzinfo=timezone.utc),
+                            name='daily_digest')
     
     try:
-        app.run_polling(allowed_updates=Update.ALL_TYPES)
+        if Config.WEBHOOK_URL:
+            print(f"🌐 Режим webhook: {Config.WEBHOOK_URL}")
+            # Шард получает обновления от маршрутизатора, webhook регистрирует тот
+            asyncio.run(serve_webhook(app, register=Config.SHARD_INDEX is None))
+        else:
+            app.run_polling(allowed_updates=ALLOWED_UPDATES)
     except KeyboardInterrupt:
         print("\n👋 Профессиональный бот остановлен пользователем")
     except Exception as e:
@@ -0,0 +1,110 @@
+# calc_service.py
+"""
+Асинхронный сервис астрологических расчетов.
+Swiss Ephemeris работает в пуле процессов, поэтому долгий расчет одной
+карты не блокирует цикл событий бота и остальные диалоги.
+Перед пулом стоит кэш карт (chart_cache.py): повторные данные не считаются.
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from chart_cache import chart_key, with_name
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker():
+    """Инициализирует Swiss Ephemeris один раз в каждом процессе пула"""
+    from correct_astrology_calc import get_engine
+    get_engine().calc_points(2451545.0, ['Sun'])
+
+
+def _run_calculation(args):
+    """Выполняет расчет внутри процесса пула"""
+    from correct_astrology_calc import calculate_correct_positions
+    return calculate_correct_positions(*args)
+
+
+class CalculationService:
+    """Пул процессов для расчета натальных карт с ожиданием через await"""
+
+    def __init__(self, workers=None, cache=None):
+        self.workers = max(1, workers or Config.CALC_WORKERS)
+        self.cache = cache
+        self._executor = None
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+
+    def start(self):
+        """Создает пул процессов (повторный вызов ничего не делает)"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker
+            )
+            logger.info(f"Пул расчетов запущен: {self.workers} процессов")
+
+    def shutdown(self, wait=True):
+        """Останавливает пул процессов"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+            logger.info("Пул расчетов остановлен")
+        if self.cache is not None:
+            self.cache.close()
+
+    @property
+    def in_flight(self):
+        """Количество расчетов, отправленных в пул и еще не завершенных"""
+        return self._in_flight
+
+    @property
+    def queue_depth(self):
+        """Количество расчетов, ожидающих свободного процесса"""
+        return max(0, self._in_flight - self.workers)
+
+    def stats(self):
+        """Статистика сервиса для логов и диагностики"""
+        stats = {
+            'workers': self.workers,
+            'in_flight': self._in_flight,
+            'queue_depth': self.queue_depth,
+            'completed': self._completed,
+            'failed': self._failed,
+        }
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        return stats
+
+    async def calculate(self, name, year, month, day, hour, minute, lat, lon, second=0):
+        """Рассчитывает карту (время - UT) в пуле процессов, не блокируя цикл событий"""
+        key = None
+        if self.cache is not None:
+            key = chart_key(year, month, day, hour, minute, lat, lon, second)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return with_name(cached, name)
+
+        self.start()
+        loop = asyncio.get_running_loop()
+        args = (name, year, month, day, hour, minute, lat, lon, second)
+
+        self._in_flight += 1
+        if self.queue_depth:
+            logger.info(f"Очередь расчетов: {self.queue_depth}")
+        try:
+            result = await loop.run_in_executor(self._executor, _run_calculation, args)
+            self._completed += 1
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._in_flight -= 1
+
+        if key is not None:
+            self.cache.put(key, result)
+        return result
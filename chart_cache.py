@@ -0,0 +1,221 @@
+# chart_cache.py
+"""
+Кэш рассчитанных карт с адресацией по содержимому.
+Ключ - хэш нормализованных параметров расчета (юлианский день UT, широта,
+долгота, система домов, флаги Swiss Ephemeris), поэтому одинаковые данные
+рождения от разных пользователей дают одну запись.
+
+Два уровня: LRU в памяти процесса и необязательный SQLite на диске.
+Оба ограничены и по числу записей, и по объему в байтах.
+"""
+
+import hashlib
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+from correct_astrology_calc import swe, HOUSE_SYSTEM, CALC_FLAGS
+
+logger = logging.getLogger(__name__)
+
+# Точность нормализации: ~0.1 секунды по времени и ~1 м по координатам
+JD_DIGITS = 6
+COORD_DIGITS = 5
+
+
+def chart_key(year, month, day, hour, minute, lat, lon, second=0,
+              house_system=HOUSE_SYSTEM, flags=CALC_FLAGS):
+    """Хэш нормализованных параметров расчета (время - UT)"""
+    jd = swe.julday(year, month, day, hour + minute / 60.0 + second / 3600.0)
+    normalized = (
+        f"{round(jd, JD_DIGITS):.{JD_DIGITS}f}|{round(lat, COORD_DIGITS):.{COORD_DIGITS}f}|"
+        f"{round(lon, COORD_DIGITS):.{COORD_DIGITS}f}|{bytes(house_system).decode()}|{flags}"
+    )
+    return hashlib.sha256(normalized.encode('ascii')).hexdigest()
+
+
+def is_cacheable(result):
+    """Карты, рассчитанные с ошибкой (заглушки), не кэшируем"""
+    return result is not None and not result.note
+
+
+def with_name(result, name):
+    """Копия карты из кэша с именем текущего пользователя"""
+    return result.renamed(name)
+
+
+class _Tier:
+    """Общие счетчики уровня кэша"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def counters(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class MemoryTier(_Tier):
+    """LRU в памяти процесса: ключ -> (сериализованная карта)"""
+
+    def __init__(self, max_entries, max_bytes):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key):
+        blob = self._items.get(key)
+        if blob is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._items.move_to_end(key)
+        return blob
+
+    def put(self, key, blob):
+        old = self._items.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._items[key] = blob
+        self._bytes += len(blob)
+        while self._items and (len(self._items) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._items.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def stats(self):
+        return dict(self.counters(), entries=len(self._items), bytes=self._bytes)
+
+
+class SQLiteTier(_Tier):
+    """Постоянный уровень в SQLite (WAL), вытеснение по давности использования"""
+
+    def __init__(self, path, max_entries, max_bytes):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chart_cache ("
+            "    key TEXT PRIMARY KEY,"
+            "    value BLOB NOT NULL,"
+            "    accessed INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS chart_cache_accessed_idx ON chart_cache(accessed)"
+        )
+        self._entries, self._bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM chart_cache"
+        ).fetchone()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM chart_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE chart_cache SET accessed = ? WHERE key = ?",
+                               (int(time.time()), key))
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, blob):
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT LENGTH(value) FROM chart_cache WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO chart_cache VALUES (?, ?, ?)",
+                               (key, blob, int(time.time())))
+            if old is None:
+                self._entries += 1
+            else:
+                self._bytes -= old[0]
+            self._bytes += len(blob)
+            if self._entries > self.max_entries or self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Удаляет самые давно использованные записи до 90% лимитов"""
+        rows = self._conn.execute(
+            "SELECT key, LENGTH(value) FROM chart_cache ORDER BY accessed"
+        )
+        doomed = []
+        entries, size = self._entries, self._bytes
+        for key, length in rows:
+            if entries <= self.max_entries * 0.9 and size <= self.max_bytes * 0.9:
+                break
+            doomed.append((key,))
+            entries -= 1
+            size -= length
+        self._conn.executemany("DELETE FROM chart_cache WHERE key = ?", doomed)
+        self._entries, self._bytes = entries, size
+        self.evictions += len(doomed)
+
+    def stats(self):
+        return dict(self.counters(), entries=self._entries, bytes=self._bytes)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ChartCache:
+    """Двухуровневый кэш карт"""
+
+    def __init__(self, max_entries=None, max_bytes=None, path=None,
+                 db_max_entries=None, db_max_bytes=None):
+        self.memory = MemoryTier(max_entries or Config.CHART_CACHE_MAX_ENTRIES,
+                                 max_bytes or Config.CHART_CACHE_MAX_BYTES)
+        path = path if path is not None else Config.CHART_CACHE_PATH
+        self.disk = None
+        if path:
+            self.disk = SQLiteTier(path,
+                                   db_max_entries or Config.CHART_CACHE_DB_MAX_ENTRIES,
+                                   db_max_bytes or Config.CHART_CACHE_DB_MAX_BYTES)
+            logger.info(f"Постоянный кэш карт: {path} ({self.disk.stats()['entries']} записей)")
+
+    def get(self, key):
+        """Карта по ключу или None"""
+        blob = self.memory.get(key)
+        if blob is None and self.disk is not None:
+            blob = self.disk.get(key)
+            if blob is not None:
+                self.memory.put(key, blob)
+        return pickle.loads(blob) if blob is not None else None
+
+    def put(self, key, result):
+        """Сохраняет карту на обоих уровнях"""
+        if not is_cacheable(result):
+            return
+        blob = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        self.memory.put(key, blob)
+        if self.disk is not None:
+            self.disk.put(key, blob)
+
+    def stats(self):
+        """Статистика попаданий по уровням"""
+        stats = {'memory': self.memory.stats()}
+        if self.disk is not None:
+            stats['disk'] = self.disk.stats()
+        return stats
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
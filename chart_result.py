@@ -0,0 +1,261 @@
+# chart_result.py
+"""
+Компактный результат расчета карты.
+
+Вместо словаря словарей со строками для каждой планеты карта хранит один
+массив float64 долгот, индексированный перечислением Point, и 12 куспидов.
+Знаки, градусы и строки вычисляются при обращении. Для старого кода есть
+словарный вид: chart['planets']['Sun']['sign'], chart.get('ascendant') и т.д.
+"""
+
+from collections.abc import Mapping
+from enum import IntEnum
+
+import numpy as np
+
+from houses import place_in_houses
+
+SIGNS = ('Aries', 'Taurus', 'Gemini', 'Cancer', 'Leo', 'Virgo',
+         'Libra', 'Scorpio', 'Sagittarius', 'Capricorn', 'Aquarius', 'Pisces')
+
+
+class Point(IntEnum):
+    """Точки карты в порядке массива долгот"""
+    SUN = 0
+    MOON = 1
+    MERCURY = 2
+    VENUS = 3
+    MARS = 4
+    JUPITER = 5
+    SATURN = 6
+    URANUS = 7
+    NEPTUNE = 8
+    PLUTO = 9
+    CHIRON = 10
+    LILITH = 11
+    NODE = 12
+    SELENA = 13
+    ASC = 14
+    MC = 15
+
+
+# Ключи планет в словарном виде (совпадают с PLANET_CODES + Селена)
+PLANET_NAMES = ('Sun', 'Moon', 'Mercury', 'Venus', 'Mars', 'Jupiter', 'Saturn',
+                'Uranus', 'Neptune', 'Pluto', 'Chiron', 'Lilith', 'Node', 'Selena')
+PLANET_INDEX = {name: i for i, name in enumerate(PLANET_NAMES)}
+N_POINTS = len(Point)
+
+STUB_NOTE = 'ТЕСТОВЫЕ ДАННЫЕ (установите pyswisseph)'
+
+
+def sign_of(longitude):
+    """Знак зодиака по долготе"""
+    return SIGNS[int(longitude // 30) % 12]
+
+
+class ChartPoint:
+    """Точка карты для кода, которому нужны атрибуты (position, sign, house)"""
+    __slots__ = ('key', 'longitude', 'house')
+
+    def __init__(self, key, longitude, house=None):
+        self.key = key
+        self.longitude = longitude
+        self.house = house
+
+    @property
+    def position(self):
+        return self.longitude
+
+    @property
+    def sign(self):
+        return sign_of(self.longitude)
+
+
+class _PointView(Mapping):
+    """Словарный вид одной точки (как в старом формате результата)"""
+    __slots__ = ('_chart', '_idx')
+
+    _PLANET_KEYS = ('longitude', 'position', 'sign', 'degree', 'sign_degree', 'full_position', 'house')
+    _ANGLE_KEYS = ('longitude', 'sign', 'degree', 'full')
+
+    def __init__(self, chart, idx):
+        self._chart = chart
+        self._idx = idx
+
+    def _keys(self):
+        if self._idx >= Point.ASC:
+            return self._ANGLE_KEYS
+        if self._chart.is_stub(self._idx):
+            return self._PLANET_KEYS + ('note',)
+        return self._PLANET_KEYS
+
+    def __getitem__(self, key):
+        if key not in self._keys():
+            raise KeyError(key)
+        longitude = float(self._chart.longitudes[self._idx])
+        if key in ('longitude', 'position'):
+            return longitude
+        if key == 'sign':
+            return sign_of(longitude)
+        if key == 'degree':
+            return longitude % 30
+        if key == 'sign_degree':
+            return f"{int(longitude % 30):02d}°"
+        if key == 'note':
+            return STUB_NOTE
+        if key == 'house':
+            return int(self._chart.houses()[self._idx])
+        return f"{sign_of(longitude)} {int(longitude % 30):02d}°"
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def __repr__(self):
+        idx = self._idx
+        name = PLANET_NAMES[idx] if idx < len(PLANET_NAMES) else Point(idx).name.title()
+        longitude = float(self._chart.longitudes[idx])
+        return f"<{name} {longitude:.4f}° {sign_of(longitude)} {longitude % 30:.2f}°>"
+
+
+class _PlanetsView(Mapping):
+    """chart['planets']: имя планеты -> вид точки"""
+    __slots__ = ('_chart',)
+
+    def __init__(self, chart):
+        self._chart = chart
+
+    def __getitem__(self, name):
+        return _PointView(self._chart, PLANET_INDEX[name])
+
+    def __iter__(self):
+        return iter(PLANET_NAMES)
+
+    def __len__(self):
+        return len(PLANET_NAMES)
+
+
+class _HousesView(Mapping):
+    """chart['houses']: 'House_1'..'House_12' -> {'longitude', 'sign'}"""
+    __slots__ = ('_chart',)
+
+    def __init__(self, chart):
+        self._chart = chart
+
+    def __getitem__(self, key):
+        if not key.startswith('House_'):
+            raise KeyError(key)
+        number = int(key[6:])
+        if not 1 <= number <= 12:
+            raise KeyError(key)
+        longitude = float(self._chart.cusps[number - 1])
+        return {'longitude': longitude, 'sign': sign_of(longitude)}
+
+    def __iter__(self):
+        return (f'House_{i}' for i in range(1, 13))
+
+    def __len__(self):
+        return 12
+
+
+class ChartResult(Mapping):
+    """Результат расчета карты на __slots__ с массивом долгот"""
+    __slots__ = ('longitudes', 'cusps', 'stubs', 'name', 'year', 'month', 'day',
+                 'hour', 'minute', 'second', 'lat', 'lon', 'note')
+
+    _KEYS = ('planets', 'houses', 'ascendant', 'mc', 'info')
+
+    def __init__(self, longitudes, cusps, name, year, month, day, hour, minute,
+                 lat, lon, stubs=0, note=None, second=0):
+        self.longitudes = np.asarray(longitudes, dtype=np.float64) % 360
+        self.cusps = np.asarray(cusps, dtype=np.float64) % 360
+        self.longitudes.flags.writeable = False
+        self.cusps.flags.writeable = False
+        self.stubs = stubs  # битовая маска точек-заглушек
+        self.name = name
+        self.year, self.month, self.day = year, month, day
+        self.hour, self.minute, self.second = hour, minute, second
+        self.lat, self.lon = lat, lon
+        self.note = note
+
+    def __setstate__(self, state):
+        # Карты, сохраненные до появления секунд (кэш карт, user_data)
+        self.second = 0
+        for slot, value in state[1].items():
+            setattr(self, slot, value)
+
+    def is_stub(self, point):
+        """Точка не рассчитана и заполнена тестовым значением"""
+        return bool(self.stubs >> int(point) & 1)
+
+    def renamed(self, name):
+        """Копия карты для другого пользователя (массивы общие)"""
+        clone = object.__new__(ChartResult)
+        for slot in self.__slots__:
+            setattr(clone, slot, getattr(self, slot))
+        clone.name = name
+        return clone
+
+    # --- Доступ по точкам ---
+
+    def longitude(self, point):
+        return float(self.longitudes[point])
+
+    def sign(self, point):
+        return sign_of(self.longitudes[point])
+
+    def houses(self):
+        """Номера домов 1..12 всех точек (ASC в 1-м, MC обычно в 10-м)"""
+        return place_in_houses(self.longitudes, self.cusps)
+
+    def point(self, point, house=None):
+        """ChartPoint для точки (Point или имя планеты)"""
+        idx = PLANET_INDEX[point] if isinstance(point, str) else int(point)
+        key = PLANET_NAMES[idx] if idx < len(PLANET_NAMES) else Point(idx).name.title()
+        if house is None:
+            house = int(self.houses()[idx])
+        return ChartPoint(key, float(self.longitudes[idx]), house)
+
+    def planets(self):
+        """ChartPoint всех планет и точек (без ASC/MC) в порядке Point"""
+        houses = self.houses()
+        return [self.point(i, int(houses[i])) for i in range(len(PLANET_NAMES))]
+
+    @property
+    def info(self):
+        info = {
+            'name': self.name,
+            'date': f'{self.year}-{self.month:02d}-{self.day:02d}',
+            'time': f'{self.hour:02d}:{self.minute:02d}',
+            'coords': (self.lat, self.lon),
+            'source': 'Swiss Ephemeris',
+        }
+        if self.note:
+            info['note'] = self.note
+        return info
+
+    # --- Словарный вид для совместимости ---
+
+    def __getitem__(self, key):
+        if key == 'planets':
+            return _PlanetsView(self)
+        if key == 'houses':
+            return _HousesView(self)
+        if key == 'ascendant':
+            return _PointView(self, Point.ASC)
+        if key == 'mc':
+            return _PointView(self, Point.MC)
+        if key == 'info':
+            return self.info
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self):
+        return len(self._KEYS)
+
+    def __repr__(self):
+        return f"ChartResult({self.name!r}, {self.info['date']} {self.info['time']}:{self.second:02d} UT)"
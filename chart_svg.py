@@ -0,0 +1,257 @@
+# chart_svg.py
+"""
+Натальная карта в SVG без файлов на диске.
+
+Статичные слои - фон с кругами, зодиакальное кольцо с делениями и знаками,
+круг сетки домов и легенда - одинаковы для всех карт и собираются один раз
+на процесс. Для конкретной карты по заранее подготовленным шаблонам
+рисуются только заголовок, куспиды домов и планеты; все части соединяются
+одним join и кодируются в bytes, которые сразу уходят в send_document
+(при Config.CHART_SVG_GZIP - сжатыми в SVGZ).
+
+Долгота 0° (начало Овна) - сверху, знаки идут по часовой стрелке, как
+в прежней упрощенной карте.
+
+    python chart_svg.py bench --charts 2000
+"""
+
+import argparse
+import gzip
+import re
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from chart_result import PLANET_NAMES, Point
+from config import Config
+from data import TRANSLATE
+
+# Увеличивается при любом изменении шаблонов: кэш file_id карт сбрасывается
+TEMPLATE_VERSION = 1
+
+WIDTH, HEIGHT = 800, 1000
+CX, CY = 400, 450
+R_OUTER = 300       # внешний край зодиакального кольца
+R_SIGNS = 250       # внутренний край кольца
+R_PLANETS = 215     # орбита планет (ближе к центру - при скоплении)
+R_HOUSES = 150      # круг сетки домов
+PLANET_STEP = 26    # сдвиг планеты внутрь при соседстве ближе MIN_SEPARATION
+MIN_SEPARATION = 7.0
+
+# U+FE0E - текстовое (не эмодзи) начертание символа
+SIGN_GLYPHS = tuple(chr(0x2648 + i) + '\ufe0e' for i in range(12))
+SIGN_COLORS = ('#FF7043', '#A1887F', '#FFD54F', '#4FC3F7') * 3  # огонь, земля, воздух, вода
+PLANET_GLYPHS = {
+    'Sun': '☉', 'Moon': '☽', 'Mercury': '☿', 'Venus': '♀', 'Mars': '♂',
+    'Jupiter': '♃', 'Saturn': '♄', 'Uranus': '♅', 'Neptune': '♆', 'Pluto': '♇',
+    'Chiron': '⚷', 'Lilith': '⚸', 'Node': '☊', 'Selena': '○',
+}
+PLANET_COLORS = {
+    'Sun': '#FF9800', 'Moon': '#E1BEE7', 'Mercury': '#B0BEC5', 'Venus': '#F48FB1',
+    'Mars': '#EF5350', 'Jupiter': '#FFB74D', 'Saturn': '#A1887F', 'Uranus': '#4DD0E1',
+    'Neptune': '#7986CB', 'Pluto': '#BA68C8', 'Chiron': '#8BC34A', 'Lilith': '#6A1B9A',
+    'Node': '#90A4AE', 'Selena': '#FFFFFF',
+}
+
+# --- ШАБЛОНЫ ---
+
+_HEADER = (
+    '<text x="400" y="50" text-anchor="middle" fill="white" font-size="32">Натальная карта: {name}</text>\n'
+    '<text x="400" y="90" text-anchor="middle" fill="#64b5f6" font-size="18">{date} • {time}</text>\n'
+    '<text x="400" y="120" text-anchor="middle" fill="#bbbbbb" font-size="16">{city}</text>\n'
+).format
+_LINE = '<line x1="{:.1f}" y1="{:.1f}" x2="{:.1f}" y2="{:.1f}"/>\n'.format
+_CUSP = '<line x1="{:.1f}" y1="{:.1f}" x2="{:.1f}" y2="{:.1f}" stroke="{}" stroke-width="{}"/>\n'.format
+_TEXT = '<text x="{:.1f}" y="{:.1f}" fill="{}">{}</text>\n'.format
+_PLANET = (
+    '<circle cx="{x:.1f}" cy="{y:.1f}" r="11" fill="{color}"/>'
+    '<text x="{x:.1f}" y="{y:.1f}" dy=".35em" font-size="14" fill="#0a0a2a">{glyph}</text>'
+    '<text x="{lx:.1f}" y="{ly:.1f}" dy=".35em" font-size="10" fill="#cccccc">{degree}°</text>\n'
+).format
+_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&apos;'})
+
+
+def _xy(longitudes, radius):
+    """Координаты точек круга радиуса radius для долгот (массив)"""
+    angles = np.radians(np.asarray(longitudes, dtype=np.float64) - 90)
+    return CX + radius * np.cos(angles), CY + radius * np.sin(angles)
+
+
+def escape(text):
+    return str(text).translate(_ESCAPES)
+
+
+# --- СТАТИЧНЫЕ СЛОИ (один раз на процесс) ---
+
+@lru_cache(maxsize=None)
+def svg_prefix():
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<svg width="{WIDTH}" height="{HEIGHT}" xmlns="http://www.w3.org/2000/svg" font-family="Arial">\n'
+        '<rect width="100%" height="100%" fill="#0a0a2a"/>\n'
+    )
+
+
+@lru_cache(maxsize=None)
+def zodiac_ring():
+    """Кольцо знаков: границы, деления через 5° и символы знаков"""
+    parts = [
+        '<g fill="none" stroke="#3d5afe" stroke-width="2">\n',
+        f'<circle cx="{CX}" cy="{CY}" r="{R_OUTER}"/>\n',
+        f'<circle cx="{CX}" cy="{CY}" r="{R_SIGNS}"/>\n',
+    ]
+    bounds = np.arange(0, 360, 30)
+    parts += map(_LINE, *_xy(bounds, R_SIGNS), *_xy(bounds, R_OUTER))
+    parts.append('</g>\n<g stroke="#3d5afe" stroke-width="1">\n')
+    ticks = np.array([d for d in range(0, 360, 5) if d % 30])
+    parts += map(_LINE, *_xy(ticks, R_SIGNS), *_xy(ticks, R_SIGNS + 6))
+    parts.append('</g>\n<g font-size="24" text-anchor="middle" dominant-baseline="central">\n')
+    parts += map(_TEXT, *_xy(bounds + 15, (R_SIGNS + R_OUTER) / 2), SIGN_COLORS, SIGN_GLYPHS)
+    parts.append('</g>\n')
+    return ''.join(parts)
+
+
+@lru_cache(maxsize=None)
+def house_grid():
+    """Круг сетки домов (куспиды рисуются для каждой карты)"""
+    return (f'<circle cx="{CX}" cy="{CY}" r="{R_HOUSES}" fill="none" '
+            f'stroke="#3d5afe" stroke-width="1.5"/>\n')
+
+
+@lru_cache(maxsize=None)
+def legend():
+    """Легенда: цвета и символы точек в две колонки, подпись внизу"""
+    top = CY + R_OUTER + 30
+    rows = (len(PLANET_NAMES) + 1) // 2
+    parts = [f'<rect x="50" y="{top}" width="700" height="{rows * 24 + 20}" rx="10" fill="#1a1a2e"/>\n'
+             '<g font-size="15">\n']
+    for i, key in enumerate(PLANET_NAMES):
+        x = 75 + (i // rows) * 350
+        y = top + 22 + (i % rows) * 24
+        parts.append(
+            f'<circle cx="{x}" cy="{y - 5}" r="7" fill="{PLANET_COLORS[key]}"/>'
+            f'<text x="{x + 16}" y="{y}" fill="white">{PLANET_GLYPHS[key]} {escape(TRANSLATE.get(key, key))}</text>\n')
+    parts.append('</g>\n<text x="400" y="985" text-anchor="middle" fill="#666666" font-size="12">'
+                 'Натальный Гид 2026 • Полный астрологический анализ</text>\n</svg>\n')
+    return ''.join(parts)
+
+
+_PLANET_STYLE = [(PLANET_GLYPHS[key], PLANET_COLORS[key]) for key in PLANET_NAMES]
+
+
+# --- КАРТА ---
+
+def _planet_radii(longitudes):
+    """Радиусы орбит: соседние ближе MIN_SEPARATION планеты сдвигаются внутрь"""
+    order = np.argsort(longitudes)
+    radii = np.full(len(longitudes), float(R_PLANETS))
+    level = 0
+    for prev, cur in zip(order, order[1:]):
+        level = (level + 1) % 3 if longitudes[cur] - longitudes[prev] < MIN_SEPARATION else 0
+        radii[cur] = R_PLANETS - level * PLANET_STEP
+    return radii
+
+
+def _cusps(cusps):
+    """Куспиды от круга домов к кольцу знаков и номера домов"""
+    parts = ['<g>\n']
+    x1, y1 = _xy(cusps, R_HOUSES)
+    x2, y2 = _xy(cusps, R_SIGNS)
+    for i in range(12):
+        # ASC (1-й дом) и MC (10-й) выделены
+        stroke, width = ('#FFD54F', 2.5) if i in (0, 9) else ('#5c6bc0', 1)
+        parts.append(_CUSP(x1[i], y1[i], x2[i], y2[i], stroke, width))
+    middles = cusps + ((np.roll(cusps, -1) - cusps) % 360) / 2
+    parts.append('</g>\n<g font-size="13" text-anchor="middle" dominant-baseline="central">\n')
+    parts += map(_TEXT, *_xy(middles, R_HOUSES - 18), ['#9fa8da'] * 12, range(1, 13))
+    parts.append('</g>\n')
+    return parts
+
+
+def _planets(chart):
+    """Планеты с символами и градусом в знаке (точки-заглушки не рисуются)"""
+    shown = [i for i in range(len(PLANET_NAMES)) if not chart.is_stub(i)]
+    longitudes = chart.longitudes[shown]
+    radii = _planet_radii(longitudes)
+    x, y = _xy(longitudes, radii)
+    lx, ly = _xy(longitudes, radii - 20)
+    degrees = (longitudes % 30).astype(int)
+    parts = ['<g text-anchor="middle">\n']
+    for j, i in enumerate(shown):
+        glyph, color = _PLANET_STYLE[i]
+        parts.append(_PLANET(x=x[j], y=y[j], lx=lx[j], ly=ly[j],
+                             color=color, glyph=glyph, degree=degrees[j]))
+    parts.append('</g>\n')
+    return parts
+
+
+def render_chart_svg(chart, name, date_str, time_str, city_name):
+    """SVG карты ChartResult в bytes (UTF-8)"""
+    parts = [svg_prefix(),
+             _HEADER(name=escape(name), date=escape(date_str), time=escape(time_str), city=escape(city_name)),
+             zodiac_ring(), house_grid()]
+    parts += _cusps(chart.cusps)
+    parts += _planets(chart)
+    parts.append(legend())
+    return ''.join(parts).encode('utf-8')
+
+
+def chart_document(chart, name, date_str, time_str, city_name, compress=None):
+    """Документ для отправки: (bytes, имя файла); SVGZ, если compress"""
+    if compress is None:
+        compress = Config.CHART_SVG_GZIP
+    svg = render_chart_svg(chart, name, date_str, time_str, city_name)
+    safe_name = re.sub(r'[^\w]', '_', name)[:20]
+    if compress:
+        # mtime=0 - одинаковая карта дает одинаковые байты
+        return gzip.compress(svg, compresslevel=9, mtime=0), f"Натальная_карта_{safe_name}.svgz"
+    return svg, f"Натальная_карта_{safe_name}.svg"
+
+
+# --- КОМАНДНАЯ СТРОКА ---
+
+def _random_chart(rng):
+    from chart_result import ChartResult
+
+    # Равнодомная сетка от случайного асцендента
+    longitudes = rng.uniform(0, 360, len(Point))
+    cusps = (longitudes[Point.ASC] + np.arange(12) * 30) % 360
+    longitudes[Point.MC] = cusps[9]
+    return ChartResult(longitudes, cusps, 'Тест', 2000, 1, 1, 12, 0, 55.75, 37.62)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отрисовка натальной карты в SVG")
+    sub = parser.add_subparsers(dest='command', required=True)
+    bench = sub.add_parser('bench', help="скорость отрисовки")
+    bench.add_argument('--charts', type=int, default=2000)
+    render = sub.add_parser('render', help="случайная карта в файл")
+    render.add_argument('-o', '--output', default='chart.svg')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    if args.command == 'render':
+        data, _ = chart_document(_random_chart(rng), 'Тест', '2000-01-01', '12:00', 'Москва',
+                                 compress=args.output.endswith('.svgz'))
+        with open(args.output, 'wb') as f:
+            f.write(data)
+        print(f"{args.output}: {len(data)} байт")
+        return
+
+    charts = [_random_chart(rng) for _ in range(args.charts)]
+    began = time.perf_counter()
+    svg = render_chart_svg(charts[0], 'Тест', '2000-01-01', '12:00', 'Москва')
+    first = time.perf_counter() - began
+    began = time.perf_counter()
+    for chart in charts:
+        svg = render_chart_svg(chart, 'Тест', '2000-01-01', '12:00', 'Москва')
+    elapsed = time.perf_counter() - began
+    packed = gzip.compress(svg, compresslevel=9, mtime=0)
+    print(f"Первая карта (со статичными слоями): {first * 1000:.2f} мс")
+    print(f"{args.charts} карт: {elapsed / args.charts * 1e6:.0f} мкс на карту")
+    print(f"Размер: SVG {len(svg)} байт, SVGZ {len(packed)} байт")
+
+
+if __name__ == '__main__':
+    main()
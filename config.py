@@ -1,9 +1,114 @@
 # config.py
+import os
+
+
 class Config:
     MAX_CITY_ATTEMPTS = 3
     TIMEOUT_SECONDS = 30
     CACHE_SIZE = 100
     SUPPORTED_COUNTRIES = ['RU', 'US', 'UA', 'BY', 'KZ']
-    
+
+    # Пул процессов для расчетов Swiss Ephemeris (0 = по числу ядер)
+    CALC_WORKERS = int(os.getenv('CALC_WORKERS', '0')) or os.cpu_count() or 1
+
+    # Постоянный кэш геокодирования (в Docker лежит в томе ./data)
+    GEOCODE_CACHE_PATH = os.getenv('GEOCODE_CACHE_PATH', 'cache/geocode_cache.sqlite')
+    GEOCODE_CACHE_TTL = 30 * 24 * 3600       # найденные города - 30 дней
+    GEOCODE_NEGATIVE_TTL = 24 * 3600         # "не найдено" - 1 день
+    GEOCODE_CACHE_MAX_ENTRIES = 50000
+    # Не чаще одного запроса к Nominatim за столько секунд (правила сервиса)
+    NOMINATIM_MIN_INTERVAL = 1.0
+
+    # Офлайн-геокодер по GeoNames (собирается командой python gazetteer.py build)
+    GAZETTEER_PATH = os.getenv('GAZETTEER_PATH', 'data/gazetteer.idx')
+    # Город без страны берется из индекса, только если он такой один или
+    # крупнее этого; иначе ("Париж", "Лондон") - Nominatim по всему миру
+    GAZETTEER_MIN_POPULATION = 100000
+
+    # Часовые пояса: шаг сетки кэша (градусы), размер кэша, загрузка в память при старте
+    TIMEZONE_GRID_STEP = 0.1
+    TIMEZONE_CACHE_SIZE = 20000
+    TIMEZONE_IN_MEMORY = os.getenv('TIMEZONE_PRELOAD', '0') == '1'
+    # Растр поясов (собирается командой python tz_raster.py build)
+    TIMEZONE_RASTER_PATH = os.getenv('TIMEZONE_RASTER_PATH', 'data/tz_raster.bin')
+
+    # Кэш рассчитанных карт: LRU в памяти и необязательный SQLite на диске
+    CHART_CACHE_MAX_ENTRIES = 10000
+    CHART_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    CHART_CACHE_PATH = os.getenv('CHART_CACHE_PATH', '')
+    CHART_CACHE_DB_MAX_ENTRIES = 500000
+    CHART_CACHE_DB_MAX_BYTES = 1024 * 1024 * 1024
+
+    # Аспекты: орбы (градусы) по аспектам и множители орбов для точек карты.
+    # Орб пары - больший из орбов двух точек; ASPECT_ORB_OVERRIDES задает
+    # орб конкретной точки для конкретного аспекта: {'Moon': {'Conj': 10}}
+    ASPECT_ORBS = {'Conj': 8.0, 'Sext': 4.0, 'Squa': 6.0, 'Trine': 6.0, 'Oppo': 8.0}
+    ASPECT_POINT_FACTORS = {
+        'Sun': 1.25, 'Moon': 1.25,
+        'Chiron': 0.5, 'Lilith': 0.5, 'Node': 0.5, 'Selena': 0.5,
+    }
+    ASPECT_ORB_OVERRIDES = {}
+    ASPECTS_IN_REPORT = 12
+
+    # Ежедневная рассылка транзитов (/subscribe)
+    SUBSCRIPTIONS_PATH = os.getenv('SUBSCRIPTIONS_PATH', 'cache/subscriptions.sqlite')
+    DIGEST_TIME_UTC = os.getenv('DIGEST_TIME_UTC', '06:00')
+    DIGEST_ORB = 1.0              # орб транзитных аспектов в рассылке (градусы)
+    DIGEST_MAX_ASPECTS = 8        # аспектов в одном сообщении
+    DIGEST_BATCH_SIZE = 1000      # подписчиков, читаемых из базы за раз
+
+    # Лунный календарь (собирается командой python lunar_calendar.py build)
+    LUNAR_CALENDAR_PATH = os.getenv('LUNAR_CALENDAR_PATH', 'data/lunar_calendar.bin')
+    LUNAR_CALENDAR_START_YEAR = 1900
+    LUNAR_CALENDAR_END_YEAR = 2100
+
+    # Очередь исходящих сообщений: лимиты Telegram ~30 сообщений в секунду
+    # на бота и ~1 в секунду в один чат (с небольшим всплеском)
+    OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '25'))
+    OUTBOUND_GLOBAL_BURST = 25
+    OUTBOUND_CHAT_RATE = 1.0
+    OUTBOUND_CHAT_BURST = 3
+    OUTBOUND_MAX_RETRIES = 5
+    OUTBOUND_BACKOFF_BASE = 1.0   # секунд, удваивается с каждой попыткой
+    OUTBOUND_BACKOFF_MAX = 30.0
+    OUTBOUND_MAX_CHATS = 10000    # чатов в памяти до очистки простаивающих
+
+    # Режим webhook: если задан публичный WEBHOOK_URL (https://host/path) -
+    # встроенный HTTP-сервер вместо long polling
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+    WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+    WEBHOOK_MAX_CONNECTIONS = 40
+    # Принятых и еще не обработанных обновлений (дальше - 503 для Telegram)
+    UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', '1000'))
+    # Обновлений, обрабатываемых одновременно (в одном чате - по порядку)
+    CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '64'))
+    # Адреса Bot API (для проверки против локального фейкового сервера)
+    TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org/bot')
+    TELEGRAM_FILE_URL = os.getenv('TELEGRAM_FILE_URL', 'https://api.telegram.org/file/bot')
+
+    # Состояние диалогов и user_data между перезапусками и шардами:
+    # 'sqlite', 'pickle' или 'none'
+    PERSISTENCE = os.getenv('PERSISTENCE', 'sqlite')
+    PERSISTENCE_PATH = os.getenv('PERSISTENCE_PATH', 'cache/bot_state.sqlite')
+    # Файл бэкенда 'pickle' (только один процесс, без шардов)
+    PERSISTENCE_PICKLE_PATH = os.getenv('PERSISTENCE_PICKLE_PATH', 'cache/bot_state.pickle')
+    PERSISTENCE_INTERVAL = 5      # секунд между сбросами user_data/chat_data на диск
+    # Шардирование по chat id (только в режиме webhook): маршрутизатор на
+    # WEBHOOK_PORT и SHARDS процессов на WEBHOOK_PORT + 1 ... или, если
+    # заданы SHARD_URLS (http://host:port через запятую), - шарды на других хостах
+    # (запускаются с тем же WEBHOOK_SECRET, своим SHARD_INDEX и SHARDS, см. sharding.py)
+    SHARD_URLS = [url.strip() for url in os.getenv('SHARD_URLS', '').split(',') if url.strip()]
+    SHARDS = int(os.getenv('SHARDS', '0')) or len(SHARD_URLS) or 1
+    SHARD_INDEX = int(os.getenv('SHARD_INDEX')) if os.getenv('SHARD_INDEX') else None
+
+    # Карта SVG отправляется сжатой (SVGZ)
+    CHART_SVG_GZIP = os.getenv('CHART_SVG_GZIP', '0') == '1'
+    # file_id отправленных карт: повторная карта уходит без загрузки
+    FILE_ID_CACHE_PATH = os.getenv('FILE_ID_CACHE_PATH', 'cache/file_ids.sqlite')
+    FILE_ID_CACHE_TTL = 180 * 24 * 3600
+    FILE_ID_CACHE_MAX_ENTRIES = 100000
+
     # Шаблоны сообщений
-    GREETINGS = "🌟 <b>Натальный Гид 2026</b>..."
\ No newline at end of file
+    GREETINGS = "🌟 <b>Натальный Гид 2026</b>..."
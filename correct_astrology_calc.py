@@ -4,6 +4,16 @@ from datetime import datetime
 import logging
 import sys
 import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import NamedTuple
+
+import numpy as np
+
+from config import Config
+from chart_result import ChartResult, Point, PLANET_NAMES, PLANET_INDEX, N_POINTS, sign_of
 
 logger = logging.getLogger(__name__)
 
@@ -81,7 +91,7 @@ if not HAS_SWISSEPH:
             return jd
         
         @staticmethod
-        def calc_ut(jd, planet):
+        def calc_ut(jd, planet, flags=0):
             # Тестовые данные для astro.com (25.07.1987 12:00)
             test_data = {
                 0: 121.826,   # SUN
@@ -121,234 +131,301 @@ if not HAS_SWISSEPH:
     swe = SwissStub()
     HAS_SWISSEPH = True
 
+# Параметры расчета (входят в ключ кэша карт)
+HOUSE_SYSTEM = b'P'  # Placidus
+CALC_FLAGS = getattr(swe, 'FLG_SWIEPH', 2) | getattr(swe, 'FLG_SPEED', 256)
+
+
+# Планеты в Swiss Ephemeris
+PLANET_CODES = {
+    'Sun': swe.SUN,           # 0
+    'Moon': swe.MOON,         # 1
+    'Mercury': swe.MERCURY,   # 2
+    'Venus': swe.VENUS,       # 3
+    'Mars': swe.MARS,         # 4
+    'Jupiter': swe.JUPITER,   # 5
+    'Saturn': swe.SATURN,     # 6
+    'Uranus': swe.URANUS,     # 7
+    'Neptune': swe.NEPTUNE,   # 8
+    'Pluto': swe.PLUTO,       # 9
+    'Chiron': swe.CHIRON,     # 15
+    'Lilith': swe.MEAN_APOG,  # 12
+    'Node': swe.MEAN_NODE,    # 10
+}
+
+# Библиотека Swiss Ephemeris не потокобезопасна - один замок на процесс
+_SWE_LOCK = threading.RLock()
+
+
+class EphemerisEngine:
+    """Долгоживущий движок Swiss Ephemeris.
+
+    Инициализируется один раз на процесс, не закрывает эфемериды между
+    расчетами (файлы и внутренние кэши библиотеки остаются "теплыми")
+    и сериализует обращения к C-библиотеке.
+    """
+
+    def __init__(self, ephe_path=''):
+        self.ephe_path = ephe_path
+        self._initialized = False
+
+    def _ensure_initialized(self):
+        if not self._initialized:
+            swe.set_ephe_path(self.ephe_path)
+            self._initialized = True
+            logger.info("Swiss Ephemeris инициализирован")
+
+    def julday(self, year, month, day, hour):
+        """Юлианская дата (время - UT в часах)"""
+        return swe.julday(year, month, day, hour)
+
+    def calc_body(self, jd, code, flags=CALC_FLAGS):
+        """Позиция одного тела: (долгота, широта, расстояние, скорости...)"""
+        with _SWE_LOCK:
+            self._ensure_initialized()
+            pos, _ = swe.calc_ut(jd, code, flags)
+        return pos
+
+    def calc_points(self, jd, points=None, flags=CALC_FLAGS):
+        """Позиции точек карты: {имя: позиция} (None, если расчет не удался)"""
+        results = {}
+        with _SWE_LOCK:
+            self._ensure_initialized()
+            for planet_name in points or PLANET_CODES:
+                try:
+                    pos, _ = swe.calc_ut(jd, PLANET_CODES[planet_name], flags)
+                    results[planet_name] = pos if pos and len(pos) > 0 else None
+                except Exception as e:
+                    logger.warning(f"Ошибка расчета {planet_name}: {e}")
+                    results[planet_name] = None
+        return results
+
+    def calc_houses(self, jd, lat, lon, house_system=HOUSE_SYSTEM):
+        """Куспиды домов и (ASC, MC, ...)"""
+        with _SWE_LOCK:
+            self._ensure_initialized()
+            return swe.houses(jd, lat, lon, house_system)
+
+    def calc_chart(self, jd, lat, lon, house_system=HOUSE_SYSTEM, flags=CALC_FLAGS):
+        """Точки и дома одной карты за один захват замка"""
+        with _SWE_LOCK:
+            points = self.calc_points(jd, flags=flags)
+            cusps, ascmc = self.calc_houses(jd, lat, lon, house_system)
+        return {'points': points, 'cusps': cusps, 'ascmc': ascmc}
 
-def calculate_correct_positions(name, year, month, day, hour, minute, lat, lon):
-    """Точный астрологический расчет через Swiss Ephemeris"""
+    def close(self):
+        """Закрывает эфемериды (при завершении процесса)"""
+        with _SWE_LOCK:
+            if self._initialized:
+                swe.close()
+                self._initialized = False
+
+
+_engine = None
+
+
+def get_engine():
+    """Движок Swiss Ephemeris текущего процесса"""
+    global _engine
+    if _engine is None:
+        with _SWE_LOCK:
+            if _engine is None:
+                _engine = EphemerisEngine()
+    return _engine
+
+
+def calculate_correct_positions(name, year, month, day, hour, minute, lat, lon, second=0):
+    """Точный астрологический расчет через Swiss Ephemeris (время - UT)"""
     
     if not HAS_SWISSEPH:
         logger.error("Swiss Ephemeris не доступен")
-        return get_error_data(name, year, month, day, hour, minute, lat, lon)
+        return get_error_data(name, year, month, day, hour, minute, lat, lon, second)
     
     try:
-        # Инициализация Swiss Ephemeris
-        swe.set_ephe_path('')
+        engine = get_engine()
         
         # Преобразуем время в юлианскую дату
-        utc_time = hour + minute/60.0
-        jd = swe.julday(year, month, day, utc_time)
+        utc_time = hour + minute/60.0 + second/3600.0
+        jd = engine.julday(year, month, day, utc_time)
         
-        # Планеты в Swiss Ephemeris
-        PLANET_CODES = {
-            'Sun': swe.SUN,           # 0
-            'Moon': swe.MOON,         # 1
-            'Mercury': swe.MERCURY,   # 2
-            'Venus': swe.VENUS,       # 3
-            'Mars': swe.MARS,         # 4
-            'Jupiter': swe.JUPITER,   # 5
-            'Saturn': swe.SATURN,     # 6
-            'Uranus': swe.URANUS,     # 7
-            'Neptune': swe.NEPTUNE,   # 8
-            'Pluto': swe.PLUTO,       # 9
-            'Chiron': swe.CHIRON,     # 15
-            'Lilith': swe.MEAN_APOG,  # 12
-            'Node': swe.MEAN_NODE,    # 10
-        }
-        
-        results = {
-            'planets': {},
-            'houses': {},
-            'info': {
-                'name': name,
-                'date': f'{year}-{month:02d}-{day:02d}',
-                'time': f'{hour:02d}:{minute:02d}',
-                'coords': (lat, lon),
-                'source': 'Swiss Ephemeris'
-            }
-        }
+        longitudes = np.empty(N_POINTS)
+        stubs = 0
         
         # Рассчитываем позиции планет
-        for planet_name, planet_code in PLANET_CODES.items():
-            try:
-                pos, flags = swe.calc_ut(jd, planet_code)
-                if pos and len(pos) > 0:
-                    longitude = pos[0] % 360
-                    
-                    results['planets'][planet_name] = {
-                        'longitude': longitude,
-                        'position': longitude,
-                        'sign': get_sign_from_longitude(longitude),
-                        'degree': longitude % 30,
-                        'sign_degree': f"{int(longitude % 30):02d}°",
-                        'full_position': f"{get_sign_from_longitude(longitude)} {int(longitude % 30):02d}°"
-                    }
-                    logger.debug(f"{planet_name}: {longitude:.3f}°")
-                    
-            except Exception as e:
-                logger.warning(f"Ошибка расчета {planet_name}: {e}")
-                # Создаем заглушку
-                results['planets'][planet_name] = create_planet_stub(planet_name)
+        for planet_name, pos in engine.calc_points(jd).items():
+            idx = PLANET_INDEX[planet_name]
+            if pos is None:
+                # Заглушка
+                longitudes[idx] = STUB_POSITIONS[planet_name]
+                stubs |= 1 << idx
+                continue
+            longitudes[idx] = pos[0] % 360
+            logger.debug(f"{planet_name}: {longitudes[idx]:.3f}°")
         
         # Селена (оппозиция Лилит)
-        if 'Lilith' in results['planets']:
-            lilith_long = results['planets']['Lilith']['longitude']
-            selena_long = (lilith_long + 180) % 360
-            results['planets']['Selena'] = {
-                'longitude': selena_long,
-                'position': selena_long,
-                'sign': get_sign_from_longitude(selena_long),
-                'degree': selena_long % 30,
-                'sign_degree': f"{int(selena_long % 30):02d}°",
-                'full_position': f"{get_sign_from_longitude(selena_long)} {int(selena_long % 30):02d}°"
-            }
+        longitudes[Point.SELENA] = (longitudes[Point.LILITH] + 180) % 360
+        if stubs >> Point.LILITH & 1:
+            stubs |= 1 << Point.SELENA
         
         # Рассчитываем дома (система Placidus)
         try:
-            houses = swe.houses(jd, lat, lon, b'P')  # 'P' = Placidus
-            
-            if houses and len(houses) >= 2:
-                house_cusps = houses[0]  # Куспиды домов
-                ascmc = houses[1]        # ASC, MC и др.
-                
-                # Куспиды домов (1-12)
-                for i in range(12):
-                    if i < len(house_cusps):
-                        house_long = house_cusps[i] % 360
-                        results['houses'][f'House_{i+1}'] = {
-                            'longitude': house_long,
-                            'sign': get_sign_from_longitude(house_long)
-                        }
-                
-                # ASC и MC
-                if len(ascmc) >= 2:
-                    ascendant = ascmc[0] % 360
-                    mc = ascmc[1] % 360
-                    
-                    results['ascendant'] = {
-                        'longitude': ascendant,
-                        'sign': get_sign_from_longitude(ascendant),
-                        'degree': ascendant % 30,
-                        'full': f"{get_sign_from_longitude(ascendant)} {int(ascendant % 30):02d}°"
-                    }
-                    results['mc'] = {
-                        'longitude': mc,
-                        'sign': get_sign_from_longitude(mc),
-                        'degree': mc % 30,
-                        'full': f"{get_sign_from_longitude(mc)} {int(mc % 30):02d}°"
-                    }
-                    
+            cusps, ascmc = engine.calc_houses(jd, lat, lon)
+            cusps = cusps[:12]
+            longitudes[Point.ASC] = ascmc[0]
+            longitudes[Point.MC] = ascmc[1]
             logger.info(f"Дома рассчитаны успешно")
             
         except Exception as e:
             logger.error(f"Ошибка расчета домов: {e}")
-            create_default_houses(results, lat, lon)
+            cusps, longitudes[Point.ASC], longitudes[Point.MC] = create_default_houses()
         
-        swe.close()
         logger.info(f"Расчет завершен для {name}")
-        return results
+        return ChartResult(longitudes, cusps, name, year, month, day, hour, minute,
+                           lat, lon, stubs=stubs, second=second)
         
     except Exception as e:
         logger.error(f"Ошибка Swiss Ephemeris: {e}", exc_info=True)
-        return get_error_data(name, year, month, day, hour, minute, lat, lon)
+        return get_error_data(name, year, month, day, hour, minute, lat, lon, second)
+
+
+# Порядок точек в колоночных (пакетных) результатах
+POINT_NAMES = PLANET_NAMES
+
+# Поля записи рождения (время - UT); секунды можно не указывать
+BIRTH_FIELDS = ('year', 'month', 'day', 'hour', 'minute', 'lat', 'lon', 'second')
 
 
-def get_error_data(name, year, month, day, hour, minute, lat, lon):
+class ChartBatch(NamedTuple):
+    """Колоночный результат пакетного расчета (одна пачка записей)"""
+    start: int              # номер первой записи пачки во входном потоке
+    jd: np.ndarray          # (n,) юлианский день UT
+    longitudes: np.ndarray  # (n, len(POINT_NAMES)), NaN - точка не рассчитана
+    speeds: np.ndarray      # (n, len(POINT_NAMES)) градусов в сутки
+    cusps: np.ndarray       # (n, 12)
+    asc: np.ndarray         # (n,)
+    mc: np.ndarray          # (n,)
+
+
+def _birth_row(birth):
+    """Запись рождения (кортеж, dict или строка массива) -> 8 чисел"""
+    if isinstance(birth, dict):
+        return [float(birth.get(field, 0)) for field in BIRTH_FIELDS]
+    row = [float(value) for value in birth]
+    return row + [0.0] * (len(BIRTH_FIELDS) - len(row))
+
+
+def _calculate_chunk(args):
+    """Рассчитывает пачку записей (выполняется в процессе пула)"""
+    start, rows = args
+    engine = get_engine()
+    n = len(rows)
+    jd = np.empty(n)
+    longitudes = np.full((n, len(POINT_NAMES)), np.nan)
+    speeds = np.full((n, len(POINT_NAMES)), np.nan)
+    cusps = np.full((n, 12), np.nan)
+    asc = np.full(n, np.nan)
+    mc = np.full(n, np.nan)
+    lilith = POINT_NAMES.index('Lilith')
+
+    for i, (year, month, day, hour, minute, lat, lon, second) in enumerate(rows):
+        jd[i] = engine.julday(int(year), int(month), int(day), hour + minute / 60.0 + second / 3600.0)
+        try:
+            chart = engine.calc_chart(jd[i], lat, lon)
+        except Exception as e:
+            logger.warning(f"Ошибка расчета записи {start + i}: {e}")
+            continue
+        for j, name in enumerate(POINT_NAMES[:-1]):
+            pos = chart['points'][name]
+            if pos is not None:
+                longitudes[i, j] = pos[0] % 360
+                speeds[i, j] = pos[3] if len(pos) > 3 else np.nan
+        cusps[i] = np.asarray(chart['cusps'][:12]) % 360
+        asc[i] = chart['ascmc'][0] % 360
+        mc[i] = chart['ascmc'][1] % 360
+
+    # Селена - оппозиция Лилит
+    longitudes[:, -1] = (longitudes[:, lilith] + 180) % 360
+    speeds[:, -1] = speeds[:, lilith]
+    return ChartBatch(start, jd, longitudes, speeds, cusps, asc, mc)
+
+
+def calculate_many(births, chunk_size=1024, workers=None):
+    """Пакетный расчет карт: генератор колоночных ChartBatch по пачкам.
+
+    births - любой итерируемый источник записей (year, month, day, hour,
+    minute, lat, lon[, second]) во времени UT: кортежи, dict или массив
+    NumPy формы (n, 7|8). Записи читаются пачками, в работе одновременно
+    не больше 2 пачек на процесс, поэтому память не растет с числом записей.
+    workers=1 - расчет в текущем процессе без пула.
+    """
+    workers = workers or Config.CALC_WORKERS
+    records = iter(births)
+
+    def chunks():
+        start = 0
+        while True:
+            rows = [_birth_row(b) for b in islice(records, chunk_size)]
+            if not rows:
+                return
+            yield start, rows
+            start += len(rows)
+
+    if workers <= 1:
+        for chunk in chunks():
+            yield _calculate_chunk(chunk)
+        return
+
+    from calc_service import _init_worker
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        pending = deque()
+        for chunk in chunks():
+            pending.append(executor.submit(_calculate_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def get_error_data(name, year, month, day, hour, minute, lat, lon, second=0):
     """Данные при ошибке Swiss Ephemeris"""
     logger.error("Используем данные об ошибке")
     
-    results = {
-        'planets': {},
-        'houses': {},
-        'ascendant': {'longitude': 0, 'sign': 'Aries', 'degree': 0},
-        'mc': {'longitude': 0, 'sign': 'Aries', 'degree': 0},
-        'info': {
-            'name': name,
-            'date': f'{year}-{month:02d}-{day:02d}',
-            'time': f'{hour:02d}:{minute:02d}',
-            'coords': (lat, lon),
-            'note': '❌ ОШИБКА: Установите Swiss Ephemeris (pip install pyswisseph)'
-        }
-    }
-    
-    # Создаем заглушки для всех планет
-    planet_names = ['Sun', 'Moon', 'Mercury', 'Venus', 'Mars', 'Jupiter', 
-                   'Saturn', 'Uranus', 'Neptune', 'Pluto', 'Chiron', 'Lilith', 'Node']
-    
-    for planet in planet_names:
-        results['planets'][planet] = create_planet_stub(planet)
-    
-    # Селена
-    results['planets']['Selena'] = create_planet_stub('Selena')
+    # Заглушки для всех планет
+    longitudes = np.empty(N_POINTS)
+    for planet_name in PLANET_NAMES:
+        longitudes[PLANET_INDEX[planet_name]] = STUB_POSITIONS[planet_name]
     
-    create_default_houses(results, lat, lon)
+    cusps, longitudes[Point.ASC], longitudes[Point.MC] = create_default_houses()
     
-    return results
+    return ChartResult(
+        longitudes, cusps, name, year, month, day, hour, minute, lat, lon,
+        stubs=(1 << len(PLANET_NAMES)) - 1,
+        note='❌ ОШИБКА: Установите Swiss Ephemeris (pip install pyswisseph)',
+        second=second
+    )
 
 
-def create_planet_stub(planet_name):
-    """Создает заглушку для планеты"""
-    # Примерные позиции для демонстрации
-    stub_positions = {
-        'Sun': 120.0, 'Moon': 45.0, 'Mercury': 135.0, 'Venus': 95.0,
-        'Mars': 210.0, 'Jupiter': 280.0, 'Saturn': 320.0, 'Uranus': 65.0,
-        'Neptune': 335.0, 'Pluto': 12.0, 'Chiron': 180.0, 'Lilith': 185.0,
-        'Node': 90.0, 'Selena': 5.0
-    }
-    
-    longitude = stub_positions.get(planet_name, 0)
-    
-    return {
-        'longitude': longitude,
-        'position': longitude,
-        'sign': get_sign_from_longitude(longitude),
-        'degree': longitude % 30,
-        'sign_degree': f"{int(longitude % 30):02d}°",
-        'full_position': f"{get_sign_from_longitude(longitude)} {int(longitude % 30):02d}°",
-        'note': 'ТЕСТОВЫЕ ДАННЫЕ (установите pyswisseph)'
-    }
+# Примерные позиции для демонстрации (если планету не удалось рассчитать)
+STUB_POSITIONS = {
+    'Sun': 120.0, 'Moon': 45.0, 'Mercury': 135.0, 'Venus': 95.0,
+    'Mars': 210.0, 'Jupiter': 280.0, 'Saturn': 320.0, 'Uranus': 65.0,
+    'Neptune': 335.0, 'Pluto': 12.0, 'Chiron': 180.0, 'Lilith': 185.0,
+    'Node': 90.0, 'Selena': 5.0
+}
 
 
-def create_default_houses(results, lat, lon):
-    """Создает дома по умолчанию"""
+def create_default_houses():
+    """Дома по умолчанию: (куспиды, ASC, MC)"""
     # Равнодомная система для теста
     asc_long = 45.0  # Телец
-    
-    results['ascendant'] = {
-        'longitude': asc_long,
-        'sign': get_sign_from_longitude(asc_long),
-        'degree': asc_long % 30,
-        'full': f"{get_sign_from_longitude(asc_long)} {int(asc_long % 30):02d}°"
-    }
-    
     mc_long = (asc_long + 90) % 360
-    results['mc'] = {
-        'longitude': mc_long,
-        'sign': get_sign_from_longitude(mc_long),
-        'degree': mc_long % 30,
-        'full': f"{get_sign_from_longitude(mc_long)} {int(mc_long % 30):02d}°"
-    }
-    
-    for i in range(12):
-        house_long = (asc_long + i * 30) % 360
-        results['houses'][f'House_{i+1}'] = {
-            'longitude': house_long,
-            'sign': get_sign_from_longitude(house_long)
-        }
+    cusps = [(asc_long + i * 30) % 360 for i in range(12)]
+    return cusps, asc_long, mc_long
 
 
 def get_sign_from_longitude(longitude):
     """Определяет знак зодиака по долготе"""
-    signs = [
-        (0, 30, 'Aries'), (30, 60, 'Taurus'), (60, 90, 'Gemini'),
-        (90, 120, 'Cancer'), (120, 150, 'Leo'), (150, 180, 'Virgo'),
-        (180, 210, 'Libra'), (210, 240, 'Scorpio'), (240, 270, 'Sagittarius'),
-        (270, 300, 'Capricorn'), (300, 330, 'Aquarius'), (330, 360, 'Pisces')
-    ]
-    
-    lon = longitude % 360
-    for start, end, sign in signs:
-        if start <= lon < end:
-            return sign
-    return 'Aries'
+    return sign_of(longitude % 360)
 
 
 def get_planet_emoji(planet_name):
@@ -368,10 +445,10 @@ if __name__ == "__main__":
     
     print("🔍 Тестирование Swiss Ephemeris...")
     
-    # Тестовый расчет для astro.com проверки
+    # Тестовый расчет для astro.com проверки (12:00 по Ижевску = 07:00 UT)
     data = calculate_correct_positions(
         "Андрей (astro.com тест)", 
-        1987, 7, 25, 12, 0, 
+        1987, 7, 25, 7, 0, 
         56.85, 53.2333
     )
     
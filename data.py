@@ -303,4 +303,12 @@ SIGN_PREPOSITIONS = {
     "Козерог": "в Козероге",
     "Водолей": "в Водолее",
     "Рыбы": "в Рыбах",
-}
\ No newline at end of file
+}
+
+# 7. ЭМОДЗИ ТОЧЕК КАРТЫ (ключи планет, ASC и MC)
+POINT_EMOJIS = {
+    "Sun": "☀️", "Moon": "🌙", "Mercury": "☿", "Venus": "♀", "Mars": "♂",
+    "Jupiter": "♃", "Saturn": "♄", "Uranus": "♅", "Neptune": "♆", "Pluto": "♇",
+    "Chiron": "⚕️", "Lilith": "🌑", "Node": "☊", "Selena": "⚪",
+    "Asc": "🌅", "Mc": "👑",
+}
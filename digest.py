@@ -0,0 +1,173 @@
+# digest.py
+"""
+Ежедневный дайджест транзитов для подписчиков.
+
+Небо дня (долготы транзитных планет, положение Луны, ингрессии и стоянки
+за сутки) считается один раз на всю рассылку. Из него строится
+отсортированный индекс долгот, в которых транзитные планеты образуют
+точные аспекты. Натальные точки подписчиков ищутся в этом индексе
+бинарным поиском сразу для пачки подписчиков, без отдельного расчета
+карты на каждого.
+"""
+
+import logging
+from datetime import date, datetime, timezone
+from typing import NamedTuple
+
+import numpy as np
+
+from aspects import ASPECT_KEYS, ASPECT_ANGLES, ASPECT_SYMBOLS, POINT_KEYS
+from config import Config
+from correct_astrology_calc import get_engine
+from data import TRANSLATE, POINT_EMOJIS
+from events import EventSearch, TRANSIT_BODIES, datetime_to_jd
+from sign_format import SIGN_INDEX, SIGNS_RU_IN, sign_index
+
+logger = logging.getLogger(__name__)
+
+
+class DigestHits(NamedTuple):
+    """Транзитные аспекты пачки подписчиков в колоночном виде"""
+    subscriber: np.ndarray  # номер подписчика в пачке
+    natal: np.ndarray       # индекс натальной точки (POINT_KEYS)
+    body: np.ndarray        # индекс транзитной планеты (TRANSIT_BODIES)
+    aspect: np.ndarray      # индекс аспекта (ASPECT_KEYS)
+    orb: np.ndarray         # отклонение от точного аспекта
+
+
+class DailySky:
+    """Небо одного дня, общее для всех подписчиков"""
+
+    def __init__(self, day, bodies=TRANSIT_BODIES, orb=None):
+        self.day = day
+        self.bodies = tuple(bodies)
+        self.orb = orb if orb is not None else Config.DIGEST_ORB
+        start = datetime_to_jd(datetime(day.year, day.month, day.day))
+        # Транзиты - на полдень UT
+        self.jd = start + 0.5
+
+        engine = get_engine()
+        points = engine.calc_points(self.jd, self.bodies + ('Moon',))
+        self.longitudes = np.array([points[body][0] % 360 for body in self.bodies])
+        self.moon = points['Moon'][0] % 360
+
+        search = EventSearch(engine)
+        self.events = search.ingresses(start, start + 1) + search.stations(start, start + 1)
+        self.events.sort(key=lambda event: event.jd)
+
+        self._build_index()
+        self.header = self._render_header()
+        # Строки аспектов без орба: (транзит, натальная точка, аспект)
+        self._lines = [[[
+            f"{POINT_EMOJIS[transit]} {TRANSLATE[transit]} {ASPECT_SYMBOLS[aspect]} "
+            f"{TRANSLATE[point]} - {TRANSLATE[aspect].lower()}, орб "
+            for aspect in ASPECT_KEYS] for point in POINT_KEYS] for transit in self.bodies]
+
+    def _build_index(self):
+        """Отсортированные долготы точных аспектов с копиями на +-360 (переход через 0°)"""
+        targets, body, aspect = [], [], []
+        for i, lon in enumerate(self.longitudes):
+            for j, angle in enumerate(ASPECT_ANGLES):
+                for side in ((1,) if angle in (0.0, 180.0) else (1, -1)):
+                    targets.append((lon + side * angle) % 360)
+                    body.append(i)
+                    aspect.append(j)
+        targets = np.array(targets)
+        ring = np.concatenate([targets - 360, targets, targets + 360])
+        order = np.argsort(ring, kind='stable')
+        self.index = ring[order]
+        self.index_body = np.tile(body, 3)[order]
+        self.index_aspect = np.tile(aspect, 3)[order]
+
+    def match(self, longitudes):
+        """Аспекты транзитов к натальным долготам (подписчики, точки); NaN пропускаются"""
+        natal = np.asarray(longitudes, dtype=np.float64)
+        n_subscribers, n_points = natal.shape
+        flat = natal.ravel()
+        valid = ~np.isnan(flat)
+
+        lo = np.searchsorted(self.index, np.where(valid, flat - self.orb, np.inf), side='left')
+        hi = np.searchsorted(self.index, np.where(valid, flat + self.orb, np.inf), side='right')
+        counts = hi - lo
+        total = int(counts.sum())
+
+        # Разворачиваем диапазоны [lo, hi) в плоский список совпадений
+        owners = np.repeat(np.arange(flat.size), counts)
+        starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+        positions = starts + np.arange(total)
+
+        return DigestHits(
+            owners // n_points,
+            owners % n_points,
+            self.index_body[positions],
+            self.index_aspect[positions],
+            np.abs(self.index[positions] - flat[owners]),
+        )
+
+    def _render_header(self):
+        """Общая часть сообщения для всех подписчиков"""
+        lines = [f"🌅 <b>ТРАНЗИТЫ НА {self.day:%d.%m.%Y}</b>"]
+        # Знак Луны, если сегодня она его не меняет (иначе - в списке событий)
+        if not any(event.body == 'Moon' for event in self.events):
+            lines.append(f"🌙 Луна {SIGNS_RU_IN[int(sign_index(self.moon))]}")
+        for event in self.events:
+            emoji = POINT_EMOJIS.get(event.body, "⭐")
+            body = TRANSLATE.get(event.body, event.body)
+            moment = event.when
+            if event.kind == 'ingress':
+                lines.append(f"{emoji} {body} {SIGNS_RU_IN[SIGN_INDEX[event.sign]]} "
+                             f"с {moment:%H:%M} UT")
+            else:
+                motion = "попятным" if event.retrograde else "прямым"
+                lines.append(f"{emoji} {body} становится {motion} в {moment:%H:%M} UT")
+        return '\n'.join(lines)
+
+    def render(self, name, hits):
+        """Сообщение подписчику: общая часть + его аспекты (hits - массивы одного подписчика)"""
+        lines = [self.header, "", f"✨ <b>{name}, ваши транзиты:</b>"]
+        if not len(hits[0]):
+            lines.append("<i>Сегодня точных аспектов к вашей карте нет</i>")
+            return '\n'.join(lines)
+
+        natal, body, aspect, orb = hits
+        for k in np.argsort(orb, kind='stable')[:Config.DIGEST_MAX_ASPECTS]:
+            lines.append(f"{self._lines[body[k]][natal[k]][aspect[k]]}{orb[k]:.1f}°")
+        return '\n'.join(lines)
+
+    def render_batch(self, names, longitudes):
+        """Сообщения для пачки подписчиков одним поиском по индексу"""
+        hits = self.match(longitudes)
+        # Совпадения уже упорядочены по подписчику: границы групп через searchsorted
+        bounds = np.searchsorted(hits.subscriber, np.arange(len(names) + 1))
+        messages = []
+        for i, name in enumerate(names):
+            part = slice(bounds[i], bounds[i + 1])
+            messages.append(self.render(name, (hits.natal[part], hits.body[part],
+                                               hits.aspect[part], hits.orb[part])))
+        return messages
+
+
+def today_utc():
+    """Текущая дата UT"""
+    return datetime.now(timezone.utc).date()
+
+
+# Проверка скорости на синтетических подписчиках
+if __name__ == "__main__":
+    import time
+
+    logging.basicConfig(level=logging.WARNING)
+    began = time.perf_counter()
+    sky = DailySky(date(2024, 4, 1))
+    print(f"Небо дня: {(time.perf_counter() - began) * 1000:.1f} мс, "
+          f"индекс {len(sky.index)} долгот")
+    print(sky.header)
+
+    rng = np.random.default_rng(0)
+    natal = rng.uniform(0, 360, (100000, len(POINT_KEYS)))
+    began = time.perf_counter()
+    for start in range(0, len(natal), Config.DIGEST_BATCH_SIZE):
+        chunk = natal[start:start + Config.DIGEST_BATCH_SIZE]
+        messages = sky.render_batch(['Тест'] * len(chunk), chunk)
+    print(f"100000 подписчиков: {(time.perf_counter() - began) * 1000:.0f} мс")
+    print(messages[0])
@@ -0,0 +1,292 @@
+# events.py
+"""
+Поиск точного времени событий в окне дат:
+- входы планет в знаки (ингрессии),
+- стоянки (смена директного и ретроградного движения),
+- точные транзитные аспекты к натальным точкам.
+
+Вместо перебора по часам шаг выбирается по ограничению скорости тела:
+если до ближайшей цели (границы знака, точки аспекта) d градусов, а тело
+движется не быстрее S градусов в сутки, то раньше чем через d / S суток
+цель не будет достигнута. Для стоянок так же используется ограничение
+ускорения. Найденный интервал со сменой знака функции уточняется методом
+Брента до секунды. Медленные планеты проходят год за несколько шагов.
+"""
+
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import numpy as np
+
+from aspects import ASPECT_KEYS, ASPECT_ANGLES, POINT_KEYS
+from chart_result import SIGNS
+from correct_astrology_calc import swe, get_engine, PLANET_CODES, _SWE_LOCK
+
+logger = logging.getLogger(__name__)
+
+# Максимальная |скорость| тел, градусов в сутки (с запасом)
+SPEED_BOUNDS = {
+    'Sun': 1.03, 'Moon': 15.5, 'Mercury': 2.25, 'Venus': 1.28, 'Mars': 0.81,
+    'Jupiter': 0.25, 'Saturn': 0.14, 'Uranus': 0.07, 'Neptune': 0.045,
+    'Pluto': 0.045, 'Chiron': 0.16, 'Lilith': 0.12, 'Node': 0.06,
+}
+# Максимальное |ускорение|, градусов в сутки за сутки (с запасом)
+ACCEL_BOUNDS = {
+    'Mercury': 0.25, 'Venus': 0.05, 'Mars': 0.02, 'Jupiter': 0.006,
+    'Saturn': 0.004, 'Uranus': 0.003, 'Neptune': 0.003, 'Pluto': 0.003,
+    'Chiron': 0.004,
+}
+
+# Тела по умолчанию: ингрессии - все, стоянки - имеющие попятное движение,
+# транзитные аспекты - без быстрой Луны и расчетных точек
+INGRESS_BODIES = tuple(PLANET_CODES)
+STATION_BODIES = tuple(ACCEL_BOUNDS)
+TRANSIT_BODIES = ('Sun', 'Mercury', 'Venus', 'Mars', 'Jupiter', 'Saturn',
+                  'Uranus', 'Neptune', 'Pluto')
+
+# Минимальный шаг (сутки): меньшие интервалы не проверяются на двойное пересечение
+MIN_STEP = 0.5
+# Точность времени события (сутки)
+TOLERANCE = 1.0 / 86400
+
+
+class Event(NamedTuple):
+    """Найденное событие"""
+    jd: float                   # момент UT (юлианский день)
+    kind: str                   # 'ingress', 'station' или 'aspect'
+    body: str                   # транзитное тело
+    longitude: float            # долгота тела в момент события
+    sign: str = None            # ingress: знак, в который вошло тело
+    retrograde: bool = False    # ingress: вход попятным движением; station: стало попятным
+    aspect: str = None          # aspect: ключ аспекта (Conj, Sext, ...)
+    natal: str = None           # aspect: натальная точка
+
+    @property
+    def when(self):
+        return jd_to_datetime(self.jd)
+
+
+def jd_to_datetime(jd):
+    """Юлианский день UT -> naive datetime UT"""
+    year, month, day, hours = swe.revjul(jd)
+    return datetime(year, month, day) + timedelta(hours=hours)
+
+
+def datetime_to_jd(moment):
+    """naive datetime UT -> юлианский день"""
+    hours = moment.hour + moment.minute / 60.0 + moment.second / 3600.0
+    return get_engine().julday(moment.year, moment.month, moment.day, hours)
+
+
+def _wrap180(angle):
+    """Угол в диапазоне [-180, 180)"""
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+def brent(f, a, b, fa, fb, tol=TOLERANCE, max_iter=60):
+    """Корень f на [a, b] при разных знаках fa и fb (метод Брента)"""
+    if fa * fb > 0:
+        raise ValueError("Корень не отделен")
+    if abs(fa) < abs(fb):
+        a, b, fa, fb = b, a, fb, fa
+    c, fc = a, fa
+    d = e = b - a
+    for _ in range(max_iter):
+        if fb == 0:
+            return b
+        if fa * fb > 0:
+            a, fa = c, fc
+            d = e = b - a
+        if abs(fa) < abs(fb):
+            c, fc = b, fb
+            b, fb = a, fa
+            a, fa = c, fc
+        tol1 = 2 * 1e-15 * abs(b) + 0.5 * tol
+        m = 0.5 * (a - b)
+        if abs(m) <= tol1:
+            return b
+        if abs(e) >= tol1 and abs(fc) > abs(fb):
+            s = fb / fc
+            if c == a:
+                # Секущая
+                p, q = 2 * m * s, 1 - s
+            else:
+                # Обратная квадратичная интерполяция
+                q, r = fc / fa, fb / fa
+                p = s * (2 * m * q * (q - r) - (b - c) * (r - 1))
+                q = (q - 1) * (r - 1) * (s - 1)
+            if p > 0:
+                q = -q
+            p = abs(p)
+            if 2 * p < min(3 * m * q - abs(tol1 * q), abs(e * q)):
+                e, d = d, p / q
+            else:
+                d = e = m
+        else:
+            d = e = m
+        c, fc = b, fb
+        b += d if abs(d) > tol1 else math.copysign(tol1, m)
+        fb = f(b)
+    return b
+
+
+class EventSearch:
+    """Поиск событий поверх EphemerisEngine"""
+
+    def __init__(self, engine=None, tolerance=TOLERANCE, min_step=MIN_STEP):
+        self.engine = engine or get_engine()
+        self.tolerance = tolerance
+        self.min_step = min_step
+        self.calls = 0
+
+    def _position(self, jd, body):
+        """(долгота, скорость) тела"""
+        self.calls += 1
+        pos = self.engine.calc_body(jd, PLANET_CODES[body])
+        return pos[0], pos[3]
+
+    def _crossings(self, body, start, end, targets):
+        """Интервалы [t0, t1], на которых тело проходит долготы targets.
+
+        Возвращает (t0, t1, индекс цели, отклонение в t0, отклонение в t1).
+        """
+        bound = SPEED_BOUNDS[body]
+        t = start
+        lon, _ = self._position(t, body)
+        rel = _wrap180(lon - targets)
+        while t < end:
+            distance = np.abs(rel).min()
+            step = min(max(distance / bound, self.min_step), end - t)
+            t1 = t + step
+            lon1, _ = self._position(t1, body)
+            rel1 = _wrap180(lon1 - targets)
+            # Смена знака около цели (а не в противоположной ей точке)
+            crossed = np.nonzero(((rel < 0) != (rel1 < 0)) & (np.abs(rel - rel1) < 180))[0]
+            for k in crossed:
+                yield t, t1, k, rel[k], rel1[k]
+            t, rel = t1, rel1
+
+    def _refine_longitude(self, body, target, t0, t1, f0, f1):
+        """Момент, когда долгота тела равна target"""
+        def f(jd):
+            return _wrap180(self._position(jd, body)[0] - target)
+        return brent(f, t0, t1, f0, f1, self.tolerance)
+
+    def _each_body(self, bodies, search):
+        """События по телам; тело без эфемерид пропускается"""
+        events = []
+        with _SWE_LOCK:
+            for body in bodies:
+                try:
+                    events.extend(search(body))
+                except Exception as e:
+                    logger.warning(f"Поиск событий для {body} пропущен: {e}")
+        events.sort(key=lambda event: event.jd)
+        return events
+
+    def ingresses(self, start, end, bodies=INGRESS_BODIES):
+        """Входы тел в знаки за [start, end] (юлианские дни UT)"""
+        boundaries = np.arange(12) * 30.0
+
+        def search(body):
+            for t0, t1, k, f0, f1 in self._crossings(body, start, end, boundaries):
+                jd = self._refine_longitude(body, boundaries[k], t0, t1, f0, f1)
+                retrograde = f0 > 0
+                # Попятным движением тело входит в предыдущий знак
+                sign = SIGNS[(k - 1) % 12] if retrograde else SIGNS[k]
+                yield Event(jd, 'ingress', body, float(boundaries[k]), sign=sign,
+                            retrograde=retrograde)
+        return self._each_body(bodies, search)
+
+    def stations(self, start, end, bodies=STATION_BODIES):
+        """Стоянки (скорость по долготе равна нулю)"""
+        def speed(body, jd):
+            return self._position(jd, body)[1]
+
+        def search(body):
+            bound = ACCEL_BOUNDS[body]
+            t = start
+            v = speed(body, t)
+            while t < end:
+                step = min(max(abs(v) / bound, self.min_step), end - t)
+                t1 = t + step
+                v1 = speed(body, t1)
+                if (v < 0) != (v1 < 0):
+                    jd = brent(lambda x: speed(body, x), t, t1, v, v1, self.tolerance)
+                    lon, _ = self._position(jd, body)
+                    yield Event(jd, 'station', body, lon, sign=SIGNS[int(lon // 30) % 12],
+                                retrograde=v > 0)
+                t, v = t1, v1
+        return self._each_body(bodies, search)
+
+    def transits(self, start, end, natal, bodies=TRANSIT_BODIES, aspects=ASPECT_KEYS):
+        """Точные аспекты транзитных тел к натальным точкам.
+
+        natal - ChartResult или {ключ точки: долгота}.
+        """
+        if hasattr(natal, 'longitudes'):
+            natal = {key: float(natal.longitudes[i]) for i, key in enumerate(POINT_KEYS)
+                     if not natal.is_stub(i)}
+
+        # Все долготы-цели: натальная точка +- угол аспекта
+        targets, target_natal, target_aspect = [], [], []
+        for key, lon in natal.items():
+            for aspect in aspects:
+                angle = ASPECT_ANGLES[ASPECT_KEYS.index(aspect)]
+                for side in ((1,) if angle in (0.0, 180.0) else (1, -1)):
+                    targets.append((lon + side * angle) % 360)
+                    target_natal.append(key)
+                    target_aspect.append(aspect)
+        targets = np.array(targets)
+        if not len(targets):
+            return []
+
+        def search(body):
+            for t0, t1, k, f0, f1 in self._crossings(body, start, end, targets):
+                jd = self._refine_longitude(body, targets[k], t0, t1, f0, f1)
+                yield Event(jd, 'aspect', body, float(targets[k]),
+                            sign=SIGNS[int(targets[k] // 30) % 12], retrograde=f0 > 0,
+                            aspect=target_aspect[k], natal=target_natal[k])
+        return self._each_body(bodies, search)
+
+    def search(self, start, end, natal=None):
+        """Все события окна по времени"""
+        events = self.ingresses(start, end) + self.stations(start, end)
+        if natal is not None:
+            events += self.transits(start, end, natal)
+        events.sort(key=lambda event: event.jd)
+        return events
+
+
+# Проверка точности и скорости
+if __name__ == "__main__":
+    import time
+
+    logging.basicConfig(level=logging.WARNING)
+    finder = EventSearch()
+    start = datetime_to_jd(datetime(2024, 1, 1))
+    end = datetime_to_jd(datetime(2025, 1, 1))
+
+    began = time.perf_counter()
+    ingresses = finder.ingresses(start, end)
+    stations = finder.stations(start, end)
+    elapsed = time.perf_counter() - began
+    print(f"2024: {len(ingresses)} ингрессий, {len(stations)} стоянок, "
+          f"{finder.calls} вызовов эфемерид, {elapsed * 1000:.1f} мс")
+    for event in stations:
+        if event.body == 'Mercury':
+            kind = "R" if event.retrograde else "D"
+            print(f"  ☿ {kind} {event.when:%Y-%m-%d %H:%M:%S} {event.longitude:.3f}°")
+
+    # Сверка с почасовым перебором
+    began = time.perf_counter()
+    brute = 0
+    hours = np.arange(start, end, 1 / 24)
+    for body in ('Sun', 'Mercury', 'Mars'):
+        signs = [int(get_engine().calc_body(jd, PLANET_CODES[body])[0] // 30) for jd in hours]
+        brute += sum(1 for a, b in zip(signs, signs[1:]) if a != b)
+    fast = sum(1 for e in ingresses if e.body in ('Sun', 'Mercury', 'Mars'))
+    print(f"Почасовой перебор Sun/Mercury/Mars: {brute} ингрессий "
+          f"({(time.perf_counter() - began) * 1000:.0f} мс), поиск: {fast}")
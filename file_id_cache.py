@@ -0,0 +1,142 @@
+# file_id_cache.py
+"""
+Постоянный кэш file_id отправленных документов в SQLite.
+
+Ключ - хэш содержимого документа вместе с именем файла: одинаковая карта
+второй раз отправляется по file_id, без загрузки байтов в Telegram.
+Записи помечены версией шаблона; при ее смене (chart_svg.TEMPLATE_VERSION)
+старые записи удаляются при запуске.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def content_digest(data, filename):
+    """Ключ документа: BLAKE2b содержимого и имени файла"""
+    h = hashlib.blake2b(data, digest_size=20)
+    h.update(b'\0' + filename.encode('utf-8'))
+    return h.hexdigest()
+
+
+class FileIdCache:
+    """Кэш file_id с TTL, вытеснением по LRU и версией шаблона"""
+
+    def __init__(self, version, path=None, ttl=None, max_entries=None):
+        self.version = str(version)
+        self.path = path or Config.FILE_ID_CACHE_PATH
+        self.ttl = ttl or Config.FILE_ID_CACHE_TTL
+        self.max_entries = max_entries or Config.FILE_ID_CACHE_MAX_ENTRIES
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids ("
+            "    digest TEXT PRIMARY KEY,"
+            "    file_id TEXT NOT NULL,"
+            "    version TEXT NOT NULL,"
+            "    size INTEGER NOT NULL,"
+            "    expires INTEGER NOT NULL,"
+            "    accessed INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS file_ids_accessed_idx ON file_ids(accessed)"
+        )
+        # Документы, нарисованные прежними шаблонами, больше не понадобятся
+        stale = self._conn.execute(
+            "DELETE FROM file_ids WHERE version != ?", (self.version,)
+        ).rowcount
+        self._size = self._conn.execute("SELECT COUNT(*) FROM file_ids").fetchone()[0]
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = stale
+        self.bytes_saved = 0
+        logger.info(f"Кэш file_id: {self.path} ({self._size} записей, "
+                    f"сброшено по версии шаблона: {stale})")
+
+    def get(self, digest):
+        """file_id документа или None"""
+        now = int(time.time())
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_id, size, expires FROM file_ids WHERE digest = ? AND version = ?",
+                (digest, self.version)
+            ).fetchone()
+            if row is None or row[2] < now:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE file_ids SET accessed = ? WHERE digest = ?", (now, digest))
+        self.hits += 1
+        self.bytes_saved += row[1]
+        return row[0]
+
+    def put(self, digest, file_id, size):
+        """Запоминает file_id загруженного документа размером size байт"""
+        now = int(time.time())
+        with self._lock:
+            values = (digest, file_id, self.version, size, now + self.ttl, now)
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO file_ids VALUES (?, ?, ?, ?, ?, ?)", values
+            )
+            if cursor.rowcount:
+                self._size += 1
+            else:
+                self._conn.execute(
+                    "UPDATE file_ids SET file_id = ?, version = ?, size = ?, "
+                    "expires = ?, accessed = ? WHERE digest = ?",
+                    values[1:] + (digest,)
+                )
+            # Вытесняем пачкой, чтобы не чистить таблицу на каждой вставке
+            if self._size > self.max_entries * 1.1:
+                self._evict()
+
+    def forget(self, digest):
+        """Удаляет file_id, который Telegram больше не принимает"""
+        with self._lock:
+            self._size -= self._conn.execute(
+                "DELETE FROM file_ids WHERE digest = ?", (digest,)
+            ).rowcount
+
+    def _evict(self):
+        """Удаляет просроченные и давно не использованные записи"""
+        now = int(time.time())
+        removed = self._conn.execute("DELETE FROM file_ids WHERE expires < ?", (now,)).rowcount
+        self._size -= removed
+        excess = self._size - self.max_entries
+        if excess > 0:
+            removed += self._conn.execute(
+                "DELETE FROM file_ids WHERE digest IN "
+                "(SELECT digest FROM file_ids ORDER BY accessed LIMIT ?)",
+                (excess,)
+            ).rowcount
+        self._size = self._conn.execute("SELECT COUNT(*) FROM file_ids").fetchone()[0]
+        self.evictions += removed
+        logger.info(f"Кэш file_id: вытеснено {removed} записей")
+
+    def stats(self):
+        """Счетчики попаданий и сэкономленных байтов загрузки"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': self._size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'bytes_saved': self.bytes_saved,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        """Закрывает соединение с базой"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,276 @@
+# gazetteer.py
+"""
+Офлайн-геокодер по выгрузке GeoNames для стран из Config.SUPPORTED_COUNTRIES.
+
+Индекс - один бинарный файл, который открывается через mmap:
+    заголовок | места | отсортированные имена | префиксный индекс | строки
+Поиск: префиксный индекс по первым двум байтам имени сужает диапазон,
+дальше бинарный поиск по отсортированным именам. Nominatim нужен только
+для городов, которых нет в индексе.
+
+Сборка:
+    python gazetteer.py build RU.zip UA.zip BY.zip KZ.zip US.zip -o data/gazetteer.idx
+"""
+
+import argparse
+import io
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+import zipfile
+
+from config import Config
+from geocoding import GeocodeResult
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'GAZ1'
+# magic, мест, имен, смещения: места, имена, префиксы, строки
+HEADER = struct.Struct('<4sIIIIII')
+# широта, долгота, население, страна, длина адреса, смещение адреса
+PLACE = struct.Struct('<ffI2sHI')
+# смещение имени, длина имени, номер места
+NAME = struct.Struct('<III')
+PREFIX_BUCKETS = 1 << 16
+
+COUNTRY_NAMES = {
+    'RU': 'Россия', 'US': 'США', 'UA': 'Украина', 'BY': 'Беларусь', 'KZ': 'Казахстан',
+}
+
+# Как пользователи пишут страну после запятой: "Ижевск, Россия"
+COUNTRY_ALIASES = {
+    'россия': 'RU', 'рф': 'RU', 'russia': 'RU', 'ru': 'RU',
+    'сша': 'US', 'usa': 'US', 'us': 'US', 'united states': 'US', 'америка': 'US',
+    'украина': 'UA', 'ukraine': 'UA', 'ua': 'UA',
+    'беларусь': 'BY', 'белоруссия': 'BY', 'belarus': 'BY', 'by': 'BY',
+    'казахстан': 'KZ', 'kazakhstan': 'KZ', 'kz': 'KZ',
+}
+
+# Индексируем только кириллические и латинские написания
+_NAME_RE = re.compile(r"^[a-zа-я' .]+$")
+
+
+def normalize_name(text):
+    """Нормализует название: регистр, ё/е, дефисы и лишние пробелы"""
+    text = str(text).casefold().replace('ё', 'е')
+    text = text.replace('-', ' ').replace('–', ' ')
+    return ' '.join(text.split())
+
+
+def _prefix_bucket(key):
+    """Номер корзины префиксного индекса по первым двум байтам"""
+    return (key[0] << 8) | (key[1] if len(key) > 1 else 0)
+
+
+def _read_rows(path):
+    """Читает строки выгрузки GeoNames (.txt или .zip со страной)"""
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            member = next(n for n in archive.namelist()
+                          if n.endswith('.txt') and not n.startswith('readme'))
+            with archive.open(member) as raw:
+                yield from io.TextIOWrapper(raw, encoding='utf-8')
+    else:
+        with open(path, encoding='utf-8') as f:
+            yield from f
+
+
+def build_index(sources, output, countries=None, min_population=0):
+    """Собирает индекс из выгрузок GeoNames (формат allCountries.txt)"""
+    countries = set(countries or Config.SUPPORTED_COUNTRIES)
+    places = []
+    names = {}
+
+    for source in sources:
+        for line in _read_rows(source):
+            row = line.rstrip('\n').split('\t')
+            if len(row) < 15 or row[6] != 'P' or row[8] not in countries:
+                continue
+            population = int(row[14] or 0)
+            if population < min_population:
+                continue
+
+            place_idx = len(places)
+            address = f"{row[1]}, {COUNTRY_NAMES.get(row[8], row[8])}"
+            places.append((float(row[4]), float(row[5]), population, row[8], address))
+
+            for variant in [row[1], row[2]] + row[3].split(','):
+                key = normalize_name(variant)
+                if len(key) >= 2 and _NAME_RE.match(key):
+                    names.setdefault(key.encode('utf-8'), set()).add(place_idx)
+
+    # Внутри одного имени сначала самые крупные города
+    entries = sorted(
+        (key, -places[idx][2], idx) for key, idxs in names.items() for idx in idxs
+    )
+
+    text = bytearray()
+    place_blob = bytearray()
+    for lat, lon, population, cc, address in places:
+        encoded = address.encode('utf-8')[:0xFFFF]
+        place_blob += PLACE.pack(lat, lon, min(population, 0xFFFFFFFF),
+                                 cc.encode('ascii'), len(encoded), len(text))
+        text += encoded
+
+    name_blob = bytearray()
+    prefix = [0] * (PREFIX_BUCKETS + 1)
+    for pos, (key, _, idx) in enumerate(entries):
+        name_blob += NAME.pack(len(text), len(key), idx)
+        text += key
+        prefix[_prefix_bucket(key) + 1] = pos + 1
+    # Пустые корзины указывают на конец предыдущей
+    for bucket in range(1, PREFIX_BUCKETS + 1):
+        prefix[bucket] = max(prefix[bucket], prefix[bucket - 1])
+
+    off_places = HEADER.size
+    off_names = off_places + len(place_blob)
+    off_prefix = off_names + len(name_blob)
+    off_text = off_prefix + 4 * (PREFIX_BUCKETS + 1)
+
+    with open(output, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(places), len(entries),
+                            off_places, off_names, off_prefix, off_text))
+        f.write(place_blob)
+        f.write(name_blob)
+        f.write(struct.pack(f'<{PREFIX_BUCKETS + 1}I', *prefix))
+        f.write(text)
+
+    logger.info(f"Индекс собран: {len(places)} мест, {len(entries)} имен -> {output}")
+    return len(places), len(entries)
+
+
+class Gazetteer:
+    """Поиск по собранному индексу через mmap"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.n_places, self.n_names, self._off_places, self._off_names,
+         self._off_prefix, self._off_text) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Неверный формат индекса: {path}")
+        self._prefix = memoryview(self._mm)[
+            self._off_prefix:self._off_prefix + 4 * (PREFIX_BUCKETS + 1)
+        ].cast('I')
+
+    @classmethod
+    def open_if_exists(cls, path=None):
+        """Открывает индекс, если он собран; иначе None"""
+        path = path or Config.GAZETTEER_PATH
+        if not path or not os.path.exists(path):
+            logger.info(f"Офлайн-геокодер не найден ({path}), используется только Nominatim")
+            return None
+        try:
+            gazetteer = cls(path)
+            logger.info(f"Офлайн-геокодер: {gazetteer.n_places} мест из {path}")
+            return gazetteer
+        except Exception as e:
+            logger.error(f"Ошибка загрузки офлайн-геокодера {path}: {e}")
+            return None
+
+    def _name_at(self, pos):
+        """Имя (байты) и номер места для позиции в отсортированном списке"""
+        off, length, idx = NAME.unpack_from(self._mm, self._off_names + pos * NAME.size)
+        start = self._off_text + off
+        return self._mm[start:start + length], idx
+
+    def _place(self, idx):
+        """Запись о месте по номеру"""
+        lat, lon, population, cc, addr_len, addr_off = PLACE.unpack_from(
+            self._mm, self._off_places + idx * PLACE.size
+        )
+        start = self._off_text + addr_off
+        address = self._mm[start:start + addr_len].decode('utf-8')
+        return GeocodeResult(lat, lon, address), cc.decode('ascii'), population
+
+    def _lower_bound(self, key):
+        """Первая позиция с именем >= key (в пределах корзины префикса)"""
+        bucket = _prefix_bucket(key)
+        lo, hi = self._prefix[bucket], self._prefix[bucket + 1]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name_at(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo, self._prefix[bucket + 1]
+
+    def lookup(self, query):
+        """Ищет город по точному названию ("Ижевск", "Izhevsk, Russia").
+
+        Без страны неоднозначное название маленького города не принимается
+        (None): в индексе только Config.SUPPORTED_COUNTRIES, и "Париж" иначе
+        нашелся бы в Техасе.
+        """
+        city, _, country = str(query).partition(',')
+        key = normalize_name(city).encode('utf-8')
+        if len(key) < 2:
+            return None
+        country_code = COUNTRY_ALIASES.get(normalize_name(country)) if country else None
+        if country and country_code is None:
+            return None
+
+        pos, end = self._lower_bound(key)
+        while pos < end:
+            name, idx = self._name_at(pos)
+            if name != key:
+                break
+            result, cc, population = self._place(idx)
+            if country_code is None:
+                # Места одного имени отсортированы по убыванию населения
+                if population >= Config.GAZETTEER_MIN_POPULATION or self._unique(pos, end, key):
+                    return result
+                return None
+            if cc == country_code:
+                return result
+            pos += 1
+        return None
+
+    def _unique(self, pos, end, key):
+        """Имя на позиции pos - единственное место с таким названием"""
+        return pos + 1 >= end or self._name_at(pos + 1)[0] != key
+
+    def iter_places(self, country=None):
+        """Перебирает все места индекса (например, для бенчмарков)"""
+        for idx in range(self.n_places):
+            result, cc, population = self._place(idx)
+            if country is None or cc == country:
+                yield result
+
+    def close(self):
+        """Освобождает mmap и файл"""
+        self._prefix.release()
+        self._mm.close()
+        self._file.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Офлайн-геокодер по выгрузке GeoNames")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_cmd = commands.add_parser('build', help="собрать индекс")
+    build_cmd.add_argument('sources', nargs='+', help="RU.zip, UA.txt, cities500.txt ...")
+    build_cmd.add_argument('-o', '--output', default=Config.GAZETTEER_PATH)
+    build_cmd.add_argument('--min-population', type=int, default=0)
+
+    lookup_cmd = commands.add_parser('lookup', help="найти город")
+    lookup_cmd.add_argument('query')
+    lookup_cmd.add_argument('-i', '--index', default=Config.GAZETTEER_PATH)
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        build_index(args.sources, args.output, min_population=args.min_population)
+    else:
+        gazetteer = Gazetteer(args.index)
+        start = time.perf_counter()
+        result = gazetteer.lookup(args.query)
+        elapsed = (time.perf_counter() - start) * 1e6
+        print(f"🔍 {args.query}: {result} ({elapsed:.0f} мкс)")
+        sys.exit(0 if result else 1)
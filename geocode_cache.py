@@ -0,0 +1,129 @@
+# geocode_cache.py
+"""
+Постоянный кэш геокодирования в SQLite.
+Хранится в cache/geocode_cache.sqlite (в Docker - в томе ./data),
+поэтому переживает перезапуск контейнера. Открывается при запуске
+приложения, а не при импорте бота.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+
+from config import Config
+from geocoding import MISS, GeocodeResult
+
+logger = logging.getLogger(__name__)
+
+
+class GeocodeCache:
+    """Кэш с TTL, кэшированием отрицательных ответов и вытеснением по LRU"""
+
+    def __init__(self, path=None, ttl=None, negative_ttl=None, max_entries=None):
+        self.path = path or Config.GEOCODE_CACHE_PATH
+        self.ttl = ttl or Config.GEOCODE_CACHE_TTL
+        self.negative_ttl = negative_ttl or Config.GEOCODE_NEGATIVE_TTL
+        self.max_entries = max_entries or Config.GEOCODE_CACHE_MAX_ENTRIES
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode_cache ("
+            "    query TEXT PRIMARY KEY,"
+            "    latitude REAL,"
+            "    longitude REAL,"
+            "    address TEXT,"
+            "    expires INTEGER NOT NULL,"
+            "    accessed INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS geocode_cache_accessed_idx "
+            "ON geocode_cache(accessed)"
+        )
+        self._size = self._conn.execute("SELECT COUNT(*) FROM geocode_cache").fetchone()[0]
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        logger.info(f"Кэш геокодирования: {self.path} ({self._size} записей)")
+
+    def get(self, key):
+        """Возвращает GeocodeResult, None (город не найден) или MISS"""
+        now = int(time.time())
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT latitude, longitude, address, expires FROM geocode_cache WHERE query = ?",
+                (key,)
+            ).fetchone()
+            if row is None or row[3] < now:
+                self.misses += 1
+                return MISS
+            self._conn.execute("UPDATE geocode_cache SET accessed = ? WHERE query = ?", (now, key))
+
+        if row[2] is None:
+            self.negative_hits += 1
+            return None
+        self.hits += 1
+        return GeocodeResult(row[0], row[1], row[2])
+
+    def put(self, key, result):
+        """Сохраняет ответ; None кэшируется на более короткий срок"""
+        now = int(time.time())
+        if result is None:
+            values = (key, None, None, None, now + self.negative_ttl, now)
+        else:
+            values = (key, result.latitude, result.longitude, result.address, now + self.ttl, now)
+
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO geocode_cache VALUES (?, ?, ?, ?, ?, ?)", values
+            )
+            if cursor.rowcount:
+                self._size += 1
+            else:
+                self._conn.execute(
+                    "UPDATE geocode_cache SET latitude = ?, longitude = ?, address = ?, "
+                    "expires = ?, accessed = ? WHERE query = ?",
+                    values[1:] + (key,)
+                )
+            # Вытесняем пачкой, чтобы не чистить таблицу на каждой вставке
+            if self._size > self.max_entries * 1.1:
+                self._evict()
+
+    def _evict(self):
+        """Удаляет просроченные и давно не использованные записи"""
+        now = int(time.time())
+        removed = self._conn.execute("DELETE FROM geocode_cache WHERE expires < ?", (now,)).rowcount
+        self._size -= removed
+        excess = self._size - self.max_entries
+        if excess > 0:
+            removed += self._conn.execute(
+                "DELETE FROM geocode_cache WHERE query IN "
+                "(SELECT query FROM geocode_cache ORDER BY accessed LIMIT ?)",
+                (excess,)
+            ).rowcount
+            self._size = self._conn.execute("SELECT COUNT(*) FROM geocode_cache").fetchone()[0]
+        self.evictions += removed
+        logger.info(f"Кэш геокодирования: вытеснено {removed} записей")
+
+    def stats(self):
+        """Счетчики попаданий и промахов"""
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            'entries': self._size,
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        """Закрывает соединение с базой"""
+        with self._lock:
+            self._conn.close()
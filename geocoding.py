@@ -0,0 +1,156 @@
+# geocoding.py
+"""
+Асинхронное геокодирование городов.
+Один клиент Nominatim на процесс, запросы выполняются в пуле потоков,
+одинаковые одновременные запросы объединяются в один запрос к серверу.
+Запросы к Nominatim уходят не чаще Config.NOMINATIM_MIN_INTERVAL
+(правила сервиса - 1 запрос в секунду, иначе User-Agent блокируется).
+Ответы сохраняются в постоянном кэше (см. geocode_cache.py).
+Если собран офлайн-индекс (gazetteer.py), сеть нужна только для городов,
+которых в нем нет.
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from geopy.geocoders import Nominatim
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Маркер отсутствия записи в кэше (None означает "город не найден")
+MISS = object()
+
+
+class GeocodeResult(NamedTuple):
+    """Результат геокодирования (совместим по полям с geopy.Location)"""
+    latitude: float
+    longitude: float
+    address: str
+
+
+def normalize_query(query):
+    """Приводит запрос к ключу кэша: регистр и лишние пробелы не важны"""
+    return ' '.join(str(query).split()).casefold()
+
+
+class AsyncGeocoder:
+    """Геокодер с объединением одинаковых запросов и постоянным кэшем"""
+
+    def __init__(self, user_agent="natal_bot_2026", timeout=10, max_workers=4,
+                 cache=None, gazetteer=None, min_interval=None):
+        self._geolocator = Nominatim(user_agent=user_agent, timeout=timeout)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='geocode')
+        self._in_flight = {}
+        self._cache = cache
+        self._gazetteer = gazetteer
+        self.min_interval = min_interval if min_interval is not None else Config.NOMINATIM_MIN_INTERVAL
+        # Запросы к серверу выпускаются по одному с интервалом min_interval
+        self._rate_lock = asyncio.Lock()
+        self._last_request = 0.0
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.local_hits = 0
+
+    def start(self, cache=None, gazetteer=None):
+        """Подключает кэш и офлайн-индекс при запуске приложения"""
+        self._cache = cache
+        self._gazetteer = gazetteer
+
+    def _geocode_sync(self, query):
+        """Блокирующий запрос к Nominatim (выполняется в пуле потоков)"""
+        self.upstream_calls += 1
+        location = self._geolocator.geocode(query, addressdetails=True, language="ru")
+        if location is None:
+            return None
+        return GeocodeResult(location.latitude, location.longitude, location.address)
+
+    async def _wait_turn(self):
+        """Ждет, пока с прошлого запроса к серверу пройдет min_interval"""
+        async with self._rate_lock:
+            wait = self._last_request + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._last_request = time.monotonic()
+
+    async def _lookup(self, key, query):
+        """Выполняет запрос к серверу и кэширует ответ"""
+        loop = asyncio.get_running_loop()
+        await self._wait_turn()
+        try:
+            result = await loop.run_in_executor(self._executor, self._geocode_sync, query)
+        except Exception as e:
+            logger.error(f"Ошибка геокодирования для {query}: {e}")
+            return None
+        if self._cache is not None:
+            self._cache.put(key, result)
+        return result
+
+    def _local_lookup(self, query):
+        """Поиск в офлайн-индексе (микросекунды, без сети)"""
+        if self._gazetteer is None:
+            return None
+        result = self._gazetteer.lookup(query)
+        if result is not None:
+            self.local_hits += 1
+        return result
+
+    async def geocode(self, query) -> Optional[GeocodeResult]:
+        """Находит координаты; одинаковые одновременные запросы идут на сервер один раз"""
+        local = self._local_lookup(query)
+        if local is not None:
+            return local
+
+        key = normalize_query(query)
+        if self._cache is not None:
+            cached = self._cache.get(key)
+            if cached is not MISS:
+                return cached
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._lookup(key, query))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        # shield: отмена одного ожидающего не отменяет общий запрос
+        return await asyncio.shield(task)
+
+    async def locate_city(self, city, country="Россия") -> Optional[GeocodeResult]:
+        """Ищет город как есть и с указанием страны параллельно"""
+        local = self._local_lookup(city)
+        if local is not None:
+            return local
+
+        plain, qualified = await asyncio.gather(
+            self.geocode(city),
+            self.geocode(f"{city}, {country}")
+        )
+        return plain or qualified
+
+    def stats(self):
+        """Статистика геокодера"""
+        stats = {
+            'upstream_calls': self.upstream_calls,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._in_flight),
+            'local_hits': self.local_hits,
+        }
+        if self._cache is not None:
+            stats['cache'] = self._cache.stats()
+        return stats
+
+    def shutdown(self):
+        """Останавливает пул потоков и закрывает кэш"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._cache is not None:
+            self._cache.close()
+        if self._gazetteer is not None:
+            self._gazetteer.close()
@@ -0,0 +1,72 @@
+# houses.py
+"""
+Распределение точек карты по домам.
+
+Куспиды переводятся в долготы относительно первого дома: так круг
+"разрезается" по куспиду 1, переход 360°/0° исчезает и куспиды образуют
+возрастающую последовательность 0 = c1 < c2 < ... < c12 < 360. Дом точки
+находится бинарным поиском ее относительной долготы в этой
+последовательности.
+
+Для пакета карт относительные куспиды каждой карты сдвигаются на
+360 * номер карты и склеиваются в один возрастающий массив - дома всех
+точек всех карт находятся одним вызовом searchsorted.
+"""
+
+import numpy as np
+
+
+def relative_cusps(cusps):
+    """Куспиды (..., 12) относительно куспида 1, по возрастанию от 0 до 360"""
+    cusps = np.asarray(cusps, dtype=np.float64)
+    return (cusps - cusps[..., :1]) % 360.0
+
+
+def valid_cusps(relative):
+    """Куспиды рассчитаны и упорядочены по кругу (у полюсов Placidus не работает)"""
+    return np.all(np.diff(relative, axis=-1) > 0, axis=-1)
+
+
+def house_of(longitude, cusps):
+    """Номер дома 1..12 для одной долготы"""
+    return int(place_in_houses(np.array([longitude]), cusps)[0])
+
+
+def place_in_houses(longitudes, cusps):
+    """Номера домов 1..12 для массива долгот одной карты (NaN -> 0).
+
+    Если куспиды не рассчитаны или не упорядочены, все точки получают 0.
+    """
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    cusps = np.asarray(cusps, dtype=np.float64)
+    relative = relative_cusps(cusps)
+    if not valid_cusps(relative):
+        return np.zeros(longitudes.shape, dtype=np.int8)
+    points = (longitudes - cusps[0]) % 360.0
+    houses = np.searchsorted(relative, points, side='right')
+    return np.where(np.isnan(points), 0, houses).astype(np.int8)
+
+
+def place_many(longitudes, cusps):
+    """Номера домов для пакета: долготы (карты, точки), куспиды (карты, 12).
+
+    Для карт без домов (NaN в куспидах) и для точек без долготы - 0.
+    """
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    cusps = np.asarray(cusps, dtype=np.float64)
+    n_charts = len(cusps)
+    offsets = 360.0 * np.arange(n_charts)
+
+    relative = relative_cusps(cusps)
+    valid = valid_cusps(relative)
+    # Невалидные строки заменяем равными домами, чтобы массив оставался возрастающим
+    relative[~valid] = np.arange(12) * 30.0
+    starts = np.where(valid, cusps[:, 0], 0.0)
+
+    flat_cusps = (relative + offsets[:, None]).ravel()
+    points = (longitudes - starts[:, None]) % 360.0 + offsets[:, None]
+    positions = np.searchsorted(flat_cusps, np.nan_to_num(points.ravel()), side='right')
+
+    houses = positions.reshape(points.shape) - 12 * np.arange(n_charts)[:, None]
+    houses[np.isnan(points) | ~valid[:, None]] = 0
+    return houses.astype(np.int8)
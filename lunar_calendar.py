@@ -0,0 +1,413 @@
+# lunar_calendar.py
+"""
+Лунный календарь: фазы, входы Луны в знаки и периоды Луны без курса.
+
+Календарь рассчитывается заранее на диапазон лет (по умолчанию 1900-2100)
+и хранится в файле из отсортированных по времени таблиц, который
+открывается через mmap. Вопросы "фаза Луны в момент рождения", "знак Луны",
+"Луна без курса сейчас?" - бинарный поиск по таблице, без эфемерид.
+
+Луна всегда движется прямо и быстрее любой планеты, поэтому ее долгота
+и элонгация от планеты монотонно растут: каждое следующее событие
+находится методом Ньютона от предыдущего за 2-3 обращения к эфемеридам.
+
+Луна без курса - от последнего точного мажорного аспекта Луны к планете
+в знаке до входа Луны в следующий знак.
+
+Формат файла:
+    заголовок | фазы: float64[n], uint8[n] | ингрессии: float64[n], uint8[n]
+              | без курса: float64[n] начало, float64[n] конец, uint8[n] планета
+
+Сборка:
+    python lunar_calendar.py build -o data/lunar_calendar.bin --workers 8
+    python lunar_calendar.py ics 2026 -o moon-2026.ics
+"""
+
+import argparse
+import heapq
+import logging
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+import numpy as np
+
+from chart_result import SIGNS
+from config import Config
+from correct_astrology_calc import get_engine, PLANET_CODES, _SWE_LOCK
+from events import TRANSIT_BODIES, jd_to_datetime, datetime_to_jd
+from sign_format import SIGN_INDEX, SIGNS_RU_IN
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'LUN1'
+# magic, начало и конец (юлианские дни), число фаз, ингрессий, периодов без курса
+HEADER = struct.Struct('<4sddIII')
+
+# Фазы - восемь секторов элонгации Луны от Солнца по 45°
+PHASE_ANGLES = np.arange(8) * 45.0
+PHASE_NAMES = (
+    'Новолуние', 'Молодая Луна', 'Первая четверть', 'Растущая Луна',
+    'Полнолуние', 'Убывающая Луна', 'Последняя четверть', 'Старая Луна',
+)
+PHASE_EMOJIS = ('🌑', '🌒', '🌓', '🌔', '🌕', '🌖', '🌗', '🌘')
+# Мажорные аспекты (элонгации), завершающие курс Луны
+VOID_ANGLES = np.array([0.0, 60.0, 90.0, 120.0, 180.0, 240.0, 270.0, 300.0])
+VOID_BODIES = TRANSIT_BODIES
+SIGN_ANGLES = np.arange(12) * 30.0
+
+TOLERANCE = 1e-6  # градусов (доли секунды для Луны)
+MAX_ITERATIONS = 10
+# Дней до начала календаря, за которые ищутся фаза и знак, действующие на
+# его начало (фаза длится не больше ~4.5 дня, знак - ~2.7)
+LEAD_DAYS = 8.0
+
+
+class VoidPeriod(NamedTuple):
+    """Период Луны без курса"""
+    start: float    # последний аспект (юлианский день UT)
+    end: float      # вход Луны в следующий знак
+    body: str       # планета последнего аспекта (None, если аспектов в знаке не было)
+
+
+class MoonState(NamedTuple):
+    """Луна в заданный момент по календарю"""
+    phase: int              # индекс в PHASE_NAMES
+    phase_since: float      # начало фазы
+    sign: str
+    sign_since: float
+    void: VoidPeriod        # None, если Луна с курсом
+
+
+# --- РАСЧЕТ ---
+
+def _elongation(engine, jd, code):
+    """(долгота Луны - долгота тела, относительная скорость); без тела - долгота Луны"""
+    moon = engine.calc_body(jd, PLANET_CODES['Moon'])
+    if code is None:
+        return moon[0] % 360.0, moon[3]
+    other = engine.calc_body(jd, code)
+    return (moon[0] - other[0]) % 360.0, moon[3] - other[3]
+
+
+def moon_crossings(start, end, targets, body=None, engine=None):
+    """Моменты, когда элонгация Луны от тела (или ее долгота) проходит углы targets.
+
+    Возвращает (моменты, индексы углов) по возрастанию времени.
+    """
+    engine = engine or get_engine()
+    code = PLANET_CODES[body] if body else None
+    targets = np.sort(np.asarray(targets, dtype=np.float64))
+    times, indices = [], []
+    with _SWE_LOCK:
+        t = start
+        value, speed = _elongation(engine, t, code)
+        # Ближайший угол впереди
+        k = int(np.searchsorted(targets, value, side='right')) % len(targets)
+        while True:
+            # Начальное приближение - по текущей скорости, дальше метод Ньютона
+            t += ((targets[k] - value) % 360.0) / speed
+            value, speed = _elongation(engine, t, code)
+            for _ in range(MAX_ITERATIONS):
+                delta = (value - targets[k] + 180.0) % 360.0 - 180.0
+                if abs(delta) < TOLERANCE:
+                    break
+                t -= delta / speed
+                value, speed = _elongation(engine, t, code)
+            if t >= end:
+                break
+            times.append(t)
+            indices.append(k)
+            k = (k + 1) % len(targets)
+    return np.array(times), np.array(indices, dtype=np.uint8)
+
+
+def _calculate_span(args):
+    """Фазы, ингрессии и аспекты Луны за [start, end) (выполняется в процессе пула)"""
+    start, end = args
+    phases = moon_crossings(start, end, PHASE_ANGLES, 'Sun')
+    ingresses = moon_crossings(start, end, SIGN_ANGLES)
+    aspect_times, aspect_bodies = [], []
+    for i, body in enumerate(VOID_BODIES):
+        try:
+            times, _ = moon_crossings(start, end, VOID_ANGLES, body)
+        except Exception as e:
+            logger.warning(f"Аспекты Луны к {body} пропущены: {e}")
+            continue
+        aspect_times.append(times)
+        aspect_bodies.append(np.full(len(times), i, dtype=np.uint8))
+    return phases, ingresses, np.concatenate(aspect_times), np.concatenate(aspect_bodies)
+
+
+def void_periods(ingress_times, aspect_times, aspect_bodies):
+    """Периоды без курса: последний аспект перед каждой ингрессией (массивы NumPy)"""
+    order = np.argsort(aspect_times, kind='stable')
+    aspect_times, aspect_bodies = aspect_times[order], aspect_bodies[order]
+    sign_start, sign_end = ingress_times[:-1], ingress_times[1:]
+
+    last = np.searchsorted(aspect_times, sign_end, side='left') - 1
+    has_aspect = (last >= 0) & (aspect_times[np.maximum(last, 0)] >= sign_start)
+    # Без аспектов в знаке Луна без курса весь знак
+    starts = np.where(has_aspect, aspect_times[np.maximum(last, 0)], sign_start)
+    bodies = np.where(has_aspect, aspect_bodies[np.maximum(last, 0)], 0xFF).astype(np.uint8)
+    return starts, sign_end, bodies
+
+
+def build_calendar(output, start_year=None, end_year=None, workers=None, years_per_task=5):
+    """Рассчитывает календарь на годы [start_year, end_year) и записывает в файл"""
+    start_year = start_year or Config.LUNAR_CALENDAR_START_YEAR
+    end_year = end_year or Config.LUNAR_CALENDAR_END_YEAR
+    bounds = [datetime_to_jd(datetime(year, 1, 1))
+              for year in range(start_year, end_year, years_per_task)]
+    bounds.append(datetime_to_jd(datetime(end_year, 1, 1)))
+    tasks = list(zip(bounds, bounds[1:]))
+
+    started = time.perf_counter()
+    # Фаза и знак, начавшиеся до начала календаря, тоже в таблицах: иначе
+    # первые дни диапазона остались бы без фазы и знака
+    (lead_phases, lead_phase_values), (lead_ingresses, lead_signs), lead_aspects, lead_bodies = \
+        _calculate_span((bounds[0] - LEAD_DAYS, bounds[0]))
+    parts = [((lead_phases[-1:], lead_phase_values[-1:]), (lead_ingresses[-1:], lead_signs[-1:]),
+              lead_aspects, lead_bodies)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for n, part in enumerate(executor.map(_calculate_span, tasks), 1):
+            parts.append(part)
+            logger.info(f"Лунный календарь: {n}/{len(tasks)} интервалов")
+
+    phase_times = np.concatenate([p[0][0] for p in parts])
+    phase_values = np.concatenate([p[0][1] for p in parts])
+    ingress_times = np.concatenate([p[1][0] for p in parts])
+    ingress_signs = np.concatenate([p[1][1] for p in parts])
+    void_start, void_end, void_bodies = void_periods(
+        ingress_times,
+        np.concatenate([p[2] for p in parts]),
+        np.concatenate([p[3] for p in parts]),
+    )
+
+    with open(output, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, bounds[0], bounds[-1],
+                            len(phase_times), len(ingress_times), len(void_start)))
+        for column, dtype in ((phase_times, '<f8'), (phase_values, 'u1'),
+                              (ingress_times, '<f8'), (ingress_signs, 'u1'),
+                              (void_start, '<f8'), (void_end, '<f8'), (void_bodies, 'u1')):
+            f.write(np.ascontiguousarray(column, dtype=dtype).tobytes())
+
+    logger.info(
+        f"Лунный календарь {start_year}-{end_year} собран за {time.perf_counter() - started:.0f} с: "
+        f"{len(phase_times)} фаз, {len(ingress_times)} ингрессий, "
+        f"{len(void_start)} периодов без курса -> {output}"
+    )
+
+
+# --- ПОИСК ---
+
+class LunarCalendar:
+    """Поиск по предварительно рассчитанному календарю"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.start, self.end, n_phases, n_ingresses, n_voids = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Неверный формат лунного календаря: {path}")
+
+        offset = HEADER.size
+
+        def column(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(self._mm, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes
+            return array
+
+        self.phase_times = column('<f8', n_phases)
+        self.phase_values = column('u1', n_phases)
+        self.ingress_times = column('<f8', n_ingresses)
+        self.ingress_signs = column('u1', n_ingresses)
+        self.void_start = column('<f8', n_voids)
+        self.void_end = column('<f8', n_voids)
+        self.void_bodies = column('u1', n_voids)
+
+    @classmethod
+    def open_if_exists(cls, path=None):
+        """Открывает календарь, если он собран; иначе None"""
+        path = path or Config.LUNAR_CALENDAR_PATH
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            calendar = cls(path)
+            logger.info(
+                f"Лунный календарь: {jd_to_datetime(calendar.start):%Y}-"
+                f"{jd_to_datetime(calendar.end):%Y}, {len(calendar.phase_times)} фаз ({path})"
+            )
+            return calendar
+        except Exception as e:
+            logger.error(f"Ошибка загрузки лунного календаря {path}: {e}")
+            return None
+
+    def covers(self, jd):
+        return self.start <= jd < self.end
+
+    @staticmethod
+    def _last(times, jd):
+        """Индекс последнего события не позже jd (-1, если таких нет)"""
+        return int(np.searchsorted(times, jd, side='right')) - 1
+
+    def phase_at(self, jd):
+        """(индекс фазы, начало фазы) или None вне календаря"""
+        i = self._last(self.phase_times, jd)
+        if i < 0 or not self.covers(jd):
+            return None
+        return int(self.phase_values[i]), float(self.phase_times[i])
+
+    def sign_at(self, jd):
+        """(знак Луны, момент входа) или None вне календаря"""
+        i = self._last(self.ingress_times, jd)
+        if i < 0 or not self.covers(jd):
+            return None
+        return SIGNS[self.ingress_signs[i]], float(self.ingress_times[i])
+
+    def void_at(self, jd):
+        """Период без курса, в который попадает jd, иначе None"""
+        i = self._last(self.void_start, jd)
+        if i < 0 or jd >= self.void_end[i]:
+            return None
+        return self._void(i)
+
+    def _void(self, i):
+        body = self.void_bodies[i]
+        return VoidPeriod(float(self.void_start[i]), float(self.void_end[i]),
+                          VOID_BODIES[body] if body < len(VOID_BODIES) else None)
+
+    def state_at(self, jd):
+        """Фаза, знак и курс Луны (None вне календаря)"""
+        phase, sign = self.phase_at(jd), self.sign_at(jd)
+        if phase is None or sign is None:
+            return None
+        return MoonState(phase[0], phase[1], sign[0], sign[1], self.void_at(jd))
+
+    def next_void(self, jd):
+        """Ближайший период без курса, который еще не закончился"""
+        i = int(np.searchsorted(self.void_end, jd, side='right'))
+        return self._void(i) if i < len(self.void_end) else None
+
+    def iter_events(self, start, end, main_phases=True):
+        """События [start, end) по времени: ('phase', jd, индекс), ('ingress', jd, знак),
+        ('void', начало, VoidPeriod); только срезы таблиц, без копирования всего файла"""
+        def phases():
+            lo, hi = np.searchsorted(self.phase_times, (start, end))
+            for jd, value in zip(self.phase_times[lo:hi], self.phase_values[lo:hi]):
+                if not main_phases or value % 2 == 0:
+                    yield 'phase', float(jd), int(value)
+
+        def ingresses():
+            lo, hi = np.searchsorted(self.ingress_times, (start, end))
+            for jd, sign in zip(self.ingress_times[lo:hi], self.ingress_signs[lo:hi]):
+                yield 'ingress', float(jd), SIGNS[sign]
+
+        def voids():
+            lo, hi = np.searchsorted(self.void_start, (start, end))
+            for i in range(lo, hi):
+                yield 'void', float(self.void_start[i]), self._void(i)
+
+        return heapq.merge(phases(), ingresses(), voids(), key=lambda event: event[1])
+
+    def close(self):
+        """Освобождает mmap и файл"""
+        for name in ('phase_times', 'phase_values', 'ingress_times', 'ingress_signs',
+                     'void_start', 'void_end', 'void_bodies'):
+            setattr(self, name, None)
+        self._mm.close()
+        self._file.close()
+
+
+def phase_from_longitudes(sun, moon):
+    """Индекс фазы по долготам Солнца и Луны (без календаря)"""
+    return int(((moon - sun) % 360.0) // 45.0)
+
+
+# --- iCal ---
+
+def _ical_time(jd):
+    return f"{jd_to_datetime(jd):%Y%m%dT%H%M%SZ}"
+
+
+def _ical_escape(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+
+
+def ical_lines(calendar, start, end):
+    """Строки iCalendar (RFC 5545) для событий [start, end), генератором"""
+    stamp = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}"
+    yield "BEGIN:VCALENDAR"
+    yield "VERSION:2.0"
+    yield "PRODID:-//Natal Guide//Lunar Calendar//RU"
+    yield "CALSCALE:GREGORIAN"
+    for kind, jd, value in calendar.iter_events(start, end):
+        if kind == 'phase':
+            summary = f"{PHASE_EMOJIS[value]} {PHASE_NAMES[value]}"
+            dtend = jd
+        elif kind == 'ingress':
+            summary = f"🌙 Луна {SIGNS_RU_IN[SIGN_INDEX[value]]}"
+            dtend = jd
+        else:
+            summary = "🌙 Луна без курса"
+            dtend = value.end
+        yield "BEGIN:VEVENT"
+        yield f"UID:{kind}-{jd:.6f}@lunar-calendar"
+        yield f"DTSTAMP:{stamp}"
+        yield f"DTSTART:{_ical_time(jd)}"
+        yield f"DTEND:{_ical_time(dtend)}"
+        yield f"SUMMARY:{_ical_escape(summary)}"
+        yield "END:VEVENT"
+    yield "END:VCALENDAR"
+
+
+def write_ical(calendar, start, end, stream):
+    """Пишет календарь в бинарный поток по строкам (CRLF)"""
+    for line in ical_lines(calendar, start, end):
+        stream.write(line.encode('utf-8') + b'\r\n')
+
+
+_calendar = None
+_calendar_loaded = False
+
+
+def get_calendar():
+    """Общий календарь процесса (None, если файл не собран)"""
+    global _calendar, _calendar_loaded
+    if not _calendar_loaded:
+        _calendar = LunarCalendar.open_if_exists()
+        _calendar_loaded = True
+    return _calendar
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Лунный календарь")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_cmd = commands.add_parser('build', help="рассчитать календарь")
+    build_cmd.add_argument('-o', '--output', default=Config.LUNAR_CALENDAR_PATH)
+    build_cmd.add_argument('--start', type=int, default=Config.LUNAR_CALENDAR_START_YEAR)
+    build_cmd.add_argument('--end', type=int, default=Config.LUNAR_CALENDAR_END_YEAR)
+    build_cmd.add_argument('--workers', type=int, default=None)
+
+    ics_cmd = commands.add_parser('ics', help="выгрузить год в iCalendar")
+    ics_cmd.add_argument('year', type=int)
+    ics_cmd.add_argument('-o', '--output', required=True)
+    ics_cmd.add_argument('--calendar', default=Config.LUNAR_CALENDAR_PATH)
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        build_calendar(args.output, args.start, args.end, args.workers)
+    else:
+        calendar = LunarCalendar(args.calendar)
+        with open(args.output, 'wb') as f:
+            write_ical(calendar, datetime_to_jd(datetime(args.year, 1, 1)),
+                       datetime_to_jd(datetime(args.year + 1, 1, 1)), f)
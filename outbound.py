@@ -0,0 +1,268 @@
+# outbound.py
+"""
+Очередь исходящих сообщений с ограничением скорости.
+
+У каждого чата своя очередь и свое маркерное ведро (token bucket),
+плюс одно общее ведро на бота - под лимиты Telegram (~1 сообщение
+в секунду в чат с небольшим всплеском, ~30 в секунду всего). Обработчики
+только ставят сообщения в очередь и не ждут отправки.
+
+Пока сообщение ждет своей очереди, идущие за ним короткие текстовые
+сообщения того же чата склеиваются с ним в одно (до 4096 символов).
+RetryAfter приостанавливает на указанное Telegram время и чат, и общее
+ведро (лимит - на бота). Сетевые ошибки повторяются с экспоненциальной
+задержкой; TimedOut - тоже, кроме документов: после таймаута сообщение
+могло дойти, и повтор тяжелой загрузки дал бы дубль.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+import telegram.error
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Предел длины текста сообщения Telegram
+MESSAGE_LIMIT = 4096
+MERGE_SEPARATOR = '\n\n'
+
+
+class TokenBucket:
+    """Маркерное ведро: rate маркеров в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        # Ожидающие получают маркеры по очереди
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Сколько ждать до следующего маркера (0 - можно сразу)"""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        """Ждет и забирает маркер; возвращает время ожидания"""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                wait = self.delay()
+                if not wait:
+                    self.tokens -= 1
+                    return waited
+                waited += wait
+                await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        """Не выдавать маркеры seconds секунд (RetryAfter)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def is_idle(self):
+        """Ведро полное и никто не ждет - состояние можно забыть"""
+        return not self._lock.locked() and self.delay() == 0 and self.tokens >= self.capacity
+
+
+class Outgoing:
+    """Сообщение в очереди"""
+    __slots__ = ('method', 'kwargs', 'future', 'queued')
+
+    def __init__(self, method, kwargs, future):
+        self.method = method        # 'send_message' или 'send_document'
+        self.kwargs = kwargs
+        self.future = future
+        self.queued = time.monotonic()
+
+    def mergeable_with(self, other, limit):
+        """Можно ли дописать other в это сообщение"""
+        if self.method != 'send_message' or other.method != 'send_message':
+            return False
+        if 'reply_markup' in self.kwargs or 'reply_markup' in other.kwargs:
+            return False
+        options = {k: v for k, v in self.kwargs.items() if k != 'text'}
+        other_options = {k: v for k, v in other.kwargs.items() if k != 'text'}
+        if options != other_options:
+            return False
+        return len(self.kwargs['text']) + len(MERGE_SEPARATOR) + len(other.kwargs['text']) <= limit
+
+
+class ChatQueue:
+    """Очередь одного чата и его ведро"""
+
+    def __init__(self):
+        self.pending = deque()
+        self.bucket = TokenBucket(Config.OUTBOUND_CHAT_RATE, Config.OUTBOUND_CHAT_BURST)
+        self.worker = None
+
+
+class OutboundSender:
+    """Отправка сообщений через очереди чатов с общим ограничением скорости"""
+
+    def __init__(self, bot=None, global_rate=None, global_burst=None,
+                 max_retries=None, message_limit=MESSAGE_LIMIT):
+        self.bot = bot
+        self.bucket = TokenBucket(global_rate or Config.OUTBOUND_GLOBAL_RATE,
+                                  global_burst or Config.OUTBOUND_GLOBAL_BURST)
+        self.max_retries = max_retries if max_retries is not None else Config.OUTBOUND_MAX_RETRIES
+        self.message_limit = message_limit
+        self._chats = {}
+        self._metrics = dict.fromkeys((
+            'queued', 'api_calls', 'delivered', 'merged', 'retry_after',
+            'timeouts', 'network_errors', 'failed', 'max_queue',
+        ), 0)
+        self._wait_total = 0.0
+        self._throttle_total = 0.0
+
+    def start(self, bot):
+        self.bot = bot
+
+    # --- ПОСТАНОВКА В ОЧЕРЕДЬ ---
+
+    def _enqueue(self, chat_id, method, kwargs):
+        future = asyncio.get_running_loop().create_future()
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = ChatQueue()
+        chat.pending.append(Outgoing(method, dict(kwargs, chat_id=chat_id), future))
+        self._metrics['queued'] += 1
+        self._metrics['max_queue'] = max(self._metrics['max_queue'], len(chat.pending))
+        if chat.worker is None:
+            chat.worker = asyncio.create_task(self._run_chat(chat_id, chat))
+        return future
+
+    def send_message(self, chat_id, text, **kwargs):
+        """Ставит текст в очередь; future получит Message или исключение"""
+        return self._enqueue(chat_id, 'send_message', dict(kwargs, text=text))
+
+    def send_document(self, chat_id, document, **kwargs):
+        """Ставит документ (bytes или файл) в очередь"""
+        return self._enqueue(chat_id, 'send_document', dict(kwargs, document=document))
+
+    # --- ОТПРАВКА ---
+
+    def _take(self, chat):
+        """Первое сообщение очереди со склеенными следующими за ним короткими"""
+        first = chat.pending.popleft()
+        merged = [first]
+        while chat.pending and first.mergeable_with(chat.pending[0], self.message_limit):
+            other = chat.pending.popleft()
+            first.kwargs['text'] += MERGE_SEPARATOR + other.kwargs['text']
+            merged.append(other)
+        self._metrics['merged'] += len(merged) - 1
+        return first, merged
+
+    async def _run_chat(self, chat_id, chat):
+        """Разбирает очередь одного чата по порядку"""
+        try:
+            while chat.pending:
+                self._throttle_total += await chat.bucket.acquire()
+                self._throttle_total += await self.bucket.acquire()
+                message, merged = self._take(chat)
+                await self._deliver(chat, message, merged)
+        finally:
+            chat.worker = None
+            if len(self._chats) > Config.OUTBOUND_MAX_CHATS:
+                self._prune()
+
+    async def _deliver(self, chat, message, merged):
+        """Отправка с повторами; результат - во future всех склеенных сообщений"""
+        chat_id = message.kwargs['chat_id']
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._metrics['api_calls'] += 1
+                result = await getattr(self.bot, message.method)(**message.kwargs)
+            except telegram.error.RetryAfter as e:
+                self._metrics['retry_after'] += 1
+                logger.warning(f"RetryAfter {e.retry_after} с для чата {chat_id}")
+                # Лимит Telegram - на бота: останавливаются все чаты
+                chat.bucket.pause(float(e.retry_after))
+                self.bucket.pause(float(e.retry_after))
+                error = e
+            except telegram.error.BadRequest as e:
+                # Ошибка в самом запросе - повтор не поможет
+                error = e
+                break
+            except (telegram.error.TimedOut, telegram.error.NetworkError) as e:
+                # TimedOut - подкласс NetworkError; сообщение могло и дойти
+                timed_out = isinstance(e, telegram.error.TimedOut)
+                self._metrics['timeouts' if timed_out else 'network_errors'] += 1
+                if timed_out and message.method == 'send_document':
+                    error = e
+                    break
+                delay = min(Config.OUTBOUND_BACKOFF_BASE * 2 ** attempt, Config.OUTBOUND_BACKOFF_MAX)
+                duplicate = " (сообщение могло дойти - возможен дубль)" if timed_out else ""
+                logger.warning(f"{type(e).__name__} при отправке в чат {chat_id}, "
+                               f"повтор через {delay:.1f} с{duplicate}")
+                await asyncio.sleep(delay)
+                error = e
+            except Exception as e:
+                error = e
+                break
+            else:
+                now = time.monotonic()
+                for item in merged:
+                    self._wait_total += now - item.queued
+                    if not item.future.done():
+                        item.future.set_result(result)
+                self._metrics['delivered'] += len(merged)
+                return
+            if attempt < self.max_retries:
+                self._throttle_total += await chat.bucket.acquire()
+                self._throttle_total += await self.bucket.acquire()
+
+        self._metrics['failed'] += len(merged)
+        if not isinstance(error, telegram.error.Forbidden):
+            logger.error(f"Сообщение в чат {chat_id} не отправлено: {error}")
+        for item in merged:
+            if not item.future.done():
+                item.future.set_exception(error)
+                # Исключение забирается здесь, чтобы не было предупреждений о
+                # необработанных future (обработчики отправку не ждут)
+                item.future.exception()
+
+    def _prune(self):
+        """Забывает простаивающие чаты"""
+        for chat_id in [cid for cid, chat in self._chats.items()
+                        if chat.worker is None and not chat.pending and chat.bucket.is_idle()]:
+            del self._chats[chat_id]
+
+    # --- СОСТОЯНИЕ ---
+
+    def stats(self):
+        """Счетчики очереди для логов"""
+        stats = dict(self._metrics)
+        stats['pending'] = sum(len(chat.pending) for chat in self._chats.values())
+        stats['chats'] = len(self._chats)
+        delivered = stats['delivered'] or 1
+        stats['avg_wait_ms'] = round(self._wait_total / delivered * 1000, 1)
+        stats['throttle_s'] = round(self._throttle_total, 1)
+        return stats
+
+    async def drain(self, timeout=None):
+        """Ждет отправки всего, что в очереди"""
+        workers = [chat.worker for chat in self._chats.values() if chat.worker is not None]
+        if workers:
+            await asyncio.wait(workers, timeout=timeout)
+
+    async def close(self, timeout=10):
+        """Дожидается очередей (не дольше timeout) и останавливает обработчики"""
+        await self.drain(timeout)
+        for chat in self._chats.values():
+            if chat.worker is not None:
+                chat.worker.cancel()
+        logger.info(f"Очередь отправки остановлена: {self.stats()}")
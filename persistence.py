@@ -0,0 +1,190 @@
+# persistence.py
+"""
+Постоянное хранение состояния бота: шаги диалогов ConversationHandler,
+user_data, chat_data и bot_data.
+
+По умолчанию - SQLite (WAL): одна таблица "вид, ключ -> значение pickle".
+Базу делят локальные процессы-шарды (sharding.py): каждый чат
+обрабатывает всегда один шард, а при перезапуске с другим числом шардов
+состояние чата подхватывает новый владелец. Шарды на других хостах
+(SHARD_URLS) работают каждый со своей базой. При старте шард загружает
+только свои записи (id % SHARDS == SHARD_INDEX); user_data пользователя
+из чужого чата подхватывается перед обновлением. user_data перечитывается
+перед каждым обновлением, если запись в базе новее загруженной.
+
+Бэкенд выбирается Config.PERSISTENCE: 'sqlite' (по умолчанию), 'pickle'
+(PicklePersistence из python-telegram-bot, только без шардов: файл
+переписывается целиком и не перечитывается) или 'none'.
+"""
+
+import json
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput, PicklePersistence
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+USER, CHAT, BOT = 'user', 'chat', 'bot'
+CONVERSATION = 'conv:'
+
+
+class SQLitePersistence(BasePersistence):
+    """Persistence python-telegram-bot поверх SQLite в режиме WAL"""
+
+    def __init__(self, path=None, update_interval=None, shards=None, shard_index=None):
+        super().__init__(
+            store_data=PersistenceInput(callback_data=False),
+            update_interval=update_interval or Config.PERSISTENCE_INTERVAL,
+        )
+        self.path = path or Config.PERSISTENCE_PATH
+        # Шард загружает при старте только свои чаты (None - все)
+        self.shards = shards or Config.SHARDS
+        self.shard_index = shard_index if shard_index is not None else Config.SHARD_INDEX
+        if self.shards < 2:
+            self.shard_index = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "    kind TEXT NOT NULL,"
+            "    key TEXT NOT NULL,"
+            "    value BLOB NOT NULL,"
+            "    updated REAL NOT NULL,"
+            "    PRIMARY KEY (kind, key))"
+        )
+        # Когда запись user_data была загружена этим процессом
+        self._loaded = {}
+        logger.info(f"Состояние бота: {self.path}")
+
+    # --- ХРАНИЛИЩЕ ---
+
+    def _rows(self, kind, own=False):
+        """Записи вида kind; own - только ключи (id) этого шарда"""
+        query, args = "SELECT key, value, updated FROM state WHERE kind = ?", (kind,)
+        if own and self.shard_index is not None:
+            # Остаток как в Python: у групп chat_id отрицательный
+            query += " AND ((CAST(key AS INTEGER) % ?) + ?) % ? = ?"
+            args += (self.shards, self.shards, self.shards, self.shard_index)
+        with self._lock:
+            return self._conn.execute(query, args).fetchall()
+
+    def _put(self, kind, key, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?)",
+                (kind, str(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time())
+            )
+
+    def _delete(self, kind, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE kind = ? AND key = ?", (kind, str(key)))
+
+    def _load_many(self, kind):
+        data = {}
+        now = time.time()
+        for key, value, _ in self._rows(kind, own=True):
+            data[int(key)] = pickle.loads(value)
+            if kind == USER:
+                self._loaded[int(key)] = now
+        return data
+
+    # --- ЧТЕНИЕ ПРИ СТАРТЕ ---
+
+    async def get_user_data(self):
+        return self._load_many(USER)
+
+    async def get_chat_data(self):
+        return self._load_many(CHAT)
+
+    async def get_bot_data(self):
+        rows = self._rows(BOT)
+        return pickle.loads(rows[0][1]) if rows else {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        # Ключ диалога - кортеж (chat_id, user_id), хранится как JSON-список
+        conversations = {}
+        for key, value, _ in self._rows(CONVERSATION + name):
+            key = tuple(json.loads(key))
+            if self.shard_index is None or key[0] % self.shards == self.shard_index:
+                conversations[key] = pickle.loads(value)
+        return conversations
+
+    # --- ЗАПИСЬ ---
+
+    async def update_conversation(self, name, key, new_state):
+        if new_state is None:
+            self._delete(CONVERSATION + name, json.dumps(list(key)))
+        else:
+            self._put(CONVERSATION + name, json.dumps(list(key)), new_state)
+
+    async def update_user_data(self, user_id, data):
+        self._put(USER, user_id, data)
+        self._loaded[user_id] = time.time()
+
+    async def update_chat_data(self, chat_id, data):
+        self._put(CHAT, chat_id, data)
+
+    async def update_bot_data(self, data):
+        self._put(BOT, 0, data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        self._delete(USER, user_id)
+        self._loaded.pop(user_id, None)
+
+    async def drop_chat_data(self, chat_id):
+        self._delete(CHAT, chat_id)
+
+    # --- ОБНОВЛЕНИЕ ПЕРЕД ОБРАБОТКОЙ ---
+
+    async def refresh_user_data(self, user_id, user_data):
+        """Подхватывает user_data, записанный другим процессом (после смены шарда)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, updated FROM state WHERE kind = ? AND key = ?", (USER, str(user_id))
+            ).fetchone()
+        if row is not None and row[1] > self._loaded.get(user_id, 0):
+            user_data.clear()
+            user_data.update(pickle.loads(row[0]))
+            self._loaded[user_id] = row[1]
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        with self._lock:
+            self._conn.close()
+        logger.info(f"Состояние бота сохранено: {self.path}")
+
+
+def create_persistence(backend=None):
+    """Бэкенд состояния по Config.PERSISTENCE (None - без сохранения)"""
+    backend = (backend or Config.PERSISTENCE).lower()
+    if backend == 'none':
+        return None
+    if backend == 'pickle':
+        if Config.SHARDS > 1:
+            raise ValueError("Бэкенд состояния 'pickle' не работает с шардами (SHARDS > 1): "
+                             "используйте PERSISTENCE=sqlite")
+        return PicklePersistence(Config.PERSISTENCE_PICKLE_PATH,
+                                 update_interval=Config.PERSISTENCE_INTERVAL)
+    if backend == 'sqlite':
+        return SQLitePersistence()
+    raise ValueError(f"Неизвестный бэкенд состояния: {backend}")
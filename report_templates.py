@@ -0,0 +1,236 @@
+# report_templates.py
+"""
+Компактный отчет о натальной карте по заранее собранным шаблонам.
+
+Разметка трех сообщений отчета собирается один раз при импорте: каждое
+сообщение - одна строка формата с местами под подстановки, так что текст
+получается одним вызовом format (одним join). Подписи точек берутся из
+таблиц по целому градусу круга (точка, знак и градус сразу):
+- ячейки "♀ Лев 1°" для всех планет - таблица (точки, 360);
+- строки ключевых точек с домом запоминаются при первом использовании;
+- начала строк аспектов "☀️ Солнце □ 🌙 Луна - квадрат, орб " - таблица
+  (точка, аспект, точка).
+Позиции читаются прямо из массива долгот ChartResult, аспекты - из
+колоночного результата AspectEngine.match, без промежуточных объектов.
+
+    python report_templates.py bench --charts 2000
+"""
+
+import argparse
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from aspects import ASPECT_KEYS, ASPECT_SYMBOLS, POINT_KEYS, get_aspect_engine
+from chart_result import PLANET_INDEX, Point
+from config import Config
+from data import POINT_EMOJIS, TRANSLATE
+from sign_format import POSITIONS_EN, POSITIONS_SHORT, whole_degrees
+
+RULE = "═" * 50
+
+# Ключевые точки первого сообщения: (точка, подпись, описание)
+KEY_POINTS = (
+    (Point.SUN, "☀️ Солнце", "Ядро личности"),
+    (Point.MOON, "🌙 Луна", "Эмоции и подсознание"),
+    (Point.ASC, "🌅 Асцендент", "Личность и внешний образ"),
+    (Point.MC, "👑 Зенит (MC)", "Карьера и статус"),
+    (Point.LILITH, "🌑 Лилит", "Теневая сторона"),
+    (Point.SELENA, "⚪ Селена", "Светлый путь"),
+)
+KEY_POINT_INDEX = np.array([point for point, _, _ in KEY_POINTS])
+
+# Планеты второго сообщения: по 3 в строке
+PLANET_ROWS = (
+    (("Sun", "☀️"), ("Moon", "🌙"), ("Mercury", "☿")),
+    (("Venus", "♀"), ("Mars", "♂"), ("Jupiter", "♃")),
+    (("Saturn", "♄"), ("Uranus", "♅"), ("Neptune", "♆")),
+    (("Pluto", "♇"), ("Chiron", "⚕️"), ("Node", "☊")),
+    (("Lilith", "🌑"), ("Selena", "⚪")),
+)
+ROW_POINTS = np.array([PLANET_INDEX[key] for row in PLANET_ROWS for key, _ in row])
+
+# --- ШАБЛОНЫ (собираются при импорте) ---
+
+_REPORT1 = '\n'.join((
+    "📜 <b>ПРОФЕССИОНАЛЬНЫЙ НАТАЛЬНЫЙ АНАЛИЗ: {name}</b>",
+    "📍 <i>{address}...</i>",
+    "📅 <b>Дата:</b> {date} | <b>Время:</b> {time}",
+    "🌐 <b>Координаты:</b> {lat:.4f}° N, {lng:.4f}° E",
+    "⚡ <b>Система:</b> Swiss Ephemeris + Плацидус",
+    RULE,
+    "\n<b>КЛЮЧЕВЫЕ ТОЧКИ:</b>",
+    *["{key[%d]}" % i for i in range(len(KEY_POINTS))],
+    "\n{moon}",
+)).format
+
+_REPORT2 = '\n'.join((
+    "✨ <b>ВСЕ ПЛАНЕТЫ И ТОЧКИ:</b>",
+    RULE,
+    *["  |  ".join(["{}"] * len(row)) for row in PLANET_ROWS],
+)).format
+
+_ASPECTS_TITLE = "\n\n🔗 <b>АСПЕКТЫ:</b>\n"
+
+_REPORT3 = '\n'.join((
+    "🔍 <b>ПРОВЕРКА ТОЧНОСТИ:</b>",
+    "📊 <b>Сравните с astro.com:</b>",
+    "• Дата: {d:02d}.{m:02d}.{y} {hh:02d}:{mm:02d}",
+    "• Координаты: {lat:.4f}°N, {lng:.4f}°E",
+    "• Система домов: Placidus",
+    "\n🔗 <a href='https://www.astro.com/cgi/chart.cgi?lang=e&btyp=w2gw&sday={d}&smon={m}"
+    "&syr={y}&shour={hh}&smin={mm}&nhor=1'>Нажмите для создания карты на astro.com</a>",
+    "\n" + RULE,
+    "✅ <b>РАСЧЕТ ЗАВЕРШЕН!</b>",
+    "<i>Для подробного описания каждой планеты используйте команду /details</i>",
+)).format
+
+# Ячейки планет "♀ Лев 1°": (точка, градус круга)
+_EMOJIS = dict(pair for row in PLANET_ROWS for pair in row)
+PLANET_CELLS = np.empty((len(POINT_KEYS), 360), dtype=object)
+for _i, _key in enumerate(POINT_KEYS):
+    PLANET_CELLS[_i] = [f"{_EMOJIS.get(_key, '⭐')} {position}" for position in POSITIONS_SHORT]
+
+# Начала строк аспектов: (первая точка, аспект, вторая точка)
+ASPECT_PREFIXES = np.array([[[
+    f"{POINT_EMOJIS[first]} {TRANSLATE.get(first, first)} {ASPECT_SYMBOLS[aspect]} "
+    f"{POINT_EMOJIS[second]} {TRANSLATE.get(second, second)} - {TRANSLATE[aspect].lower()}, орб "
+    for second in POINT_KEYS] for aspect in ASPECT_KEYS] for first in POINT_KEYS], dtype=object)
+
+
+@lru_cache(maxsize=None)
+def key_point_line(slot, degree, house):
+    """Строка ключевой точки KEY_POINTS[slot] на целом градусе круга (house 0 - без дома)"""
+    point, label, description = KEY_POINTS[slot]
+    suffix = f" ({house} дом)" if house and point < Point.ASC else ""
+    return f"{label}: <b>{POSITIONS_EN[degree]}</b>{suffix} - {description}"
+
+
+# --- ОТЧЕТ ---
+
+def aspect_lines(chart, limit=None):
+    """Строки аспектов карты, самые точные первыми (без точек-заглушек)"""
+    limit = Config.ASPECTS_IN_REPORT if limit is None else limit
+    matches = get_aspect_engine().match(chart.longitudes)
+    first, second, aspect, orb = matches.first, matches.second, matches.aspect, matches.orb
+    if chart.stubs:
+        stubs = (chart.stubs >> np.arange(len(POINT_KEYS))) & 1
+        keep = (stubs[first] == 0) & (stubs[second] == 0)
+        first, second, aspect, orb = first[keep], second[keep], aspect[keep], orb[keep]
+    order = np.argsort(orb, kind='stable')[:limit]
+    prefixes = ASPECT_PREFIXES[first[order], aspect[order], second[order]]
+    return [f"{prefix}{value:.1f}°" for prefix, value in zip(prefixes, orb[order].tolist())]
+
+
+def render_compact_report(chart, name, date_str, time_str, lat, lng, address, moon_line):
+    """Три сообщения компактного отчета для ChartResult"""
+    degrees = whole_degrees(chart.longitudes)
+    houses = chart.houses()
+
+    key_degrees = degrees[KEY_POINT_INDEX].tolist()
+    key_houses = houses[KEY_POINT_INDEX].tolist()
+    report1 = _REPORT1(
+        name=name.upper(), address=address[:100], date=date_str, time=time_str,
+        lat=lat, lng=lng, moon=moon_line,
+        key=[key_point_line(slot, key_degrees[slot], key_houses[slot])
+             for slot in range(len(KEY_POINTS))],
+    )
+
+    report2 = _REPORT2(*PLANET_CELLS[ROW_POINTS, degrees[ROW_POINTS]])
+    aspects = aspect_lines(chart)
+    if aspects:
+        report2 = ''.join((report2, _ASPECTS_TITLE, '\n'.join(aspects)))
+
+    y, m, d = map(int, date_str.split('-'))
+    hh, mm = map(int, time_str.split(':'))
+    report3 = _REPORT3(d=d, m=m, y=y, hh=hh, mm=mm, lat=lat, lng=lng)
+    return [report1, report2, report3]
+
+
+# --- ЗАМЕР ---
+
+def _reference_report(astro_data, ud, lat, lng, address, moon_line):
+    """Прежняя сборка отчета (списки строк на каждый вызов) - для сравнения в bench"""
+    from aspects import chart_aspects
+    from sign_format import format_positions
+
+    report1 = [f"📜 <b>ПРОФЕССИОНАЛЬНЫЙ НАТАЛЬНЫЙ АНАЛИЗ: {ud['name'].upper()}</b>",
+               f"📍 <i>{address[:100]}...</i>",
+               f"📅 <b>Дата:</b> {ud['date']} | <b>Время:</b> {ud['time']}",
+               f"🌐 <b>Координаты:</b> {lat:.4f}° N, {lng:.4f}° E",
+               "⚡ <b>Система:</b> Swiss Ephemeris + Плацидус", "═" * 50]
+    positions_en = format_positions(astro_data.longitudes, 'en')
+    positions_short = format_positions(astro_data.longitudes, 'short')
+    houses = astro_data.houses()
+    report1.append("\n<b>КЛЮЧЕВЫЕ ТОЧКИ:</b>")
+    for idx, emoji_name, description in KEY_POINTS:
+        house = f" ({houses[idx]} дом)" if houses[idx] and idx < Point.ASC else ""
+        report1.append(f"{emoji_name}: <b>{positions_en[idx]}</b>{house} - {description}")
+    report1.append(f"\n{moon_line}")
+
+    report2 = ["✨ <b>ВСЕ ПЛАНЕТЫ И ТОЧКИ:</b>", "═" * 50]
+    for group in PLANET_ROWS:
+        report2.append("  |  ".join(f"{emoji} {positions_short[PLANET_INDEX[key]]}"
+                                    for key, emoji in group))
+    aspects = chart_aspects(astro_data)[:Config.ASPECTS_IN_REPORT]
+    if aspects:
+        report2.append("\n🔗 <b>АСПЕКТЫ:</b>")
+        for aspect in aspects:
+            report2.append(
+                f"{POINT_EMOJIS[aspect.first]} {TRANSLATE.get(aspect.first, aspect.first)} "
+                f"{ASPECT_SYMBOLS[aspect.aspect]} "
+                f"{POINT_EMOJIS[aspect.second]} {TRANSLATE.get(aspect.second, aspect.second)} - "
+                f"{TRANSLATE[aspect.aspect].lower()}, орб {aspect.orb:.1f}°")
+
+    y, m, d = map(int, ud['date'].split('-'))
+    hh, mm = map(int, ud['time'].split(':'))
+    astro_link = (f"https://www.astro.com/cgi/chart.cgi?lang=e&btyp=w2gw&sday={d}&smon={m}"
+                  f"&syr={y}&shour={hh}&smin={mm}&nhor=1")
+    report3 = ["🔍 <b>ПРОВЕРКА ТОЧНОСТИ:</b>", "📊 <b>Сравните с astro.com:</b>",
+               f"• Дата: {d:02d}.{m:02d}.{y} {hh:02d}:{mm:02d}",
+               f"• Координаты: {lat:.4f}°N, {lng:.4f}°E", "• Система домов: Placidus",
+               f"\n🔗 <a href='{astro_link}'>Нажмите для создания карты на astro.com</a>",
+               "\n" + "═" * 50, "✅ <b>РАСЧЕТ ЗАВЕРШЕН!</b>",
+               "<i>Для подробного описания каждой планеты используйте команду /details</i>"]
+    return ['\n'.join(report1), '\n'.join(report2), '\n'.join(report3)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Компактный отчет о карте")
+    sub = parser.add_subparsers(dest='command', required=True)
+    bench = sub.add_parser('bench', help="стоимость отчета на карту: прежняя сборка и шаблоны")
+    bench.add_argument('--charts', type=int, default=2000)
+    args = parser.parse_args()
+
+    from chart_result import ChartResult
+
+    rng = np.random.default_rng(1)
+    charts = []
+    for i in range(args.charts):
+        longitudes = rng.uniform(0, 360, len(Point))
+        cusps = (longitudes[Point.ASC] + np.arange(12) * 30) % 360
+        longitudes[Point.MC] = cusps[9]
+        charts.append(ChartResult(longitudes, cusps, f"Тест {i}", 2000, 1, 1, 12, 0, 55.75, 37.62,
+                                  stubs=1 << Point.CHIRON if i % 2 else 0))
+    ud = {'name': 'Тест', 'date': '2000-01-01', 'time': '12:00'}
+    args_common = (55.7558, 37.6173, "Москва, Центральный федеральный округ, Россия")
+    moon = "🌔 Луна при рождении: растущая"
+
+    began = time.perf_counter()
+    before = [_reference_report(chart, ud, *args_common, moon) for chart in charts]
+    reference = time.perf_counter() - began
+
+    began = time.perf_counter()
+    after = [render_compact_report(chart, ud['name'], ud['date'], ud['time'], *args_common, moon)
+             for chart in charts]
+    compiled = time.perf_counter() - began
+
+    print(f"{args.charts} карт, прежняя сборка: {reference / args.charts * 1e6:.0f} мкс на карту")
+    print(f"{args.charts} карт, шаблоны:         {compiled / args.charts * 1e6:.0f} мкс на карту "
+          f"(x{reference / compiled:.1f})")
+    print(f"Текст совпадает: {before == after}")
+
+
+if __name__ == '__main__':
+    main()
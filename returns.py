@@ -0,0 +1,134 @@
+# returns.py
+"""
+Соляры и лунары - моменты возвращения Солнца (Луны) в натальную долготу.
+
+Момент находится методом Ньютона по долготе и скорости из swe.calc_ut
+(флаг скорости): t = t - (долгота(t) - натальная) / скорость(t). От хорошего
+начального приближения хватает 3-4 обращений к эфемеридам. Все лунары
+года считаются одним пакетом: итерации Ньютона идут сразу по массиву
+приближений, по одному вызову эфемерид на приближение за итерацию.
+"""
+
+import logging
+from datetime import datetime
+from typing import NamedTuple
+
+import numpy as np
+
+from chart_result import Point
+from correct_astrology_calc import get_engine, PLANET_CODES, _SWE_LOCK
+from data import TRANSLATE, POINT_EMOJIS
+from events import jd_to_datetime, datetime_to_jd
+from sign_format import format_positions
+
+logger = logging.getLogger(__name__)
+
+# Сидерический месяц (сутки)
+SIDEREAL_MONTH = 27.321661
+# Средняя скорость Луны (градусов в сутки) для начального приближения
+MOON_MEAN_SPEED = 360.0 / SIDEREAL_MONTH
+
+TOLERANCE = 1e-7  # градусов (~0.01 секунды для Солнца)
+MAX_ITERATIONS = 10
+
+
+class ReturnMoment(NamedTuple):
+    """Момент возвращения"""
+    jd: float
+    body: str
+    iterations: int
+
+    @property
+    def when(self):
+        return jd_to_datetime(self.jd)
+
+
+def _wrap180(angle):
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+def newton_returns(body, natal_longitude, guesses, engine=None):
+    """Уточняет моменты возвращения тела для массива приближений.
+
+    Возвращает (моменты, число итераций). Итерации общие для всего массива:
+    уже сошедшиеся приближения повторно не считаются.
+    """
+    engine = engine or get_engine()
+    code = PLANET_CODES[body]
+    jd = np.array(guesses, dtype=np.float64)
+    active = np.ones(len(jd), dtype=bool)
+    iterations = 0
+    with _SWE_LOCK:
+        while active.any() and iterations < MAX_ITERATIONS:
+            iterations += 1
+            for i in np.nonzero(active)[0]:
+                pos = engine.calc_body(jd[i], code)
+                delta = _wrap180(pos[0] - natal_longitude)
+                jd[i] -= delta / pos[3]
+                if abs(delta) < TOLERANCE:
+                    active[i] = False
+    if active.any():
+        logger.warning(f"Возвращение {body}: метод Ньютона не сошелся за {MAX_ITERATIONS} итераций")
+    return jd, iterations
+
+
+def natal_datetime(natal):
+    """Момент рождения карты ChartResult (UT)"""
+    return datetime(natal.year, natal.month, natal.day, natal.hour, natal.minute, natal.second)
+
+
+def solar_return(natal, year):
+    """Соляр: момент возвращения Солнца в натальную долготу в году year"""
+    born = natal_datetime(natal)
+    # Приближение - день рождения в нужном году (29 февраля -> 28-е) в то же время UT
+    if (born.month, born.day) == (2, 29):
+        guess = born.replace(year=year, day=28)
+    else:
+        guess = born.replace(year=year)
+    jd, iterations = newton_returns('Sun', natal.longitude(Point.SUN), [datetime_to_jd(guess)])
+    return ReturnMoment(float(jd[0]), 'Sun', iterations)
+
+
+def lunar_returns(natal, year):
+    """Все лунары года одним пакетом (обычно 13)"""
+    natal_moon = natal.longitude(Point.MOON)
+    start = datetime_to_jd(datetime(year, 1, 1))
+    end = datetime_to_jd(datetime(year + 1, 1, 1))
+
+    # Первое возвращение после начала года по средней скорости, дальше - с шагом месяца
+    moon = get_engine().calc_body(start, PLANET_CODES['Moon'])[0]
+    first = start + ((natal_moon - moon) % 360.0) / MOON_MEAN_SPEED
+    guesses = first + SIDEREAL_MONTH * np.arange(-1, 15)
+
+    jd, iterations = newton_returns('Moon', natal_moon, guesses)
+    jd = np.unique(np.round(jd, 6))
+    return [ReturnMoment(float(t), 'Moon', iterations) for t in jd if start <= t < end]
+
+
+def lunar_return(natal, year, month):
+    """Первый лунар в указанном месяце (None, если в месяце его нет)"""
+    for moment in lunar_returns(natal, year):
+        if moment.when.month == month:
+            return moment
+    return None
+
+
+def format_return_report(title, natal, chart, local_time, tz_name):
+    """Текст карты возвращения (HTML)"""
+    positions = format_positions(chart.longitudes, 'ru')
+    houses = chart.houses()
+    lines = [
+        f"{title} <b>{natal.name}</b>",
+        f"🕰 <b>Момент:</b> {local_time:%d.%m.%Y %H:%M:%S} ({tz_name})",
+        f"🌐 {chart.year}-{chart.month:02d}-{chart.day:02d} {chart.hour:02d}:{chart.minute:02d} UT",
+        f"📍 {chart.lat:.4f}°, {chart.lon:.4f}°",
+        "═" * 30,
+        f"🌅 Асцендент: <b>{positions[Point.ASC]}</b>",
+        f"👑 Зенит (MC): <b>{positions[Point.MC]}</b>",
+    ]
+    for point in (Point.SUN, Point.MOON, Point.MERCURY, Point.VENUS, Point.MARS,
+                  Point.JUPITER, Point.SATURN):
+        key = point.name.title()
+        house = f" ({houses[point]} дом)" if houses[point] else ""
+        lines.append(f"{POINT_EMOJIS[key]} {TRANSLATE[key]}: <b>{positions[point]}</b>{house}")
+    return '\n'.join(lines)
@@ -0,0 +1,282 @@
+# sharding.py
+"""
+Горизонтальное масштабирование: обновления раздаются процессам-шардам
+по chat id.
+
+Маршрутизатор принимает webhook Telegram, проверяет секрет и пересылает
+тело запроса шарду chat_id % N по постоянным соединениям, возвращая
+Telegram ответ шарда (503 перегруженного шарда - сигнал повторить позже).
+Шард - обычный бот в режиме webhook на своем порту, только без регистрации
+webhook. Все обновления одного чата всегда попадают в один процесс, поэтому
+состояние его диалога в памяти не расходится с другими шардами.
+
+Шарды запускаются маршрутизатором локально (Config.SHARDS процессов) или
+работают на других хостах (Config.SHARD_URLS). Локальные шарды делят файлы
+SQLite: состояние диалогов (persistence.py), подписки, кэши карт и
+геокодирования. У шардов на других хостах они свои: такие шарды нельзя
+пересобрать с другим числом процессов, не потеряв состояние чатов, которые
+сменят шард.
+
+Шард на другом хосте запускается с теми же WEBHOOK_URL (путь) и
+WEBHOOK_SECRET, что и маршрутизатор, SHARD_INDEX - номер его адреса в
+SHARD_URLS (с нуля), SHARDS - число адресов, WEBHOOK_PORT - порт из адреса.
+С SHARD_INDEX шард не регистрирует webhook сам. Без явного WEBHOOK_SECRET
+маршрутизатор с SHARD_URLS не запускается: случайный секрет процесса
+удаленные шарды не знают и отвечали бы 403.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from http import HTTPStatus
+from urllib.parse import urlparse
+
+from telegram import Bot
+
+from config import Config
+from webhook import (HttpServer, IDLE_TIMEOUT, SECRET_HEADER, check_secret, read_headers,
+                     register_webhook, webhook_secret)
+
+logger = logging.getLogger(__name__)
+
+# Постоянных соединений маршрутизатора с одним шардом
+SHARD_CONNECTIONS = 32
+# Соединение из пула не используется, если до закрытия шардом по простою
+# (IDLE_TIMEOUT) осталось меньше этого (секунды)
+IDLE_MARGIN = 5
+# Проверка локальных шардов (секунды): упавший шард перезапускается, но если
+# он SHARD_MAX_CRASHES раз подряд живет меньше SHARD_MIN_UPTIME секунд -
+# маршрутизатор останавливается
+SHARD_CHECK_INTERVAL = 1
+SHARD_MIN_UPTIME = 30
+SHARD_MAX_CRASHES = 3
+
+
+def update_chat_id(data):
+    """Чат обновления (JSON от Telegram); без чата - пользователь, иначе 0"""
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        user = value.get('from')
+        if user:
+            return user['id']
+    return 0
+
+
+def shard_of(chat_id, shards):
+    """Номер шарда чата (не меняется, пока не меняется число шардов)"""
+    return chat_id % shards
+
+
+class ShardClient:
+    """Пул keep-alive соединений с одним шардом"""
+
+    def __init__(self, url, path, secret_token):
+        parsed = urlparse(url)
+        self.url = url
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.path = path
+        self.secret_token = secret_token
+        self._idle = []
+        self._slots = asyncio.Semaphore(SHARD_CONNECTIONS)
+
+    async def _connection(self):
+        """Соединение из пула (если шард его еще не закрыл по простою) или новое"""
+        now = time.monotonic()
+        while self._idle:
+            reader, writer, since = self._idle.pop()
+            if now - since < IDLE_TIMEOUT - IDLE_MARGIN and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        return reader, writer, False
+
+    async def _exchange(self, reader, writer, body):
+        """Запрос и ответ шарда: (статус, заголовки); None - соединение закрыто до ответа"""
+        try:
+            writer.write(
+                f"POST {self.path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"{SECRET_HEADER}: {self.secret_token}\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+            await writer.drain()
+            status_line = await reader.readline()
+        except ConnectionError:
+            return None
+        if not status_line:
+            return None
+        status = HTTPStatus(int(status_line.split()[1]))
+        headers = await read_headers(reader)
+        await reader.readexactly(int(headers.get('content-length', '0')))
+        return status, headers
+
+    async def post(self, body):
+        """Пересылает обновление; HTTP-статус шарда (503, если шард недоступен)"""
+        async with self._slots:
+            while True:
+                try:
+                    reader, writer, reused = await self._connection()
+                except OSError as e:
+                    logger.error(f"Шард {self.url} недоступен: {e}")
+                    return HTTPStatus.SERVICE_UNAVAILABLE
+                try:
+                    response = await self._exchange(reader, writer, body)
+                except (OSError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+                    writer.close()
+                    logger.error(f"Ошибка пересылки в шард {self.url}: {e}")
+                    return HTTPStatus.SERVICE_UNAVAILABLE
+                if response is not None:
+                    break
+                writer.close()
+                # Шард закрыл соединение из пула, не прочитав запрос, - повтор на новом
+                if not reused:
+                    logger.error(f"Шард {self.url} закрыл соединение без ответа")
+                    return HTTPStatus.SERVICE_UNAVAILABLE
+            status, headers = response
+            if headers.get('connection', '').lower() == 'close':
+                writer.close()
+            else:
+                self._idle.append((reader, writer, time.monotonic()))
+            return status
+
+    def close(self):
+        for _, writer, _ in self._idle:
+            writer.close()
+        self._idle.clear()
+
+
+class ShardRouter(HttpServer):
+    """Прием webhook и раздача обновлений шардам по chat id"""
+
+    def __init__(self, shard_urls, path, secret_token, host=None, port=None):
+        super().__init__(host or Config.WEBHOOK_LISTEN,
+                         port if port is not None else Config.WEBHOOK_PORT)
+        self.path = path
+        self.secret_token = secret_token
+        self.shards = [ShardClient(url, path, secret_token) for url in shard_urls]
+        self.forwarded = [0] * len(self.shards)
+        self.rejected = [0] * len(self.shards)
+
+    async def handle(self, method, path, headers, body):
+        if urlparse(path).path != self.path:
+            return HTTPStatus.NOT_FOUND
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED
+        if not check_secret(headers, self.secret_token):
+            return HTTPStatus.FORBIDDEN
+        try:
+            chat_id = update_chat_id(json.loads(body))
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return HTTPStatus.BAD_REQUEST
+
+        shard = shard_of(chat_id, len(self.shards))
+        status = await self.shards[shard].post(body)
+        if status == HTTPStatus.OK:
+            self.forwarded[shard] += 1
+        else:
+            self.rejected[shard] += 1
+        return status
+
+    async def stop(self):
+        await super().stop()
+        for shard in self.shards:
+            shard.close()
+        logger.info(f"Маршрутизатор остановлен: переслано {self.forwarded}, отказов {self.rejected}")
+
+
+def spawn_shard(index, count, secret_token):
+    """Запускает процесс шарда index из count на порту WEBHOOK_PORT + 1 + index"""
+    env = dict(os.environ, SHARD_INDEX=str(index), WEBHOOK_PORT=str(Config.WEBHOOK_PORT + 1 + index),
+               WEBHOOK_LISTEN='127.0.0.1', WEBHOOK_SECRET=secret_token)
+    # Пул расчетов делится между шардами, если не задан явно
+    env.setdefault('CALC_WORKERS', str(max(1, (os.cpu_count() or 1) // count)))
+    return subprocess.Popen([sys.executable, sys.argv[0]], env=env)
+
+
+def spawn_local_shards(count, secret_token):
+    """Запускает шарды на этом хосте (порты WEBHOOK_PORT + 1 ...); (процессы, адреса)"""
+    processes = [spawn_shard(index, count, secret_token) for index in range(count)]
+    urls = [f"http://127.0.0.1:{Config.WEBHOOK_PORT + 1 + index}" for index in range(count)]
+    logger.info(f"Запущено шардов: {count} (порты {Config.WEBHOOK_PORT + 1}-{Config.WEBHOOK_PORT + count})")
+    return processes, urls
+
+
+async def watch_shards(processes, secret_token, stop_event):
+    """Перезапускает упавшие шарды до сигнала остановки; False - шард падает сразу
+    после запуска и маршрутизатор надо остановить"""
+    started = [time.monotonic()] * len(processes)
+    crashes = [0] * len(processes)
+    while True:
+        try:
+            await asyncio.wait_for(stop_event.wait(), SHARD_CHECK_INTERVAL)
+            return True
+        except asyncio.TimeoutError:
+            pass
+        for index, process in enumerate(processes):
+            code = process.poll()
+            if code is None:
+                continue
+            now = time.monotonic()
+            crashes[index] = crashes[index] + 1 if now - started[index] < SHARD_MIN_UPTIME else 1
+            if crashes[index] > SHARD_MAX_CRASHES:
+                # Пусть перезапуском займется супервизор (Docker restart policy)
+                logger.critical(f"Шард {index} падает при запуске (код {code}), маршрутизатор остановлен")
+                return False
+            logger.error(f"Шард {index} завершился с кодом {code}, перезапуск")
+            processes[index] = spawn_shard(index, len(processes), secret_token)
+            started[index] = now
+
+
+async def run_router(token, url=None, stop_event=None):
+    """Маршрутизатор: шарды, регистрация webhook и раздача обновлений до сигнала
+    остановки; False - локальный шард не удалось поднять"""
+    url = url or Config.WEBHOOK_URL
+    if Config.SHARD_URLS and not Config.WEBHOOK_SECRET:
+        logger.critical("SHARD_URLS без WEBHOOK_SECRET: шарды на других хостах "
+                        "должны знать секрет маршрутизатора")
+        return False
+    secret_token = webhook_secret()
+    stop_event = stop_event or asyncio.Event()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    processes = []
+    if Config.SHARD_URLS:
+        shard_urls = Config.SHARD_URLS
+    else:
+        processes, shard_urls = spawn_local_shards(Config.SHARDS, secret_token)
+
+    router = ShardRouter(shard_urls, urlparse(url).path or '/', secret_token)
+    await router.start()
+    logger.info(f"Маршрутизатор слушает {router.host}:{router.port}, шардов: {len(shard_urls)}")
+    try:
+        async with Bot(token, base_url=Config.TELEGRAM_API_URL,
+                       base_file_url=Config.TELEGRAM_FILE_URL) as bot:
+            await register_webhook(bot, url, secret_token)
+        if processes:
+            return await watch_shards(processes, secret_token, stop_event)
+        await stop_event.wait()
+        return True
+    finally:
+        await router.stop()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
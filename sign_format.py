@@ -0,0 +1,77 @@
+# sign_format.py
+"""
+Знаки, градусы и подписи позиций через таблицы.
+
+Долгота переводится в номер знака одним целочисленным делением, дальше
+все строки (русское название, "в Овне", короткая форма) берутся из
+заранее построенных таблиц по номеру. Для подписей вида "Лев 1°" есть
+таблицы на 360 целых градусов, поэтому целый массив долгот форматируется
+одним обращением по индексу. Для одного числа возвращается строка,
+для массива - массив строк той же формы.
+
+Функции принимают как одно число, так и массив любой формы: долготы одной
+карты (ChartResult.longitudes) или пакета карт (ChartBatch.longitudes).
+"""
+
+import numpy as np
+
+from chart_result import SIGNS
+from data import TRANSLATE, SIGN_PREPOSITIONS
+
+# Номер знака по английскому ключу и по сокращению (Ari, Tau, ...)
+SIGN_INDEX = {sign: i for i, sign in enumerate(SIGNS)}
+SIGN_INDEX.update({sign[:3]: i for i, sign in enumerate(SIGNS)})
+
+# Таблицы по номеру знака
+SIGNS_RU = tuple(TRANSLATE[sign] for sign in SIGNS)
+SIGNS_RU_IN = tuple(SIGN_PREPOSITIONS[ru] for ru in SIGNS_RU)
+SIGNS_SHORT = ('Овен', 'Телец', 'Близн', 'Рак', 'Лев', 'Дева',
+               'Весы', 'Скорп', 'Стрел', 'Козер', 'Водол', 'Рыбы')
+
+
+def _degree_table(names):
+    """Подписи "<знак> <градус>°" для каждого целого градуса круга"""
+    return np.array([f"{names[d // 30]} {d % 30}°" for d in range(360)], dtype=object)
+
+
+POSITIONS_EN = _degree_table(SIGNS)
+POSITIONS_RU = _degree_table(SIGNS_RU)
+POSITIONS_SHORT = _degree_table(SIGNS_SHORT)
+
+_TABLES = {
+    'en': np.array(SIGNS, dtype=object),
+    'ru': np.array(SIGNS_RU, dtype=object),
+    'in': np.array(SIGNS_RU_IN, dtype=object),
+    'short': np.array(SIGNS_SHORT, dtype=object),
+}
+_POSITION_TABLES = {'en': POSITIONS_EN, 'ru': POSITIONS_RU, 'short': POSITIONS_SHORT}
+
+
+def whole_degrees(longitudes):
+    """Целый градус круга 0..359"""
+    return np.floor(np.asarray(longitudes, dtype=np.float64) % 360).astype(np.intp) % 360
+
+
+def sign_index(longitudes):
+    """Номер знака 0..11 (одно деление на 30)"""
+    return whole_degrees(longitudes) // 30
+
+
+def sign_degree(longitudes):
+    """Целый градус внутри знака 0..29"""
+    return whole_degrees(longitudes) % 30
+
+
+def sign_names(longitudes, style='ru'):
+    """Названия знаков: 'en', 'ru', 'in' ("в Овне") или 'short'"""
+    return _TABLES[style][sign_index(longitudes)]
+
+
+def format_positions(longitudes, style='short'):
+    """Подписи позиций "Лев 1°": 'en', 'ru' или 'short'"""
+    return _POSITION_TABLES[style][whole_degrees(longitudes)]
+
+
+def sign_key_index(sign):
+    """Номер знака по английскому ключу или сокращению (None, если неизвестен)"""
+    return SIGN_INDEX.get(sign)
@@ -0,0 +1,111 @@
+# subscriptions.py
+"""
+Подписчики ежедневной рассылки транзитов.
+SQLite (WAL): для каждого чата - имя и натальные долготы карты одним
+блоком float64, поэтому пачка подписчиков читается сразу в массив NumPy.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+from chart_result import N_POINTS
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriberBatch(NamedTuple):
+    """Пачка подписчиков в колоночном виде"""
+    chat_ids: list
+    names: list
+    longitudes: np.ndarray  # (n, N_POINTS), NaN - точка-заглушка
+
+
+class SubscriptionStore:
+    """Хранилище подписок с постраничным чтением по chat_id"""
+
+    def __init__(self, path=None):
+        self.path = path or Config.SUBSCRIPTIONS_PATH
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS subscriptions ("
+            "    chat_id INTEGER PRIMARY KEY,"
+            "    name TEXT NOT NULL,"
+            "    longitudes BLOB NOT NULL,"
+            "    created INTEGER NOT NULL)"
+        )
+        logger.info(f"Подписки на рассылку: {self.path} ({self.count()} подписчиков)")
+
+    def add(self, chat_id, chart):
+        """Подписывает чат на рассылку по карте ChartResult"""
+        longitudes = np.array(chart.longitudes, dtype='<f8')
+        for i in range(N_POINTS):
+            if chart.is_stub(i):
+                longitudes[i] = np.nan
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO subscriptions VALUES (?, ?, ?, ?)",
+                (chat_id, chart.name, longitudes.tobytes(), int(time.time()))
+            )
+
+    def remove(self, chat_id):
+        """Отписывает чат; True, если подписка была"""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,))
+        return cursor.rowcount > 0
+
+    def is_subscribed(self, chat_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM subscriptions WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+        return row is not None
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM subscriptions").fetchone()[0]
+
+    def iter_batches(self, batch_size=None, shards=1, shard_index=0):
+        """Все подписчики пачками SubscriberBatch (по возрастанию chat_id);
+        при shards > 1 - только чаты шарда shard_index (chat_id % shards)"""
+        batch_size = batch_size or Config.DIGEST_BATCH_SIZE
+        # Остаток как в Python: у групп chat_id отрицательный
+        shard_filter = "((chat_id % ?) + ?) % ? = ?"
+        shard_args = (shards, shards, shards, shard_index)
+        last = None
+        while True:
+            with self._lock:
+                if last is None:
+                    rows = self._conn.execute(
+                        "SELECT chat_id, name, longitudes FROM subscriptions "
+                        f"WHERE {shard_filter} ORDER BY chat_id LIMIT ?",
+                        (*shard_args, batch_size)
+                    ).fetchall()
+                else:
+                    rows = self._conn.execute(
+                        "SELECT chat_id, name, longitudes FROM subscriptions "
+                        f"WHERE chat_id > ? AND {shard_filter} ORDER BY chat_id LIMIT ?",
+                        (last, *shard_args, batch_size)
+                    ).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            longitudes = np.frombuffer(b''.join(row[2] for row in rows), dtype='<f8')
+            yield SubscriberBatch(
+                [row[0] for row in rows],
+                [row[1] for row in rows],
+                longitudes.reshape(len(rows), N_POINTS),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,123 @@
+# synastry.py
+"""
+Синастрия - сравнение двух натальных карт.
+
+Матрица перекрестных аспектов (все точки первой карты против всех точек
+второй) считается одной операцией над массивами долгот ChartResult.
+Дома накладываются в обе стороны: точки первой карты по куспидам второй
+и наоборот. Контакты ранжируются по весу точек, виду аспекта и орбу.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from aspects import AspectEngine, POINT_KEYS, ASPECT_KEYS, ASPECT_SYMBOLS
+from chart_result import PLANET_NAMES
+from data import TRANSLATE, POINT_EMOJIS
+from houses import place_in_houses
+
+# Вес точек в синастрии: светила, личные планеты и углы важнее
+POINT_WEIGHTS = {
+    'Sun': 3.0, 'Moon': 3.0, 'Venus': 2.5, 'Mars': 2.5, 'Asc': 2.5,
+    'Mercury': 2.0, 'Mc': 1.5, 'Jupiter': 1.5, 'Saturn': 1.5, 'Node': 1.2,
+    'Uranus': 1.0, 'Neptune': 1.0, 'Pluto': 1.0, 'Chiron': 1.0,
+    'Lilith': 0.8, 'Selena': 0.8,
+}
+ASPECT_WEIGHTS = {'Conj': 1.0, 'Oppo': 0.9, 'Trine': 0.8, 'Squa': 0.8, 'Sext': 0.6}
+# Гармоничные и напряженные аспекты (соединение нейтрально)
+HARMONIOUS = {'Trine', 'Sext'}
+TENSE = {'Squa', 'Oppo'}
+
+
+class Contact(NamedTuple):
+    """Перекрестный аспект с весом"""
+    first: str      # точка первой карты
+    second: str     # точка второй карты
+    aspect: str
+    orb: float
+    score: float
+
+
+class SynastryResult(NamedTuple):
+    """Результат синастрии"""
+    contacts: list                # Contact по убыванию веса
+    first_in_second: np.ndarray   # дома второй карты для планет первой
+    second_in_first: np.ndarray   # дома первой карты для планет второй
+    harmony: float                # доля веса гармоничных контактов среди гармоничных и напряженных
+
+
+_engine = None
+
+
+def get_cross_engine():
+    """Движок перекрестных аспектов (точки ChartResult против точек ChartResult)"""
+    global _engine
+    if _engine is None:
+        _engine = AspectEngine(other_points=POINT_KEYS)
+    return _engine
+
+
+_WEIGHTS = np.array([POINT_WEIGHTS.get(key, 1.0) for key in POINT_KEYS])
+_ASPECT_WEIGHTS = np.array([ASPECT_WEIGHTS[key] for key in ASPECT_KEYS])
+
+
+def _stub_mask(chart):
+    """Точки-заглушки карты"""
+    return np.array([chart.is_stub(i) for i in range(len(POINT_KEYS))])
+
+
+def compare(first, second):
+    """Синастрия двух ChartResult"""
+    engine = get_cross_engine()
+    m = engine.match(first.longitudes, second.longitudes)
+
+    # Точки-заглушки в контактах не участвуют
+    keep = ~(_stub_mask(first)[m.first] | _stub_mask(second)[m.second])
+    i, j, k, orb = m.first[keep], m.second[keep], m.aspect[keep], m.orb[keep]
+
+    # Вес контакта: точки * аспект * точность (1 в точном аспекте, 0.5 на границе орба)
+    closeness = 1.0 - orb / engine.pair_orbs[i, j, k]
+    scores = _WEIGHTS[i] * _WEIGHTS[j] * _ASPECT_WEIGHTS[k] * (0.5 + 0.5 * closeness)
+    contacts = [
+        Contact(POINT_KEYS[i[n]], POINT_KEYS[j[n]], ASPECT_KEYS[k[n]], float(orb[n]), float(scores[n]))
+        for n in np.argsort(-scores, kind='stable')
+    ]
+
+    planets = len(PLANET_NAMES)
+    first_in_second = place_in_houses(first.longitudes[:planets], second.cusps)
+    second_in_first = place_in_houses(second.longitudes[:planets], first.cusps)
+
+    good = sum(c.score for c in contacts if c.aspect in HARMONIOUS)
+    bad = sum(c.score for c in contacts if c.aspect in TENSE)
+    harmony = good / (good + bad) if good + bad else 0.5
+    return SynastryResult(contacts, first_in_second, second_in_first, harmony)
+
+
+def format_synastry_report(first, second, result, limit=15):
+    """Текст отчета синастрии (HTML)"""
+    lines = [
+        f"💞 <b>СИНАСТРИЯ: {first.name} и {second.name}</b>",
+        "═" * 30,
+        f"⚖️ <b>Гармония:</b> {result.harmony * 100:.0f}% "
+        f"({len(result.contacts)} контактов)",
+        "",
+        "🔗 <b>ГЛАВНЫЕ КОНТАКТЫ:</b>",
+    ]
+    for c in result.contacts[:limit]:
+        lines.append(
+            f"{POINT_EMOJIS[c.first]} {TRANSLATE[c.first]} ({first.name}) "
+            f"{ASPECT_SYMBOLS[c.aspect]} {POINT_EMOJIS[c.second]} {TRANSLATE[c.second]} "
+            f"({second.name}) - {TRANSLATE[c.aspect].lower()}, орб {c.orb:.1f}°"
+        )
+    if not result.contacts:
+        lines.append("<i>Точных контактов нет</i>")
+
+    for owner, other, houses in ((first, second, result.first_in_second),
+                                 (second, first, result.second_in_first)):
+        lines.append("")
+        lines.append(f"🏠 <b>{owner.name}: планеты в домах карты {other.name}</b>")
+        parts = [f"{POINT_EMOJIS[key]} {houses[n]}" for n, key in enumerate(PLANET_NAMES)
+                 if houses[n] and not owner.is_stub(n)]
+        lines.append("  ".join(parts) if parts else "<i>Дома не рассчитаны</i>")
+    return '\n'.join(lines)
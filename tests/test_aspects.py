@@ -0,0 +1,61 @@
+# tests/test_aspects.py
+import numpy as np
+
+from aspects import AspectEngine, POINT_KEYS, chart_aspects, orb_table, separation
+from chart_result import ChartResult, Point
+
+ORBS = {'Conj': 8.0, 'Sext': 4.0, 'Squa': 6.0, 'Trine': 6.0, 'Oppo': 8.0}
+
+
+def test_separation_wraps_around_zero():
+    assert separation(359.0, 1.0) == 2.0
+    assert separation(10.0, 190.0) == 180.0
+    assert np.allclose(separation([0.0, 350.0], [90.0, 20.0]), [90.0, 30.0])
+
+
+def test_orb_table_factors_and_overrides():
+    table = orb_table(('Sun', 'Mars', 'Moon'), ORBS, {'Sun': 1.25}, {'Moon': {'Conj': 10.0}})
+    assert table[0, 0] == 10.0        # 8 * 1.25
+    assert table[1, 2] == 6.0         # квадрат Марса без множителя
+    assert table[2, 0] == 10.0        # орб, заданный точке явно
+    assert table[2, 1] == 4.0
+
+
+def test_find_single_chart():
+    engine = AspectEngine(('Sun', 'Moon', 'Mars'), orbs=ORBS, factors={}, overrides={})
+    # Солнце-Луна: точный трин, Солнце-Марс: соединение через 0°, Луна-Марс: ничего
+    aspects = engine.find([358.0, 118.0, 5.0])
+    assert [(a.first, a.second, a.aspect) for a in aspects] == [
+        ('Sun', 'Moon', 'Trine'), ('Sun', 'Mars', 'Conj'),
+    ]
+    assert np.isclose(aspects[0].orb, 0.0) and np.isclose(aspects[1].orb, 7.0)
+
+
+def test_batch_matches_single_charts():
+    engine = AspectEngine(orbs=ORBS, factors={}, overrides={})
+    rng = np.random.default_rng(1)
+    charts = rng.uniform(0, 360, (20, len(POINT_KEYS)))
+    assert engine.find_many(charts) == [engine.find(chart) for chart in charts]
+
+
+def test_cross_aspects_transits_to_natal():
+    engine = AspectEngine(('Saturn',), other_points=('Sun', 'Moon'),
+                          orbs=ORBS, factors={}, overrides={})
+    aspects = engine.find([100.0], [10.5, 280.0])
+    assert [(a.first, a.second, a.aspect) for a in aspects] == [
+        ('Saturn', 'Moon', 'Oppo'), ('Saturn', 'Sun', 'Squa'),
+    ]
+
+
+def test_fixed_pairs_and_stubs_skipped():
+    longitudes = np.zeros(len(Point))
+    longitudes[Point.LILITH], longitudes[Point.SELENA] = 10.0, 190.0
+    longitudes[Point.ASC], longitudes[Point.MC] = 50.0, 320.0
+    cusps = np.arange(12) * 30.0
+    chart = ChartResult(longitudes, cusps, 'Тест', 2000, 1, 1, 12, 0, 0.0, 0.0,
+                        stubs=1 << Point.CHIRON)
+    pairs = {(a.first, a.second) for a in chart_aspects(chart)}
+    assert ('Lilith', 'Selena') not in pairs
+    assert ('Asc', 'Mc') not in pairs
+    assert not any('Chiron' in pair for pair in pairs)
+    assert ('Sun', 'Moon') in pairs
@@ -0,0 +1,67 @@
+# tests/test_events.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from events import EventSearch, brent, datetime_to_jd, jd_to_datetime
+
+YEAR_2024 = (datetime_to_jd(datetime(2024, 1, 1)), datetime_to_jd(datetime(2025, 1, 1)))
+TOLERANCE = timedelta(minutes=5)
+
+
+@pytest.fixture(scope='module')
+def search():
+    return EventSearch()
+
+
+def assert_close(found, expected):
+    assert len(found) == len(expected)
+    for moment, reference in zip(found, expected):
+        assert abs(moment - reference) < TOLERANCE, (moment, reference)
+
+
+def test_jd_round_trip():
+    moment = datetime(1987, 7, 14, 16, 42, 17)
+    assert abs(jd_to_datetime(datetime_to_jd(moment)) - moment) < timedelta(milliseconds=1)
+
+
+def test_brent_root():
+    root = brent(lambda x: x * x - 2.0, 0.0, 2.0, -2.0, 2.0, tol=1e-9)
+    assert abs(root - 2 ** 0.5) < 1e-8
+
+
+def test_mercury_stations_2024(search):
+    stations = search.stations(*YEAR_2024, bodies=('Mercury',))
+    # Опубликованные стоянки Меркурия 2024 года (UT); первая - директная 2 января
+    assert_close([e.when for e in stations], [
+        datetime(2024, 1, 2, 3, 8), datetime(2024, 4, 1, 22, 14), datetime(2024, 4, 25, 12, 54),
+        datetime(2024, 8, 5, 4, 56), datetime(2024, 8, 28, 21, 14),
+        datetime(2024, 11, 26, 2, 42), datetime(2024, 12, 15, 20, 56),
+    ])
+    assert [e.retrograde for e in stations] == [False, True, False, True, False, True, False]
+
+
+def test_sun_ingresses_2024(search):
+    ingresses = search.ingresses(*YEAR_2024, bodies=('Sun',))
+    assert [e.sign for e in ingresses][:3] == ['Aquarius', 'Pisces', 'Aries']
+    # Равноденствия и солнцестояния
+    by_sign = {e.sign: e.when for e in ingresses}
+    assert_close([by_sign['Aries'], by_sign['Cancer'], by_sign['Libra'], by_sign['Capricorn']], [
+        datetime(2024, 3, 20, 3, 6), datetime(2024, 6, 20, 20, 51),
+        datetime(2024, 9, 22, 12, 44), datetime(2024, 12, 21, 9, 21),
+    ])
+
+
+def test_retrograde_ingress(search):
+    # Попятный Меркурий вернулся из Девы во Льва 15 августа 2024 (00:15 UT)
+    ingresses = search.ingresses(*YEAR_2024, bodies=('Mercury',))
+    back = [e for e in ingresses if e.retrograde and e.when.month == 8]
+    assert [e.sign for e in back] == ['Leo']
+    assert_close([back[0].when], [datetime(2024, 8, 15, 0, 15)])
+
+
+def test_transit_aspect_to_natal_point(search):
+    start, end = datetime_to_jd(datetime(2024, 1, 1)), datetime_to_jd(datetime(2024, 3, 1))
+    events = search.transits(start, end, {'Sun': 100.0}, bodies=('Sun',))
+    assert [(e.aspect, e.natal) for e in events] == [('Trine', 'Sun')]
+    assert abs(events[0].longitude - 340.0) < 1e-4
@@ -0,0 +1,41 @@
+# tests/test_houses.py
+import numpy as np
+
+from houses import house_of, place_in_houses, place_many
+
+# Неравные дома с переходом через 0° между 9-м и 10-м куспидом
+CUSPS = np.array([100.0, 125.0, 155.0, 190.0, 225.0, 250.0,
+                  280.0, 305.0, 335.0, 10.0, 45.0, 70.0])
+
+
+def test_house_of_cusp_boundaries():
+    assert house_of(100.0, CUSPS) == 1       # на куспиде - уже этот дом
+    assert house_of(124.9, CUSPS) == 1
+    assert house_of(125.0, CUSPS) == 2
+    assert house_of(359.0, CUSPS) == 9
+    assert house_of(0.5, CUSPS) == 9
+    assert house_of(10.0, CUSPS) == 10
+    assert house_of(99.9, CUSPS) == 12
+
+
+def test_nan_and_invalid_cusps_give_zero():
+    assert list(place_in_houses([np.nan, 130.0], CUSPS)) == [0, 2]
+    broken = CUSPS.copy()
+    broken[3], broken[4] = broken[4], broken[3]
+    assert not place_in_houses([130.0], broken).any()
+
+
+def test_place_many_matches_single_charts():
+    rng = np.random.default_rng(7)
+    starts = rng.uniform(0, 360, 50)
+    widths = rng.dirichlet(np.ones(12), 50) * 360.0
+    cusps = (starts[:, None] + np.cumsum(widths, axis=1) - widths[:, :1]) % 360.0
+    cusps[3] = np.nan                       # карта без домов (полярные широты)
+    longitudes = rng.uniform(0, 360, (50, 16))
+    longitudes[5, 2] = np.nan
+
+    houses = place_many(longitudes, cusps)
+    for i in range(50):
+        assert list(houses[i]) == list(place_in_houses(longitudes[i], cusps[i])), i
+    assert not houses[3].any()
+    assert houses[5, 2] == 0
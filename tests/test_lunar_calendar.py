@@ -0,0 +1,99 @@
+# tests/test_lunar_calendar.py
+import io
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from chart_result import sign_of
+from correct_astrology_calc import PLANET_CODES, calculate_correct_positions, get_engine
+from events import datetime_to_jd, jd_to_datetime
+from lunar_calendar import (LunarCalendar, build_calendar, phase_from_longitudes,
+                            void_periods, write_ical)
+
+TOLERANCE = timedelta(minutes=5)
+
+
+@pytest.fixture(scope='module')
+def calendar(tmp_path_factory):
+    path = tmp_path_factory.mktemp('lunar') / 'lunar_calendar.bin'
+    build_calendar(str(path), 2024, 2025, workers=1)
+    calendar = LunarCalendar(str(path))
+    yield calendar
+    calendar.close()
+
+
+def moon_and_sun(jd):
+    engine = get_engine()
+    return (engine.calc_body(jd, PLANET_CODES['Moon'])[0],
+            engine.calc_body(jd, PLANET_CODES['Sun'])[0])
+
+
+def test_start_of_range_has_phase_and_sign(calendar):
+    # Фаза и знак, начавшиеся до 1 января, тоже есть в календаре
+    moon, sun = moon_and_sun(calendar.start)
+    phase, since = calendar.phase_at(calendar.start)
+    assert phase == phase_from_longitudes(sun, moon) and since < calendar.start
+    sign, since = calendar.sign_at(calendar.start)
+    assert sign == sign_of(moon) and since < calendar.start
+    assert calendar.state_at(calendar.start) is not None
+
+
+def test_outside_range(calendar):
+    assert calendar.phase_at(calendar.end + 1) is None
+    assert calendar.state_at(calendar.start - 30) is None
+
+
+def test_phases_match_longitudes(calendar):
+    for jd in np.linspace(calendar.start, calendar.end - 1, 200):
+        moon, sun = moon_and_sun(jd)
+        phase = calendar.phase_at(jd)[0]
+        # У границы фазы расчет по долготам может отличаться на одну
+        assert (phase - phase_from_longitudes(sun, moon)) % 8 in (0, 1, 7)
+
+
+def test_known_new_and_full_moons(calendar):
+    events = list(calendar.iter_events(datetime_to_jd(datetime(2024, 1, 1)),
+                                       datetime_to_jd(datetime(2024, 2, 1))))
+    phases = [(jd_to_datetime(jd), value) for kind, jd, value in events if kind == 'phase']
+    new_moon = next(when for when, value in phases if value == 0)
+    full_moon = next(when for when, value in phases if value == 4)
+    assert abs(new_moon - datetime(2024, 1, 11, 11, 57)) < TOLERANCE
+    assert abs(full_moon - datetime(2024, 1, 25, 17, 54)) < TOLERANCE
+    assert [jd for _, jd, _ in events] == sorted(jd for _, jd, _ in events)
+
+
+def test_void_periods_end_at_ingresses(calendar):
+    assert np.all(np.isin(calendar.void_end, calendar.ingress_times))
+    assert np.all(calendar.void_start <= calendar.void_end)
+    period = calendar.next_void(calendar.start)
+    middle = (period.start + period.end) / 2
+    assert calendar.void_at(middle) == period
+    assert calendar.state_at(middle).void == period
+
+
+def test_void_periods_without_aspects():
+    ingresses = np.array([0.0, 2.5, 5.0])
+    starts, ends, bodies = void_periods(ingresses, np.array([1.0, 2.0, 0.5]),
+                                        np.array([3, 4, 1], dtype=np.uint8))
+    assert list(starts) == [2.0, 2.5] and list(ends) == [2.5, 5.0]
+    assert list(bodies) == [4, 0xFF]
+
+
+def test_ical_export(calendar):
+    stream = io.BytesIO()
+    write_ical(calendar, datetime_to_jd(datetime(2024, 3, 1)), datetime_to_jd(datetime(2024, 4, 1)), stream)
+    text = stream.getvalue().decode('utf-8')
+    assert text.startswith('BEGIN:VCALENDAR\r\n') and text.endswith('END:VCALENDAR\r\n')
+    assert text.count('BEGIN:VEVENT') == text.count('END:VEVENT') > 20
+
+
+def test_birth_moon_phase_falls_back_without_calendar_phase(calendar, monkeypatch):
+    import bot
+
+    chart = calculate_correct_positions('Тест', 2024, 1, 1, 2, 0, 55.75, 37.62)
+    monkeypatch.setattr(bot, 'get_calendar', lambda: calendar)
+    from_calendar = bot.birth_moon_phase(chart)
+    # Календарь, собранный до появления фазы на начало диапазона
+    monkeypatch.setattr(calendar, 'phase_at', lambda jd: None)
+    assert bot.birth_moon_phase(chart).split(' - ')[0] == from_calendar.split(' - ')[0]
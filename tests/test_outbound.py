@@ -0,0 +1,143 @@
+# tests/test_outbound.py
+import asyncio
+import time
+
+import pytest
+import telegram.error
+
+from config import Config
+from outbound import MERGE_SEPARATOR, OutboundSender, TokenBucket
+
+
+class FakeBot:
+    """Bot API в памяти: записывает вызовы, ошибки берет из очереди"""
+
+    def __init__(self, errors=()):
+        self.calls = []
+        self.errors = list(errors)
+
+    async def _call(self, method, kwargs):
+        self.calls.append((time.monotonic(), method, kwargs))
+        if self.errors:
+            error = self.errors.pop(0)
+            if error is not None:
+                raise error
+        return len(self.calls)
+
+    async def send_message(self, **kwargs):
+        return await self._call('send_message', kwargs)
+
+    async def send_document(self, **kwargs):
+        return await self._call('send_document', kwargs)
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(Config, 'OUTBOUND_BACKOFF_BASE', 0.01)
+    monkeypatch.setattr(Config, 'OUTBOUND_CHAT_RATE', 100.0)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_token_bucket_rate_and_pause():
+    async def scenario():
+        bucket = TokenBucket(rate=20, capacity=2)
+        waits = [await bucket.acquire() for _ in range(4)]
+        assert waits[:2] == [0.0, 0.0]
+        assert 0.03 < waits[2] < 0.08          # маркер раз в 50 мс
+
+        bucket.pause(0.2)
+        assert bucket.delay() > 0.15
+        started = time.monotonic()
+        await bucket.acquire()
+        assert time.monotonic() - started >= 0.19
+    run(scenario())
+
+
+def test_token_bucket_idle():
+    async def scenario():
+        bucket = TokenBucket(rate=1000, capacity=3)
+        assert bucket.is_idle()
+        await bucket.acquire()
+        assert not bucket.is_idle()
+        await asyncio.sleep(0.01)
+        assert bucket.is_idle()
+    run(scenario())
+
+
+def test_short_messages_merged_in_order():
+    async def scenario():
+        bot = FakeBot()
+        sender = OutboundSender(bot, global_rate=1000, global_burst=1000)
+        sender.send_message(1, 'начало', parse_mode='HTML')
+        futures = [sender.send_message(1, f"часть {i}", parse_mode='HTML') for i in range(3)]
+        sender.send_message(1, 'другой режим')
+        keyboard = sender.send_message(1, 'с кнопками', parse_mode='HTML', reply_markup=object())
+        await sender.drain()
+
+        texts = [kwargs['text'] for _, _, kwargs in bot.calls]
+        # Пока очередь ждет, сообщения с теми же параметрами склеиваются
+        assert texts[0] == MERGE_SEPARATOR.join(['начало'] + [f"часть {i}" for i in range(3)])
+        assert texts[1:] == ['другой режим', 'с кнопками']
+        assert {f.result() for f in futures} == {1}
+        assert keyboard.result() == 3
+        assert sender.stats()['merged'] == 3
+    run(scenario())
+
+
+def test_merge_respects_limit():
+    async def scenario():
+        bot = FakeBot()
+        sender = OutboundSender(bot, global_rate=1000, global_burst=1000, message_limit=20)
+        for text in ('a' * 5, 'b' * 8, 'c' * 8, 'd' * 8):
+            sender.send_message(1, text)
+        await sender.drain()
+        assert [kwargs['text'] for _, _, kwargs in bot.calls] == [
+            'a' * 5 + MERGE_SEPARATOR + 'b' * 8, 'c' * 8 + MERGE_SEPARATOR + 'd' * 8,
+        ]
+    run(scenario())
+
+
+def test_retry_after_pauses_all_chats():
+    async def scenario():
+        bot = FakeBot([telegram.error.RetryAfter(1)])
+        sender = OutboundSender(bot, global_rate=1000, global_burst=1000)
+        started = time.monotonic()
+        first = sender.send_message(1, 'x')
+        await asyncio.sleep(0.01)
+        other = sender.send_message(2, 'y')
+        await sender.drain()
+        assert first.result() and other.result()
+        # Второй чат тоже ждал окончания паузы
+        later = [at - started for at, _, kwargs in bot.calls if kwargs['chat_id'] == 2]
+        assert later[0] >= 0.95
+        assert sender.stats()['retry_after'] == 1
+    run(scenario())
+
+
+def test_timed_out_document_not_retried():
+    async def scenario():
+        bot = FakeBot([telegram.error.TimedOut(), telegram.error.TimedOut()])
+        sender = OutboundSender(bot, global_rate=1000, global_burst=1000)
+        document = sender.send_document(1, b'svg')
+        message = sender.send_message(2, 'текст')
+        await sender.drain()
+        assert isinstance(document.exception(), telegram.error.TimedOut)
+        assert message.result()
+        assert [method for _, method, _ in bot.calls].count('send_document') == 1
+        assert [method for _, method, _ in bot.calls].count('send_message') == 2
+    run(scenario())
+
+
+def test_bad_request_fails_without_retry():
+    async def scenario():
+        bot = FakeBot([telegram.error.BadRequest('bad'), None])
+        sender = OutboundSender(bot, global_rate=1000, global_burst=1000, max_retries=3)
+        future = sender.send_message(1, 'x')
+        await sender.drain()
+        assert isinstance(future.exception(), telegram.error.BadRequest)
+        assert len(bot.calls) == 1
+        assert sender.stats()['failed'] == 1
+    run(scenario())
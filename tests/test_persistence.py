@@ -0,0 +1,106 @@
+# tests/test_persistence.py
+import asyncio
+
+import pytest
+
+from config import Config
+from persistence import SQLitePersistence, create_persistence
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'state.sqlite')
+
+
+def test_round_trip(path):
+    store = SQLitePersistence(path, shards=1)
+    run(store.update_user_data(1, {'name': 'Анна'}))
+    run(store.update_chat_data(-5, {'step': 2}))
+    run(store.update_bot_data({'version': 3}))
+    run(store.update_conversation('natal', (-5, 1), 4))
+    run(store.flush())
+
+    store = SQLitePersistence(path, shards=1)
+    assert run(store.get_user_data()) == {1: {'name': 'Анна'}}
+    assert run(store.get_chat_data()) == {-5: {'step': 2}}
+    assert run(store.get_bot_data()) == {'version': 3}
+    assert run(store.get_conversations('natal')) == {(-5, 1): 4}
+    run(store.flush())
+
+
+def test_drop_and_finished_conversation(path):
+    store = SQLitePersistence(path, shards=1)
+    run(store.update_user_data(1, {'a': 1}))
+    run(store.update_conversation('natal', (1, 1), 2))
+    run(store.drop_user_data(1))
+    run(store.update_conversation('natal', (1, 1), None))
+    assert run(store.get_user_data()) == {}
+    assert run(store.get_conversations('natal')) == {}
+    run(store.flush())
+
+
+def test_refresh_picks_up_newer_user_data(path):
+    first = SQLitePersistence(path, shards=1)
+    second = SQLitePersistence(path, shards=1)
+    run(first.update_user_data(1, {'step': 'old'}))
+    user_data = run(second.get_user_data())[1]
+
+    # Без новой записи refresh ничего не меняет
+    run(second.refresh_user_data(1, user_data))
+    assert user_data == {'step': 'old'}
+
+    run(first.update_user_data(1, {'step': 'new'}))
+    run(second.refresh_user_data(1, user_data))
+    assert user_data == {'step': 'new'}
+
+    # Пользователь, которого шард не загружал при старте
+    run(first.update_user_data(2, {'x': 1}))
+    other = {}
+    run(second.refresh_user_data(2, other))
+    assert other == {'x': 1}
+    run(first.flush())
+    run(second.flush())
+
+
+def test_shard_loads_only_own_chats(path):
+    store = SQLitePersistence(path, shards=1)
+    for chat_id in (-5, -4, 1, 2, 3):
+        run(store.update_chat_data(chat_id, {'id': chat_id}))
+        run(store.update_conversation('natal', (chat_id, 7), 1))
+    run(store.flush())
+
+    for index, own in ((0, [-4, 2]), (1, [-5, 1, 3])):
+        shard = SQLitePersistence(path, shards=2, shard_index=index)
+        assert sorted(run(shard.get_chat_data())) == own
+        assert sorted(key[0] for key in run(shard.get_conversations('natal'))) == own
+        run(shard.flush())
+
+
+def test_single_process_loads_everything(path):
+    store = SQLitePersistence(path, shards=1, shard_index=1)
+    assert store.shard_index is None
+    run(store.update_chat_data(-5, {}))
+    run(store.update_chat_data(2, {}))
+    assert sorted(run(store.get_chat_data())) == [-5, 2]
+    run(store.flush())
+
+
+def test_pickle_rejected_with_shards(monkeypatch):
+    monkeypatch.setattr(Config, 'SHARDS', 2)
+    with pytest.raises(ValueError):
+        create_persistence('pickle')
+
+
+def test_backend_selection(monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, 'SHARDS', 1)
+    monkeypatch.setattr(Config, 'PERSISTENCE_PATH', str(tmp_path / 'state.sqlite'))
+    assert create_persistence('none') is None
+    store = create_persistence('sqlite')
+    assert isinstance(store, SQLitePersistence)
+    run(store.flush())
+    with pytest.raises(ValueError):
+        create_persistence('redis')
@@ -0,0 +1,56 @@
+# tests/test_returns.py
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from chart_result import Point
+from correct_astrology_calc import PLANET_CODES, calculate_correct_positions, get_engine
+from returns import SIDEREAL_MONTH, lunar_return, lunar_returns, natal_datetime, solar_return
+
+
+def longitude(body, jd):
+    return get_engine().calc_body(jd, PLANET_CODES[body])[0]
+
+
+def separation(a, b):
+    return abs((a - b + 180.0) % 360.0 - 180.0)
+
+
+@pytest.fixture(scope='module')
+def natal():
+    return calculate_correct_positions('Тест', 1990, 5, 17, 8, 30, 55.75, 37.62, second=42)
+
+
+def test_natal_datetime_keeps_seconds(natal):
+    assert natal_datetime(natal) == datetime(1990, 5, 17, 8, 30, 42)
+
+
+def test_solar_return(natal):
+    moment = solar_return(natal, 2026)
+    assert separation(longitude('Sun', moment.jd), natal.longitude(Point.SUN)) < 1e-6
+    assert abs((moment.when - datetime(2026, 5, 17, 8, 30)).days) <= 1
+    assert moment.iterations <= 5
+
+
+def test_solar_return_leap_day_birth():
+    natal = calculate_correct_positions('Тест', 1996, 2, 29, 12, 0, 55.75, 37.62)
+    moment = solar_return(natal, 2027)
+    assert separation(longitude('Sun', moment.jd), natal.longitude(Point.SUN)) < 1e-6
+    assert moment.when.month in (2, 3)
+
+
+def test_lunar_returns_of_year(natal):
+    moments = lunar_returns(natal, 2026)
+    assert len(moments) in (13, 14)
+    jd = np.array([m.jd for m in moments])
+    assert all(datetime(2026, 1, 1) <= m.when < datetime(2027, 1, 1) for m in moments)
+    assert np.all(np.abs(np.diff(jd) - SIDEREAL_MONTH) < 0.5)
+    for m in moments:
+        assert separation(longitude('Moon', m.jd), natal.longitude(Point.MOON)) < 1e-5
+
+
+def test_lunar_return_in_month(natal):
+    moment = lunar_return(natal, 2026, 7)
+    assert moment is not None and moment.when.month == 7
+    assert moment.jd in [m.jd for m in lunar_returns(natal, 2026)]
@@ -0,0 +1,42 @@
+# tests/test_sharding.py
+import pytest
+
+from sharding import shard_of, update_chat_id
+
+USER = {'id': 7, 'is_bot': False, 'first_name': 'Тест'}
+
+
+def test_message_routed_by_chat():
+    update = {'update_id': 1, 'message': {'message_id': 5, 'chat': {'id': -100123}, 'from': USER}}
+    assert update_chat_id(update) == -100123
+
+
+def test_callback_query_routed_by_message_chat():
+    update = {'update_id': 2, 'callback_query': {
+        'id': 'q', 'from': USER, 'message': {'message_id': 5, 'chat': {'id': 42}},
+    }}
+    assert update_chat_id(update) == 42
+
+
+def test_inline_query_routed_by_user():
+    update = {'update_id': 3, 'inline_query': {'id': 'q', 'from': USER, 'query': ''}}
+    assert update_chat_id(update) == 7
+
+
+def test_update_without_chat_goes_to_zero():
+    assert update_chat_id({'update_id': 4}) == 0
+    assert update_chat_id({}) == 0
+
+
+@pytest.mark.parametrize('chat_id, shards, expected', [
+    (0, 4, 0), (5, 4, 1), (-5, 4, 3), (-100123, 3, 2), (8, 1, 0),
+])
+def test_shard_of(chat_id, shards, expected):
+    assert shard_of(chat_id, shards) == expected
+
+
+def test_shard_of_is_stable_and_in_range():
+    for chat_id in range(-50, 50):
+        shard = shard_of(chat_id, 4)
+        assert 0 <= shard < 4
+        assert shard == shard_of(chat_id, 4)
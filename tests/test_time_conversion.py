@@ -0,0 +1,50 @@
+# tests/test_time_conversion.py
+import random
+import zoneinfo
+from datetime import datetime, timedelta
+
+import pytest
+
+from time_conversion import format_offset, local_to_ut, local_to_ut_many, ut_to_local
+
+ZONES = ['Europe/Moscow', 'Europe/Samara', 'Asia/Yekaterinburg', 'Europe/Kyiv',
+         'Europe/Minsk', 'Asia/Almaty', 'America/New_York', 'Europe/Berlin', 'UTC']
+
+
+@pytest.mark.parametrize('tz_name', ZONES)
+def test_matches_zoneinfo(tz_name):
+    """Смещение совпадает с zoneinfo (fold=0) на случайных датах 1900-2090"""
+    zone = zoneinfo.ZoneInfo(tz_name)
+    rng = random.Random(tz_name)
+    for _ in range(2000):
+        local = datetime(1900, 1, 1) + timedelta(seconds=rng.randrange(190 * 365 * 86400))
+        expected = local - local.replace(tzinfo=zone).utcoffset()
+        assert local_to_ut(local, tz_name).ut == expected, local
+
+
+def test_moscow_history():
+    # Постоянное "летнее" время 2011-2014: UTC+4
+    assert local_to_ut(datetime(2012, 1, 1, 12), 'Europe/Moscow').offset == timedelta(hours=4)
+    assert local_to_ut(datetime(2015, 1, 1, 12), 'Europe/Moscow').offset == timedelta(hours=3)
+
+
+def test_gap_and_overlap():
+    # Берлин: 28.03.2021 02:30 не было, 31.10.2021 02:30 было дважды
+    gap = local_to_ut(datetime(2021, 3, 28, 2, 30), 'Europe/Berlin')
+    assert gap.nonexistent and not gap.ambiguous
+    overlap = local_to_ut(datetime(2021, 10, 31, 2, 30), 'Europe/Berlin')
+    assert overlap.ambiguous and not overlap.nonexistent
+    # Берется первое (летнее) смещение
+    assert overlap.offset == timedelta(hours=2)
+
+
+def test_round_trip_and_batch():
+    moments = [datetime(1985, 6, 1, 8, 15), datetime(2024, 12, 31, 23, 59)]
+    results = local_to_ut_many(moments, 'Asia/Almaty')
+    assert [ut_to_local(r.ut, 'Asia/Almaty') for r in results] == moments
+    assert local_to_ut_many(moments, ['UTC', 'UTC'])[0].ut == moments[0]
+
+
+def test_format_offset():
+    assert format_offset(timedelta(hours=3)) == 'UTC+03:00'
+    assert format_offset(timedelta(hours=-4, minutes=-30)) == 'UTC-04:30'
@@ -0,0 +1,222 @@
+# time_conversion.py
+"""
+Перевод местного времени рождения во всемирное (UT).
+
+Для каждого пояса один раз компилируется таблица исторических переходов
+из файла TZif базы tzdata (включая декретное время СССР, отмены и возвраты
+летнего времени), дальше смещение находится бинарным поиском. Для дат
+после последнего перехода в файле таблица достраивается по правилам пояса.
+
+Местное время может не существовать (перевод часов вперед) или встречаться
+дважды (перевод назад) - такие случаи помечаются в результате.
+"""
+
+import logging
+import os
+import struct
+import zoneinfo
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from importlib import resources
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+# Больше любого смещения пояса: окно поиска переходов вокруг местного времени
+_WINDOW = 26 * 3600
+# До какого года достраиваются переходы по правилам пояса
+EXTEND_UNTIL_YEAR = 2100
+
+
+class LocalTimeResult(NamedTuple):
+    """Результат перевода местного времени в UT"""
+    ut: datetime            # всемирное время (naive)
+    offset: timedelta       # смещение пояса, которое было применено
+    ambiguous: bool         # время встречается дважды (взято первое)
+    nonexistent: bool       # такого времени не было (взято смещение до перехода)
+
+
+def _read_tzif(key):
+    """Читает бинарный файл пояса из системной базы или пакета tzdata"""
+    for base in zoneinfo.TZPATH:
+        path = os.path.join(base, key)
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                return f.read()
+    node = resources.files('tzdata').joinpath('zoneinfo')
+    for part in key.split('/'):
+        node = node.joinpath(part)
+    return node.read_bytes()
+
+
+def _parse_tzif(data):
+    """Возвращает (моменты переходов UTC, смещения: начальное + после каждого перехода)"""
+    if data[:4] != b'TZif':
+        raise ValueError("Неверный формат TZif")
+
+    def counts(pos):
+        return struct.unpack_from('>6l', data, pos + 20)
+
+    isutcnt, isstdcnt, leapcnt, timecnt, typecnt, charcnt = counts(0)
+    time_size, pos = 4, 44
+    if data[4] >= ord('2'):
+        # Пропускаем блок версии 1 и читаем 64-битный блок
+        pos += timecnt * 5 + typecnt * 6 + charcnt + leapcnt * 8 + isstdcnt + isutcnt
+        isutcnt, isstdcnt, leapcnt, timecnt, typecnt, charcnt = counts(pos)
+        time_size, pos = 8, pos + 44
+
+    times = list(struct.unpack_from(f'>{timecnt}{"q" if time_size == 8 else "l"}', data, pos))
+    pos += timecnt * time_size
+    indices = data[pos:pos + timecnt]
+    pos += timecnt
+    utoffs = [struct.unpack_from('>l', data, pos + 6 * i)[0] for i in range(typecnt)]
+
+    offsets = [utoffs[0]] + [utoffs[i] for i in indices]
+    return times, offsets
+
+
+class CompiledZone:
+    """Таблица переходов одного пояса: поиск смещения через bisect"""
+
+    def __init__(self, key):
+        self.key = key
+        times, offsets = _parse_tzif(_read_tzif(key))
+        self._extend(times, offsets, zoneinfo.ZoneInfo(key))
+        self.transitions = times
+        self.offsets = offsets
+
+    @staticmethod
+    def _extend(times, offsets, zone):
+        """Достраивает переходы после последней записи файла по правилам пояса"""
+        def offset_at(seconds):
+            moment = datetime.fromtimestamp(seconds, timezone.utc)
+            return int(moment.astimezone(zone).utcoffset().total_seconds())
+
+        end = int((datetime(EXTEND_UNTIL_YEAR, 1, 1) - _EPOCH).total_seconds())
+        start = times[-1] if times else int((datetime(1900, 1, 1) - _EPOCH).total_seconds())
+        if start >= end:
+            return
+
+        # Шаг неделя: переходы летнего времени не бывают чаще
+        step = 7 * 86400
+        current = offset_at(start)
+        t = start
+        while t < end:
+            nxt = min(t + step, end)
+            if offset_at(nxt) != current:
+                lo, hi = t, nxt
+                while hi - lo > 1:
+                    mid = (lo + hi) // 2
+                    if offset_at(mid) == current:
+                        lo = mid
+                    else:
+                        hi = mid
+                current = offset_at(hi)
+                times.append(hi)
+                offsets.append(current)
+                t = hi
+            else:
+                t = nxt
+
+    def offset_at_utc(self, seconds):
+        """Смещение пояса (секунды) для момента UTC"""
+        return self.offsets[bisect_right(self.transitions, seconds)]
+
+    def local_to_utc(self, local_seconds):
+        """(UTC секунды, смещение, неоднозначно, не существует) для местного времени"""
+        lo = bisect_right(self.transitions, local_seconds - _WINDOW)
+        hi = bisect_right(self.transitions, local_seconds + _WINDOW)
+
+        valid = []
+        for offset in dict.fromkeys(self.offsets[lo:hi + 1]):
+            if self.offset_at_utc(local_seconds - offset) == offset:
+                valid.append(offset)
+        if valid:
+            return local_seconds - valid[0], valid[0], len(valid) > 1, False
+
+        # Время попало в "дыру" при переводе часов вперед
+        for i in range(lo, hi):
+            before, after = self.offsets[i], self.offsets[i + 1]
+            if self.transitions[i] + before <= local_seconds < self.transitions[i] + after:
+                return local_seconds - before, before, False, True
+        offset = self.offsets[lo]
+        return local_seconds - offset, offset, False, True
+
+    def to_ut(self, local_dt):
+        """Переводит naive местное время в LocalTimeResult"""
+        local_seconds = (local_dt - _EPOCH) // _SECOND
+        utc_seconds, offset, ambiguous, nonexistent = self.local_to_utc(local_seconds)
+        return LocalTimeResult(
+            _EPOCH + timedelta(seconds=utc_seconds),
+            timedelta(seconds=offset),
+            ambiguous,
+            nonexistent,
+        )
+
+
+@lru_cache(maxsize=None)
+def get_zone(tz_name):
+    """Скомпилированная таблица пояса (компилируется один раз на процесс)"""
+    zone = CompiledZone(tz_name)
+    logger.debug(f"Пояс {tz_name}: {len(zone.transitions)} переходов")
+    return zone
+
+
+def local_to_ut(local_dt, tz_name):
+    """Переводит местное время (naive datetime) в UT с учетом истории пояса"""
+    return get_zone(tz_name).to_ut(local_dt)
+
+
+def ut_to_local(ut_dt, tz_name):
+    """Переводит UT (naive datetime) в местное время пояса (naive)"""
+    offset = get_zone(tz_name).offset_at_utc((ut_dt - _EPOCH) // _SECOND)
+    return ut_dt + timedelta(seconds=offset)
+
+
+def local_to_ut_many(local_datetimes, tz_names):
+    """Пакетный перевод; tz_names - один пояс для всех или список по записям"""
+    if isinstance(tz_names, str):
+        zone = get_zone(tz_names)
+        return [zone.to_ut(dt) for dt in local_datetimes]
+    return [get_zone(tz).to_ut(dt) for dt, tz in zip(local_datetimes, tz_names)]
+
+
+def format_offset(offset):
+    """Смещение в виде UTC+03:00"""
+    seconds = int(offset.total_seconds())
+    sign = '+' if seconds >= 0 else '-'
+    hours, rest = divmod(abs(seconds), 3600)
+    return f"UTC{sign}{hours:02d}:{rest // 60:02d}"
+
+
+# Проверка по zoneinfo
+if __name__ == "__main__":
+    import random
+    import time
+
+    logging.basicConfig(level=logging.INFO)
+
+    for tz_name in ['Europe/Moscow', 'Europe/Samara', 'Asia/Almaty', 'America/New_York']:
+        zone = get_zone(tz_name)
+        rng = random.Random(1)
+        samples = [datetime(1900, 1, 1) + timedelta(minutes=rng.randrange(200 * 365 * 1440))
+                   for _ in range(20000)]
+
+        start = time.perf_counter()
+        results = local_to_ut_many(samples, tz_name)
+        elapsed = (time.perf_counter() - start) / len(samples) * 1e6
+
+        reference = zoneinfo.ZoneInfo(tz_name)
+        mismatches = 0
+        for dt, res in zip(samples, results):
+            expected = dt.replace(tzinfo=reference).astimezone(timezone.utc).replace(tzinfo=None)
+            if expected != res.ut:
+                mismatches += 1
+        print(f"{tz_name}: {len(zone.transitions)} переходов, {elapsed:.1f} мкс/дата, "
+              f"расхождений с zoneinfo: {mismatches}")
+
+    result = local_to_ut(datetime(1987, 7, 25, 12, 0), 'Europe/Samara')
+    print(f"🎯 25.07.1987 12:00 Ижевск -> {result.ut} UT ({format_offset(result.offset)})")
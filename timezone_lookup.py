@@ -0,0 +1,124 @@
+# timezone_lookup.py
+"""
+Определение часового пояса по координатам.
+Один TimezoneFinder на процесс (загружается при первом обращении) и
+ограниченный кэш по ячейкам сетки координат. Ячейка кэшируется, только
+если во всех ее углах один и тот же пояс; у границ поясов - точный поиск.
+Если собран растр поясов (tz_raster.py), поиск идет по нему.
+"""
+
+import logging
+import math
+import threading
+from collections import OrderedDict
+
+from timezonefinder import TimezoneFinder
+
+from config import Config
+from tz_raster import TimezoneRaster
+
+logger = logging.getLogger(__name__)
+
+# Маркер ячейки, через которую проходит граница поясов
+BORDER = object()
+
+_finder = None
+_finder_lock = threading.Lock()
+
+
+def get_finder():
+    """Возвращает общий TimezoneFinder, создавая его при первом вызове"""
+    global _finder
+    if _finder is None:
+        with _finder_lock:
+            if _finder is None:
+                _finder = TimezoneFinder(in_memory=Config.TIMEZONE_IN_MEMORY)
+                logger.info(f"TimezoneFinder загружен (in_memory={Config.TIMEZONE_IN_MEMORY})")
+    return _finder
+
+
+def preload():
+    """Загружает данные поясов заранее, чтобы первый запрос не ждал"""
+    get_finder().timezone_at(lng=37.6, lat=55.75)
+
+
+class TimezoneGridCache:
+    """LRU-кэш часовых поясов по квантованным координатам"""
+
+    def __init__(self, step=None, max_entries=None):
+        self.step = step or Config.TIMEZONE_GRID_STEP
+        self.max_entries = max_entries or Config.TIMEZONE_CACHE_SIZE
+        self._cells = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.border_lookups = 0
+
+    def _cell(self, lat, lng):
+        """Индексы ячейки сетки"""
+        return math.floor(lat / self.step), math.floor(lng / self.step)
+
+    def _classify(self, finder, cell):
+        """Пояс ячейки, если он одинаков во всех углах, иначе BORDER"""
+        i, j = cell
+        corners = {
+            finder.timezone_at(lng=(j + dj) * self.step, lat=(i + di) * self.step)
+            for di in (0, 1) for dj in (0, 1)
+        }
+        if len(corners) == 1:
+            tz = corners.pop()
+            if tz is not None:
+                return tz
+        return BORDER
+
+    def lookup(self, lat, lng):
+        """Часовой пояс точки (None, если его нет, например в море)"""
+        finder = get_finder()
+        cell = self._cell(lat, lng)
+        value = self._cells.get(cell)
+
+        if value is None:
+            self.misses += 1
+            value = self._classify(finder, cell)
+            self._cells[cell] = value
+            if len(self._cells) > self.max_entries:
+                self._cells.popitem(last=False)
+        else:
+            self.hits += 1
+            self._cells.move_to_end(cell)
+
+        if value is BORDER:
+            self.border_lookups += 1
+            return finder.timezone_at(lng=lng, lat=lat)
+        return value
+
+    def stats(self):
+        """Счетчики кэша"""
+        return {
+            'cells': len(self._cells),
+            'hits': self.hits,
+            'misses': self.misses,
+            'border_lookups': self.border_lookups,
+        }
+
+
+_grid_cache = TimezoneGridCache()
+_raster = TimezoneRaster.open_if_exists(_grid_cache.lookup)
+
+
+def get_timezone(lat, lng):
+    """Автоматически находит часовой пояс по координатам"""
+    try:
+        if _raster is not None:
+            return _raster.lookup(lat, lng) or "UTC"
+        return _grid_cache.lookup(lat, lng) or "UTC"
+    except Exception as e:
+        logger.error(f"Ошибка определения часового пояса: {e}")
+        return "UTC"
+
+
+def cache_stats():
+    """Статистика кэша часовых поясов"""
+    stats = _grid_cache.stats()
+    if _raster is not None:
+        stats['raster_border_lookups'] = _raster.border_lookups
+    return stats
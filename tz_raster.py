@@ -0,0 +1,214 @@
+# tz_raster.py
+"""
+Растровый индекс часовых поясов: сетка (по умолчанию 0.05°) с номером пояса
+в каждой ячейке. Файл открывается через mmap, поиск - одно чтение из массива.
+Ячейки, через которые проходит граница поясов, помечены BORDER_ID - только
+для них выполняется точная проверка по полигонам TimezoneFinder.
+
+Формат файла:
+    заголовок | uint16[строки * столбцы] | имена поясов через '\\n'
+
+Сборка и бенчмарк:
+    python tz_raster.py build -o data/tz_raster.bin --workers 8
+    python tz_raster.py bench --gazetteer data/gazetteer.idx
+"""
+
+import argparse
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TZR1'
+# magic, шаг, широта и долгота юго-западного угла, строк, столбцов, поясов, смещение имен
+HEADER = struct.Struct('<4sdddIIII')
+BORDER_ID = 0xFFFF
+
+
+class TimezoneRaster:
+    """Поиск пояса по предварительно собранному растру"""
+
+    def __init__(self, path, fallback):
+        self.path = path
+        self._fallback = fallback
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.step, self.lat0, self.lon0, self.rows, self.cols,
+         n_names, names_offset) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Неверный формат растра: {path}")
+        self._grid = memoryview(self._mm)[HEADER.size:names_offset].cast('H')
+        self.names = self._mm[names_offset:].decode('utf-8').split('\n')[:n_names]
+        self.border_lookups = 0
+
+    @classmethod
+    def open_if_exists(cls, fallback, path=None):
+        """Открывает растр, если он собран; иначе None"""
+        path = path or Config.TIMEZONE_RASTER_PATH
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            raster = cls(path, fallback)
+            logger.info(f"Растр часовых поясов: {raster.rows}x{raster.cols}, шаг {raster.step}° ({path})")
+            return raster
+        except Exception as e:
+            logger.error(f"Ошибка загрузки растра часовых поясов {path}: {e}")
+            return None
+
+    def lookup(self, lat, lng):
+        """Часовой пояс точки: одно чтение из массива, полигоны только у границ"""
+        row = math.floor((lat - self.lat0) / self.step)
+        col = math.floor((lng - self.lon0) / self.step)
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            tz_id = self._grid[row * self.cols + col]
+            if tz_id != BORDER_ID:
+                return self.names[tz_id]
+        self.border_lookups += 1
+        return self._fallback(lat, lng)
+
+    def close(self):
+        """Освобождает mmap и файл"""
+        self._grid.release()
+        self._mm.close()
+        self._file.close()
+
+
+# --- СБОРКА ---
+
+_worker_finder = None
+
+
+def _vertex_rows(args):
+    """Пояса в узлах сетки для диапазона строк (выполняется в процессе пула)"""
+    global _worker_finder
+    if _worker_finder is None:
+        from timezonefinder import TimezoneFinder
+        _worker_finder = TimezoneFinder(in_memory=True)
+
+    lat0, lon0, step, row_start, row_end, cols = args
+    rows = []
+    for r in range(row_start, row_end):
+        lat = max(-89.9999, min(89.9999, lat0 + r * step))
+        rows.append([
+            _worker_finder.timezone_at(lng=max(-180.0, min(180.0, lon0 + c * step)), lat=lat)
+            for c in range(cols + 1)
+        ])
+    return rows
+
+
+def build_raster(output, step=0.05, bbox=(-90.0, 90.0, -180.0, 180.0), workers=None, chunk_rows=8):
+    """Собирает растр: ячейка получает пояс, если он одинаков во всех ее углах"""
+    lat_min, lat_max, lon_min, lon_max = bbox
+    rows = int(round((lat_max - lat_min) / step))
+    cols = int(round((lon_max - lon_min) / step))
+    names = {}
+    grid = array('H')
+
+    tasks = [
+        (lat_min, lon_min, step, start, min(start + chunk_rows, rows + 1), cols)
+        for start in range(0, rows + 1, chunk_rows)
+    ]
+    started = time.perf_counter()
+    previous = None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in executor.map(_vertex_rows, tasks):
+            for vertex_row in chunk:
+                if previous is not None:
+                    for c in range(cols):
+                        corners = {previous[c], previous[c + 1], vertex_row[c], vertex_row[c + 1]}
+                        tz = corners.pop() if len(corners) == 1 else None
+                        if tz is None:
+                            grid.append(BORDER_ID)
+                        else:
+                            grid.append(names.setdefault(tz, len(names)))
+                previous = vertex_row
+            logger.info(f"Растр: {len(grid) // cols}/{rows} строк")
+
+    if len(names) >= BORDER_ID:
+        raise ValueError("Слишком много часовых поясов для uint16")
+    if sys.byteorder == 'big':
+        grid.byteswap()
+
+    names_blob = '\n'.join(sorted(names, key=names.get)).encode('utf-8')
+    names_offset = HEADER.size + len(grid) * 2
+    with open(output, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, step, lat_min, lon_min, rows, cols, len(names), names_offset))
+        grid.tofile(f)
+        f.write(names_blob)
+
+    border = grid.count(BORDER_ID)
+    logger.info(
+        f"Растр собран за {time.perf_counter() - started:.0f} с: {rows}x{cols}, "
+        f"{len(names)} поясов, граничных ячеек {border / len(grid):.1%} -> {output}"
+    )
+
+
+# --- БЕНЧМАРК ---
+
+def benchmark(gazetteer_path, raster_path, country='RU', legacy_sample=200):
+    """Сравнивает способы определения пояса на всех городах страны из индекса"""
+    from timezonefinder import TimezoneFinder
+
+    from gazetteer import Gazetteer
+    import timezone_lookup
+
+    points = [(p.latitude, p.longitude) for p in Gazetteer(gazetteer_path).iter_places(country)]
+    print(f"🌍 Городов ({country}): {len(points)}")
+
+    def run(label, func, sample):
+        start = time.perf_counter()
+        results = [func(lat, lng) for lat, lng in sample]
+        per_call = (time.perf_counter() - start) / len(sample) * 1e6
+        print(f"  {label:<42} {per_call:>10.1f} мкс/запрос")
+        return results
+
+    # Исходная реализация: новый TimezoneFinder на каждый запрос
+    run("TimezoneFinder() на каждый запрос", lambda lat, lng: TimezoneFinder().timezone_at(lng=lng, lat=lat),
+        points[:legacy_sample])
+
+    finder = timezone_lookup.get_finder()
+    exact = run("общий TimezoneFinder (точно)", lambda lat, lng: finder.timezone_at(lng=lng, lat=lat), points)
+
+    grid = timezone_lookup.TimezoneGridCache()
+    run("кэш по сетке (холодный)", grid.lookup, points)
+    run("кэш по сетке (теплый)", grid.lookup, points)
+
+    raster = TimezoneRaster(raster_path, lambda lat, lng: finder.timezone_at(lng=lng, lat=lat))
+    fast = run("растр", raster.lookup, points)
+
+    mismatches = sum(1 for a, b in zip(exact, fast) if a != b)
+    print(f"  Полигонов у границ: {raster.border_lookups}, расхождений с точным поиском: {mismatches}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Растровый индекс часовых поясов")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_cmd = commands.add_parser('build', help="собрать растр")
+    build_cmd.add_argument('-o', '--output', default=Config.TIMEZONE_RASTER_PATH)
+    build_cmd.add_argument('--step', type=float, default=0.05)
+    build_cmd.add_argument('--bbox', type=float, nargs=4, default=(-90.0, 90.0, -180.0, 180.0),
+                           metavar=('LAT_MIN', 'LAT_MAX', 'LON_MIN', 'LON_MAX'))
+    build_cmd.add_argument('--workers', type=int, default=None)
+
+    bench_cmd = commands.add_parser('bench', help="сравнить с get_timezone на городах из индекса")
+    bench_cmd.add_argument('--gazetteer', default=Config.GAZETTEER_PATH)
+    bench_cmd.add_argument('--raster', default=Config.TIMEZONE_RASTER_PATH)
+    bench_cmd.add_argument('--country', default='RU')
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        build_raster(args.output, args.step, tuple(args.bbox), args.workers)
+    else:
+        benchmark(args.gazetteer, args.raster, args.country)
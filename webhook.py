@@ -0,0 +1,472 @@
+# webhook.py
+"""
+Режим webhook: встроенный асинхронный HTTP-сервер принимает обновления
+от Telegram вместо long polling.
+
+- Запрос без верного X-Telegram-Bot-Api-Secret-Token отклоняется (403).
+- Число принятых и еще не обработанных обновлений ограничено: при
+  переполнении сервер отвечает 503, и Telegram повторит доставку позже.
+- Обновления обрабатываются параллельно, но обновления одного чата -
+  строго по порядку (иначе диалог ConversationHandler может разъехаться).
+- Telegram присылает только те типы обновлений, которые бот обрабатывает.
+
+Для проверки без Telegram адрес Bot API задается в Config.TELEGRAM_API_URL,
+а нагрузочный прогон против локального фейкового сервера Bot API:
+    python webhook.py bench --updates 5000 --chats 500
+"""
+
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+import signal
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlparse
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Бот обрабатывает только сообщения (команды и текст диалогов)
+ALLOWED_UPDATES = [Update.MESSAGE]
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+# Простой соединения keep-alive, после которого оно закрывается (секунды)
+IDLE_TIMEOUT = 75
+MAX_BODY = 1024 * 1024
+# Предел семафора BaseUpdateProcessor (см. ChatOrderedUpdateProcessor)
+UNLIMITED_UPDATES = 2 ** 31 - 1
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка внутри чата"""
+
+    def __init__(self, max_concurrent_updates):
+        # Семафор PTB берется до блокировки чата: с настоящим пределом пачка
+        # обновлений одного чата заняла бы все места, ожидая свою блокировку.
+        # Поэтому он не ограничивает, а предел - свой семафор после блокировки
+        super().__init__(UNLIMITED_UPDATES)
+        self.limit = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._locks = {}
+        self._waiting = defaultdict(int)
+        # Принятые webhook-сервером и еще не обработанные обновления
+        self._tracked = set()
+
+    def track(self, update):
+        self._tracked.add(update.update_id)
+
+    @property
+    def in_flight(self):
+        return len(self._tracked)
+
+    async def do_process_update(self, update, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        key = chat.id if chat is not None else None
+        try:
+            if key is None:
+                async with self._slots:
+                    await coroutine
+                return
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = asyncio.Lock()
+            self._waiting[key] += 1
+            try:
+                async with lock, self._slots:
+                    await coroutine
+            finally:
+                self._waiting[key] -= 1
+                if not self._waiting[key]:
+                    del self._waiting[key]
+                    del self._locks[key]
+        finally:
+            if isinstance(update, Update):
+                self._tracked.discard(update.update_id)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+class HttpServer(ABC):
+    """Минимальный асинхронный HTTP/1.1 сервер с keep-alive"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._server = None
+        self._connections = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Простаивающие keep-alive соединения закрываются сразу, иначе
+            # их обработчики отменяются уже при остановке цикла событий
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+
+    @abstractmethod
+    async def handle(self, method, path, headers, body):
+        """Обработка запроса; возвращает HTTPStatus"""
+
+    async def _serve(self, reader, writer):
+        """Соединение keep-alive: запросы читаются по очереди"""
+        self._connections.add(writer)
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = await read_headers(reader)
+
+                length = int(headers.get('content-length', '0'))
+                if length > MAX_BODY:
+                    writer.write(_response(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, close=True))
+                    await writer.drain()
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                status = await self.handle(method, path, headers, body)
+                close = headers.get('connection', '').lower() == 'close'
+                writer.write(_response(status, close))
+                await writer.drain()
+                if close:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+
+class WebhookServer(HttpServer):
+    """Прием обновлений Telegram в очередь Application"""
+
+    def __init__(self, application, path, secret_token, host=None, port=None,
+                 max_pending=None):
+        super().__init__(host or Config.WEBHOOK_LISTEN,
+                         port if port is not None else Config.WEBHOOK_PORT)
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.max_pending = max_pending or Config.UPDATE_QUEUE_SIZE
+        self._metrics = dict.fromkeys(
+            ('accepted', 'forbidden', 'invalid', 'overloaded', 'not_found'), 0)
+
+    async def start(self):
+        await super().start()
+        logger.info(f"Webhook-сервер слушает {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._server is not None:
+            await super().stop()
+            logger.info(f"Webhook-сервер остановлен: {self.stats()}")
+
+    def _pending(self):
+        processor = self.application.update_processor
+        tracked = getattr(processor, 'in_flight', 0)
+        return max(tracked, self.application.update_queue.qsize())
+
+    async def handle(self, method, path, headers, body):
+        """Разбор запроса; возвращает HTTP-статус"""
+        if urlparse(path).path != self.path:
+            self._metrics['not_found'] += 1
+            return HTTPStatus.NOT_FOUND
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED
+        if not check_secret(headers, self.secret_token):
+            self._metrics['forbidden'] += 1
+            return HTTPStatus.FORBIDDEN
+        if self._pending() >= self.max_pending:
+            self._metrics['overloaded'] += 1
+            return HTTPStatus.SERVICE_UNAVAILABLE
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except Exception as e:
+            self._metrics['invalid'] += 1
+            logger.warning(f"Неверное обновление от webhook: {e}")
+            return HTTPStatus.BAD_REQUEST
+        try:
+            self.application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self._metrics['overloaded'] += 1
+            return HTTPStatus.SERVICE_UNAVAILABLE
+        track = getattr(self.application.update_processor, 'track', None)
+        if track is not None:
+            track(update)
+        self._metrics['accepted'] += 1
+        return HTTPStatus.OK
+
+    def stats(self):
+        stats = dict(self._metrics)
+        stats['pending'] = self._pending()
+        return stats
+
+
+async def read_headers(reader):
+    """Заголовки HTTP до пустой строки (имена в нижнем регистре)"""
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            return headers
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+
+def check_secret(headers, secret_token):
+    return hmac.compare_digest(headers.get(SECRET_HEADER, ''), secret_token)
+
+
+def _response(status, close=False):
+    body = status.phrase.encode()
+    return (
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        f"Content-Type: text/plain\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n"
+    ).encode('latin-1') + body
+
+
+async def register_webhook(bot, url, secret_token):
+    """Регистрирует webhook в Telegram только на обрабатываемые типы обновлений"""
+    await bot.set_webhook(
+        url=url,
+        secret_token=secret_token,
+        allowed_updates=ALLOWED_UPDATES,
+        max_connections=Config.WEBHOOK_MAX_CONNECTIONS,
+    )
+    logger.info(f"Webhook зарегистрирован: {url}")
+
+
+def webhook_secret():
+    """Секрет из конфигурации или случайный на время работы процесса"""
+    if Config.WEBHOOK_SECRET:
+        return Config.WEBHOOK_SECRET
+    logger.warning("WEBHOOK_SECRET не задан - используется случайный секрет процесса")
+    return secrets.token_urlsafe(32)
+
+
+async def serve_webhook(application, url=None, server=None, stop_event=None, register=True):
+    """Жизненный цикл приложения в режиме webhook (аналог Application.run_polling).
+
+    register=False - webhook в Telegram регистрирует маршрутизатор шардов.
+    """
+    url = url or Config.WEBHOOK_URL
+    if server is None:
+        server = WebhookServer(application, urlparse(url).path or '/', webhook_secret())
+    stop_event = stop_event or asyncio.Event()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await server.start()
+        if register:
+            await register_webhook(application.bot, url, server.secret_token)
+        await application.start()
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+# --- ПРОВЕРКА ПРОТИВ ФЕЙКОВОГО BOT API ---
+
+class FakeBotApi:
+    """Локальный сервер Bot API: отвечает на getMe/setWebhook/sendMessage и считает ответы"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sent = defaultdict(list)
+        self.webhook = None
+        self.port = None
+
+    async def start(self):
+        server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        self.port = server.sockets[0].getsockname()[1]
+        return server
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    def _result(self, method, params):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+        if method in ('setWebhook', 'deleteWebhook'):
+            self.webhook = params
+            return True
+        if method == 'sendMessage':
+            chat_id = int(params['chat_id'])
+            self.sent[chat_id].append(params['text'])
+            return {'message_id': len(self.sent[chat_id]), 'date': 0,
+                    'chat': {'id': chat_id, 'type': 'private'}, 'text': params['text']}
+        return True
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = await read_headers(reader)
+                body = await reader.readexactly(int(headers.get('content-length', '0')))
+                # python-telegram-bot шлет параметры формой (файлы - multipart, не разбираются)
+                form = headers.get('content-type', '').startswith('application/x-www-form-urlencoded')
+                params = dict(parse_qsl(body.decode())) if form else {}
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                payload = json.dumps({'ok': True, 'result': self._result(path.rsplit('/', 1)[-1], params)})
+                data = payload.encode()
+                writer.write(
+                    f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _post_updates(port, path, secret, updates, connections):
+    """Отправляет обновления в webhook по connections соединениям, как Telegram:
+    на 503 - повтор с паузой. Возвращает (статусы, число повторов)"""
+    statuses = []
+    retries = 0
+
+    async def request(reader, writer, update):
+        body = json.dumps(update).encode()
+        writer.write(
+            f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+            f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+        status = HTTPStatus(int((await reader.readline()).split()[1]))
+        while (await reader.readline()) not in (b'\r\n', b''):
+            pass
+        await reader.readexactly(len(status.phrase))
+        return status
+
+    async def worker(chunk):
+        nonlocal retries
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for update in chunk:
+            status = await request(reader, writer, update)
+            while status == HTTPStatus.SERVICE_UNAVAILABLE:
+                retries += 1
+                await asyncio.sleep(0.05)
+                status = await request(reader, writer, update)
+            statuses.append(status)
+        writer.close()
+
+    await asyncio.gather(*(worker(updates[i::connections]) for i in range(connections)))
+    return statuses, retries
+
+
+async def benchmark(n_updates, n_chats, connections, handler_delay):
+    """Эхо-бот на фейковом Bot API: пропускная способность и порядок сообщений в чатах"""
+    import time
+
+    from telegram.ext import ApplicationBuilder, MessageHandler, filters
+
+    api = FakeBotApi()
+    api_server = await api.start()
+
+    async def echo(update, context):
+        await asyncio.sleep(handler_delay)
+        await context.bot.send_message(update.effective_chat.id, update.message.text)
+
+    # Порядок, в котором сервер принял обновления каждого чата
+    accepted = defaultdict(list)
+
+    class RecordingQueue(asyncio.Queue):
+        def put_nowait(self, item):
+            super().put_nowait(item)
+            if isinstance(item, Update):
+                accepted[item.effective_chat.id].append(item.message.text)
+
+    app = (ApplicationBuilder().token('1:fake').base_url(api.base_url)
+           .update_queue(RecordingQueue(Config.UPDATE_QUEUE_SIZE))
+           .concurrent_updates(ChatOrderedUpdateProcessor(Config.CONCURRENT_UPDATES))
+           .build())
+    app.add_handler(MessageHandler(filters.TEXT, echo))
+
+    stop = asyncio.Event()
+    secret = 'bench-secret'
+    server = WebhookServer(app, '/hook', secret, '127.0.0.1', 0)
+    task = asyncio.create_task(serve_webhook(app, 'http://127.0.0.1/hook', server, stop))
+    while not app.running:
+        await asyncio.sleep(0.01)
+    port = server.port
+
+    updates = [{
+        'update_id': i,
+        'message': {'message_id': i, 'date': 0, 'text': str(i),
+                    'chat': {'id': 1000 + i % n_chats, 'type': 'private'},
+                    'from': {'id': 1000 + i % n_chats, 'is_bot': False, 'first_name': 'U'}},
+    } for i in range(n_updates)]
+
+    began = time.perf_counter()
+    statuses, retries = await _post_updates(port, '/hook', secret, updates, connections)
+    while sum(len(v) for v in api.sent.values()) < statuses.count(HTTPStatus.OK):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - began
+
+    ordered = all(api.sent[chat] == texts for chat, texts in accepted.items())
+    forbidden = (await _post_updates(port, '/hook', 'wrong', updates[:1], 1))[0][0]
+    print(f"{n_updates} обновлений, {n_chats} чатов: {elapsed:.2f} с "
+          f"({n_updates / elapsed:.0f} в секунду), принято {statuses.count(HTTPStatus.OK)}, "
+          f"повторов после 503: {retries}")
+    print(f"Порядок в чатах сохранен: {ordered}; неверный секрет -> {forbidden.value}; "
+          f"allowed_updates={api.webhook.get('allowed_updates')}")
+    print(f"Сервер: {server.stats()}")
+
+    stop.set()
+    await task
+    api_server.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Webhook-сервер")
+    commands = parser.add_subparsers(dest='command', required=True)
+    bench_cmd = commands.add_parser('bench', help="прогон против фейкового Bot API")
+    bench_cmd.add_argument('--updates', type=int, default=5000)
+    bench_cmd.add_argument('--chats', type=int, default=500)
+    bench_cmd.add_argument('--connections', type=int, default=40)
+    bench_cmd.add_argument('--delay', type=float, default=0.01, help="время обработчика (с)")
+
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.updates, args.chats, args.connections, args.delay))